@@ -1,12 +1,12 @@
 from urllib.parse import parse_qs
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.db import close_old_connections
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.conf import settings
+from rest_framework_simplejwt.exceptions import ExpiredTokenError, TokenError
 from channels.db import database_sync_to_async
-import jwt
+
+from users.services.user_snapshot import get_user_snapshot
 
 
 class JwtAuthMiddleware:
@@ -52,18 +52,19 @@ class JwtAuthMiddlewareInstance:
             return AnonymousUser(), "no_token"
 
         try:
-            # Valida il token con SimpleJWT
-            UntypedToken(token)
-            decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded.get("user_id")
-            if user_id is None:
-                return AnonymousUser(), "invalid_token"
-
-            user = await database_sync_to_async(get_user_model().objects.get)(id=user_id)
-            return user, None
-        except jwt.ExpiredSignatureError:
+            # Valida firma e scadenza una sola volta con SimpleJWT
+            validated = UntypedToken(token)
+        except ExpiredTokenError:
             return AnonymousUser(), "token_expired"
-        except (InvalidToken, TokenError, jwt.DecodeError):
+        except TokenError:
             return AnonymousUser(), "invalid_token"
-        except get_user_model().DoesNotExist:
-            return AnonymousUser(), "user_not_found"
\ No newline at end of file
+
+        user_id = validated.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return AnonymousUser(), "invalid_token"
+
+        # Snapshot in cache: le riconnessioni in massa non interrogano il database
+        user = await database_sync_to_async(get_user_snapshot)(user_id)
+        if user is None or not user.is_active:
+            return AnonymousUser(), "user_not_found"
+        return user, None
\ No newline at end of file
@@ -44,6 +44,8 @@ MIDDLEWARE = [
 CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=DEBUG, cast=bool)
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='', cast=Csv())
 CORS_ALLOW_CREDENTIALS = config('CORS_ALLOW_CREDENTIALS', default=True, cast=bool)
+# Header di paginazione della cronologia messaggi, leggibile dai client cross-origin
+CORS_EXPOSE_HEADERS = ['X-Has-More']
 
 # CSRF
 CSRF_TRUSTED_ORIGINS = config('CSRF_TRUSTED_ORIGINS', default='', cast=Csv())
@@ -97,6 +99,41 @@ else:
         }
     }
 
+# Chat realtime: massimo numero di group_send concorrenti nel fan-out unread.update
+CHAT_FANOUT_CONCURRENCY = config('CHAT_FANOUT_CONCURRENCY', default=50, cast=int)
+
+# Presenza online condivisa tra i worker: 'redis' in produzione, 'cache' (LocMem) in locale
+_redis_configured = bool(REDIS_URL or config('REDIS_HOST', default=None))
+CHAT_PRESENCE_BACKEND = config('CHAT_PRESENCE_BACKEND', default='redis' if _redis_configured else 'cache')
+CHAT_PRESENCE_REDIS_URL = config(
+    'CHAT_PRESENCE_REDIS_URL',
+    default=REDIS_URL if REDIS_URL else f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
+)
+# TTL (secondi) del contatore connessioni, rinnovato dall'heartbeat di ogni socket
+CHAT_PRESENCE_TTL = config('CHAT_PRESENCE_TTL', default=60, cast=int)
+
+# Cache Django condivisa tra i worker e persistente ai riavvii (snapshot utente,
+# circuit breaker delle traduzioni): 'redis' in produzione, 'locmem' in locale
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis' if _redis_configured else 'locmem')
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default=CHAT_PRESENCE_REDIS_URL)
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Conservazione: i messaggi più vecchi di N giorni sono spostati in archivio (manage.py archive_messages)
+CHAT_ARCHIVE_AFTER_DAYS = config('CHAT_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
 # =============================================================================
 # Database Configuration
 
@@ -154,6 +191,9 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': False,
 }
 
+# Secondi di validità dello snapshot utente usato per autenticare i WebSocket
+USER_SNAPSHOT_CACHE_TTL = config('USER_SNAPSHOT_CACHE_TTL', default=30, cast=int)
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -303,6 +343,23 @@ GOOGLE_TRANSLATE_API_URL = config(
     default='https://translation.googleapis.com/language/translate/v2',
 )
 TRANSLATION_HTTP_TIMEOUT = config('TRANSLATION_HTTP_TIMEOUT', default=10, cast=int)
+# Connessioni keep-alive verso ciascun provider e retry (solo errori di connessione e 5xx)
+TRANSLATION_HTTP_POOL_SIZE = config('TRANSLATION_HTTP_POOL_SIZE', default=10, cast=int)
+TRANSLATION_HTTP_RETRIES = config('TRANSLATION_HTTP_RETRIES', default=2, cast=int)
+TRANSLATION_HTTP_BACKOFF = config('TRANSLATION_HTTP_BACKOFF', default=0.3, cast=float)
+# Job del pool asincrono che chiamano i provider contemporaneamente, per processo (le richieste sincrone non sono limitate)
+TRANSLATION_PROVIDER_CONCURRENCY = config('TRANSLATION_PROVIDER_CONCURRENCY', default=4, cast=int)
+# Thread del pool per le traduzioni asincrone (mode=async); 0 = esecuzione immediata dopo il commit
+TRANSLATION_JOB_WORKERS = config('TRANSLATION_JOB_WORKERS', default=4, cast=int)
+# Voci della memoria di traduzione tenute in memoria da ogni processo (LRU davanti a TranslationMemo)
+TRANSLATION_MEMO_LRU_SIZE = config('TRANSLATION_MEMO_LRU_SIZE', default=2048, cast=int)
+# Circuit breaker dei provider: stato nella cache indicata (condivisa tra i worker se la cache lo è)
+TRANSLATION_BREAKER_CACHE = config('TRANSLATION_BREAKER_CACHE', default='default')
+TRANSLATION_BREAKER_FAILURES = config('TRANSLATION_BREAKER_FAILURES', default=5, cast=int)
+TRANSLATION_BREAKER_RESET_SECONDS = config('TRANSLATION_BREAKER_RESET_SECONDS', default=30, cast=int)
+# Provider con latenza media (EWMA) oltre questa soglia provati per ultimi
+TRANSLATION_BREAKER_SLOW_MS = config('TRANSLATION_BREAKER_SLOW_MS', default=3000, cast=int)
+TRANSLATION_BREAKER_EWMA_ALPHA = config('TRANSLATION_BREAKER_EWMA_ALPHA', default=0.2, cast=float)
 
 LOGGING = {
     'version': 1,
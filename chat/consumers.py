@@ -1,12 +1,191 @@
+import asyncio
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
-from django.utils import timezone
-from .models import Chat, Message, ChatParticipant
-from .services.presence import mark_user_connected, mark_user_disconnected
+from .models import Chat, ChatParticipant
+from .serializers import MessageTranslationSerializer
+from .services.messages import (
+    HISTORY_PAGE_SIZE,
+    message_history_payload,
+    parse_chat_id,
+    parse_client_msg_id,
+    parse_history_cursor,
+    send_message,
+)
+from .services.json_codec import dumps, loads, raw_frame
+from .services.message_translations import (
+    load_message_translations,
+    parse_message_ids,
+    save_message_translations,
+)
+from .services.presence import (
+    mark_user_connected,
+    mark_user_disconnected,
+    presence_heartbeat_interval,
+    touch_user_presence,
+)
+from .services.realtime import (
+    MEMBERSHIP_ADDED,
+    chat_message_event,
+    event_message_json,
+    group_add_many,
+    group_discard_many,
+    send_unread_updates,
+)
+from .services.translation import (
+    TranslationProviderError,
+    TranslationServiceNotConfigured,
+    normalize_language_code,
+    supported_languages,
+    translate_texts,
+)
+from .services.unread import get_unread_counts_for_user, mark_chat_read
+
+
+def translation_ready_frame(event):
+    """Frame translation_ready inviato al client per un evento translation.ready."""
+    return {"type": "translation_ready", **{key: value for key, value in event.items() if key != "type"}}
+
+
+def parse_history_fetch(content):
+    """Estrae (before_id, after_id, limit) da un frame history.fetch; ValueError se non validi."""
+    return (
+        parse_history_cursor(content.get("before_id")),
+        parse_history_cursor(content.get("after_id")),
+        int(content.get("limit") or HISTORY_PAGE_SIZE),
+    )
+
+
+# Modalità batch negoziata alla connessione (?batch=50ms): limiti sull'intervallo
+# e numero massimo di eventi in un frame prima di un flush anticipato
+BATCH_MIN_INTERVAL_MS = 10
+BATCH_MAX_INTERVAL_MS = 1000
+BATCH_MAX_EVENTS = 200
+
+
+def parse_batch_interval(query_string):
+    """
+    Legge ?batch=<n>ms (o ?batch=<n>) dalla query string e restituisce
+    l'intervallo in millisecondi, limitato a [BATCH_MIN, BATCH_MAX]; None se assente o non valido.
+    """
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode()
+    value = parse_qs(query_string).get("batch", [""])[0].strip().lower()
+    if value.endswith("ms"):
+        value = value[:-2]
+    try:
+        interval = int(value)
+    except ValueError:
+        return None
+    if interval <= 0:
+        return None
+    return max(BATCH_MIN_INTERVAL_MS, min(interval, BATCH_MAX_INTERVAL_MS))
+
+
+def coalesce_events(events):
+    """
+    Di più unread_update per la stessa chat nello stesso batch resta solo l'ultimo
+    (nella posizione dell'ultimo); gli altri eventi restano invariati e in ordine.
+    """
+    last_unread = {
+        event["chat_id"]: index
+        for index, event in enumerate(events)
+        if event.get("type") == "unread_update"
+    }
+    return [
+        event
+        for index, event in enumerate(events)
+        if event.get("type") != "unread_update" or last_unread[event["chat_id"]] == index
+    ]
+
+
+class JsonCodecMixin:
+    """Codifica e decodifica i frame con services.json_codec (orjson se installato)."""
+
+    @classmethod
+    async def decode_json(cls, text_data):
+        return loads(text_data)
+
+    @classmethod
+    async def encode_json(cls, content):
+        return dumps(content)
 
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+class BatchingMixin:
+    """
+    Accoda gli eventi broadcast e li invia come un unico frame
+    { type: "batch", events: [...] } per tick, se il client lo ha richiesto.
+    Senza ?batch ogni evento viene inviato subito come frame singolo.
+    Gli eventi arrivano già serializzati e vengono concatenati senza ricodificarli.
+    """
+
+    def configure_batching(self):
+        self.batch_interval_ms = parse_batch_interval(self.scope.get("query_string", b""))
+        self.batch_buffer = []
+        self.batch_flush_task = None
+
+    async def send_event(self, event_type, chat_id, text):
+        if not getattr(self, "batch_interval_ms", None):
+            await self.send(text_data=text)
+            return
+
+        self.batch_buffer.append({"type": event_type, "chat_id": chat_id, "text": text})
+        if len(self.batch_buffer) >= BATCH_MAX_EVENTS:
+            await self.flush_events()
+        elif self.batch_flush_task is None:
+            self.batch_flush_task = asyncio.create_task(self._flush_after_interval())
+
+    async def flush_events(self):
+        if not self.batch_buffer:
+            return
+        events, self.batch_buffer = coalesce_events(self.batch_buffer), []
+        texts = ",".join(event["text"] for event in events)
+        await self.send(text_data=raw_frame({"type": "batch"}, events=f"[{texts}]"))
+
+    async def _flush_after_interval(self):
+        await asyncio.sleep(self.batch_interval_ms / 1000)
+        self.batch_flush_task = None
+        await self.flush_events()
+
+    def stop_batching(self):
+        task = getattr(self, "batch_flush_task", None)
+        if task is not None:
+            task.cancel()
+            self.batch_flush_task = None
+
+
+class PresenceMixin:
+    """
+    Registra la presenza dell'utente e ne rinnova il TTL finché il socket resta aperto.
+    Le chiamate al backend (round-trip Redis) girano fuori dal thread condiviso degli
+    accessi al database: heartbeat e riconnessioni non si accodano alle query.
+    """
+
+    async def register_presence(self, user_id):
+        self.presence_user_id = user_id
+        self.presence_registered = True
+        await sync_to_async(mark_user_connected, thread_sensitive=False)(user_id)
+        self.presence_task = asyncio.create_task(self._presence_heartbeat(user_id))
+
+    async def unregister_presence(self):
+        task = getattr(self, "presence_task", None)
+        if task is not None:
+            task.cancel()
+            self.presence_task = None
+        if getattr(self, 'presence_registered', False):
+            await sync_to_async(mark_user_disconnected, thread_sensitive=False)(self.presence_user_id)
+            self.presence_registered = False
+
+    async def _presence_heartbeat(self, user_id):
+        interval = presence_heartbeat_interval()
+        while True:
+            await asyncio.sleep(interval)
+            await sync_to_async(touch_user_presence, thread_sensitive=False)(user_id)
+
+
+class ChatConsumer(JsonCodecMixin, PresenceMixin, AsyncJsonWebsocketConsumer):
     """Legacy per-chat WebSocket consumer (mantenuto per compatibilità)."""
 
     async def connect(self):
@@ -32,46 +211,52 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
-        self.presence_registered = True
-        await sync_to_async(mark_user_connected)(user.id)
+        await self.register_presence(user.id)
 
         history = await self._get_message_history()
-        await self.send_json({"type": "history", "data": history})
+        await self.send_json({"type": "history", **history})
 
     async def disconnect(self, code):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
-        if getattr(self, 'presence_registered', False):
-            await sync_to_async(mark_user_disconnected)(self.scope['user'].id)
-            self.presence_registered = False
+        await self.unregister_presence()
 
     async def receive_json(self, content):
         if content.get("type") == "message.send":
-            sender_id = self.scope["user"].id
-            msg = await self._create_message(sender_id, content.get("body", ""))
+            try:
+                client_msg_id = parse_client_msg_id(content.get("client_msg_id"))
+            except ValueError:
+                await self.send_json({"type": "error", "message": "client_msg_id non valido"})
+                return
+            sent = await self._send_message(self.scope["user"].id, content.get("body", ""), client_msg_id)
+            if sent is None:
+                return
+            if not sent.created:
+                # Reinvio: conferma solo al mittente, senza ripetere il broadcast
+                await self.send_json({"type": "message", "data": sent.payload})
+                return
             await self.channel_layer.group_send(
-                self.group_name, {"type": "chat.message", "message": msg, "chat_id": str(self.chat_id)}
+                self.group_name, chat_message_event(self.chat_id, sent.payload)
             )
-            participant_ids = await self._get_other_participant_ids(sender_id)
-            for uid in participant_ids:
-                unread = await self._get_unread_count_for_user(uid)
-                await self.channel_layer.group_send(
-                    f"user_{uid}",
-                    {
-                        "type": "unread.update",
-                        "chat_id": str(self.chat_id),
-                        "chat_type": await self._get_chat_type(),
-                        "unread_count": unread,
-                    },
-                )
+            await send_unread_updates(
+                self.channel_layer, self.chat_id, sent.chat_type, sent.recipient_unread_counts
+            )
+        elif content.get("type") == "history.fetch":
+            try:
+                before_id, after_id, limit = parse_history_fetch(content)
+            except (TypeError, ValueError):
+                await self.send_json({"type": "error", "message": "before_id, after_id e limit devono essere interi"})
+                return
+            history = await self._get_message_history(before_id, after_id, limit)
+            await self.send_json({"type": "history", "before_id": before_id, "after_id": after_id, **history})
 
     async def chat_message(self, event):
         """Handles chat.message from channel layer (unified event name)."""
-        await self.send_json({"type": "message", "data": event["message"]})
+        await self.send(text_data=raw_frame({"type": "message"}, data=event_message_json(event)))
 
     # Legacy handler for backward compatibility
     async def message_created(self, event):
-        await self.send_json({"type": "message", "data": event["message"]})
+        await self.send(text_data=raw_frame({"type": "message"}, data=event_message_json(event)))
 
     @database_sync_to_async
     def _is_participant(self, user_id):
@@ -82,63 +267,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return False
 
     @database_sync_to_async
-    def _get_message_history(self, limit=50):
-        messages = Message.objects.filter(chat_id=self.chat_id).order_by('-created_at')[:limit]
-        return [
-            {
-                "id": msg.id,
-                "sender_id": msg.sender_id,
-                "body": msg.body,
-                "created_at": msg.created_at.isoformat(),
-                "client_msg_id": str(msg.client_msg_id),
-            }
-            for msg in messages
-        ]
+    def _get_message_history(self, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+        return message_history_payload(self.chat_id, before_id, after_id, limit)
 
     @database_sync_to_async
-    def _create_message(self, user_id, body):
-        msg = Message.objects.create(chat_id=self.chat_id, sender_id=user_id, body=body)
-        return {
-            "id": msg.id,
-            "sender_id": user_id,
-            "body": msg.body,
-            "created_at": msg.created_at.isoformat(),
-            "client_msg_id": str(msg.client_msg_id),
-        }
+    def _send_message(self, user_id, body, client_msg_id=None):
+        return send_message(self.chat_id, user_id, body, client_msg_id)
 
-    @database_sync_to_async
-    def _get_other_participant_ids(self, sender_id):
-        return list(
-            ChatParticipant.objects.filter(chat_id=self.chat_id)
-            .exclude(user_id=sender_id)
-            .values_list("user_id", flat=True)
-        )
-
-    @database_sync_to_async
-    def _get_chat_type(self):
-        try:
-            return Chat.objects.get(id=self.chat_id).chat_type
-        except Chat.DoesNotExist:
-            return ""
 
-    @database_sync_to_async
-    def _get_unread_count_for_user(self, user_id):
-        part = (
-            ChatParticipant.objects.filter(chat_id=self.chat_id, user_id=user_id)
-            .only("last_read_at", "joined_at")
-            .first()
-        )
-        if not part:
-            return 0
-        last_read = part.last_read_at or part.joined_at
-        return (
-            Message.objects.filter(chat_id=self.chat_id, created_at__gt=last_read)
-            .exclude(sender_id=user_id)
-            .count()
-        )
-
-
-class NotificationConsumer(AsyncJsonWebsocketConsumer):
+class NotificationConsumer(JsonCodecMixin, PresenceMixin, AsyncJsonWebsocketConsumer):
     """
     Legacy canale per-utente (mantenuto per compatibilità).
     Il nuovo frontend usa GlobalChatConsumer.
@@ -160,15 +297,12 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         self.user_group = f"user_{user.id}"
         await self.channel_layer.group_add(self.user_group, self.channel_name)
         await self.accept()
-        self.presence_registered = True
-        await sync_to_async(mark_user_connected)(user.id)
+        await self.register_presence(user.id)
 
     async def disconnect(self, code):
         if hasattr(self, "user_group"):
             await self.channel_layer.group_discard(self.user_group, self.channel_name)
-        if getattr(self, 'presence_registered', False):
-            await sync_to_async(mark_user_disconnected)(self.scope['user'].id)
-            self.presence_registered = False
+        await self.unregister_presence()
 
     async def unread_update(self, event):
         """Inoltra l'evento di aggiornamento non-letti al client."""
@@ -181,24 +315,37 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
             }
         )
 
+    async def chat_membership(self, event):
+        """Gli eventi di appartenenza servono solo a GlobalChatConsumer."""
+
+    async def translation_ready(self, event):
+        """Esito di una traduzione asincrona richiesta dall'utente."""
+        await self.send_json(translation_ready_frame(event))
 
-class GlobalChatConsumer(AsyncJsonWebsocketConsumer):
+
+class GlobalChatConsumer(JsonCodecMixin, BatchingMixin, PresenceMixin, AsyncJsonWebsocketConsumer):
     """
     WebSocket globale per utente (stile WhatsApp).
     Una singola connessione riceve messaggi da TUTTE le chat dell'utente
     e gestisce l'invio messaggi, mark-read, e aggiornamenti unread in tempo reale.
     
-    Endpoint: ws/global/
+    Endpoint: ws/global/  (opzionale ?batch=50ms: eventi broadcast raggruppati per tick)
     
     Messaggi in ingresso dal client:
-        - { type: "message.send", chat_id: "...", body: "..." }
+        - { type: "message.send", chat_id: "...", body: "...", client_msg_id?: "<uuid>" }
         - { type: "mark_read", chat_id: "..." }
         - { type: "chat.join", chat_id: "..." }
+        - { type: "history.fetch", chat_id: "...", before_id?: N, after_id?: N, limit?: N }
+        - { type: "translate.batch", chat_id: "...", message_ids: [N, ...], target_language: "en" }
     
     Messaggi in uscita verso il client:
         - { type: "init", data: { unread_counts: { chat_id: { unread_count, chat_type } } } }
         - { type: "new_message", chat_id: "...", data: { id, sender_id, body, created_at, client_msg_id } }
         - { type: "unread_update", chat_id: "...", chat_type: "...", unread_count: N }
+        - { type: "history", chat_id: "...", before_id, after_id, data: [...], has_more: bool }
+        - { type: "translations", chat_id: "...", target_language: "en", data: [...] }
+        - { type: "translation_ready", job_id: "...", kind, object_id, status, data, error }
+        - { type: "batch", events: [ new_message | unread_update, ... ] }  (solo con ?batch)
         - { type: "error", message: "..." }
     """
 
@@ -220,47 +367,63 @@ class GlobalChatConsumer(AsyncJsonWebsocketConsumer):
         self.user = user
         self.user_group = f"user_{user.id}"
         self.chat_groups = set()
+        # Cache di appartenenza { chat_id: chat_type }, aggiornata dagli eventi chat.membership
+        self.memberships = {}
+        self.configure_batching()
 
-        # Entra nel gruppo notifiche personale
+        # Entra nel gruppo notifiche personale prima di leggere le appartenenze,
+        # così nessun evento chat.membership va perso nel frattempo
         await self.channel_layer.group_add(self.user_group, self.channel_name)
 
-        # Entra in tutti i gruppi chat dell'utente
-        chat_ids = await self._get_user_chat_ids()
-        for chat_id in chat_ids:
-            group_name = f"chat_{chat_id}"
-            self.chat_groups.add(group_name)
-            await self.channel_layer.group_add(group_name, self.channel_name)
+        # Entra in tutti i gruppi chat dell'utente, con le group_add in parallelo:
+        # il tempo di connessione non cresce col numero di chat
+        self.memberships = await self._get_user_memberships()
+        self.chat_groups = {f"chat_{chat_id}" for chat_id in self.memberships}
+        await group_add_many(self.channel_layer, self.chat_groups, self.channel_name)
 
         await self.accept()
-        self.presence_registered = True
-        await sync_to_async(mark_user_connected)(user.id)
+        await self.register_presence(user.id)
 
         # Invia i conteggi non-letti iniziali
         unread_counts = await self._get_all_unread_counts()
+        init_data = {"unread_counts": unread_counts}
+        if self.batch_interval_ms:
+            init_data["batch_ms"] = self.batch_interval_ms
         await self.send_json({
             "type": "init",
-            "data": {"unread_counts": unread_counts},
+            "data": init_data,
         })
 
     async def disconnect(self, code):
+        groups = [*getattr(self, "chat_groups", ())]
         if hasattr(self, "user_group"):
-            await self.channel_layer.group_discard(self.user_group, self.channel_name)
-        if hasattr(self, "chat_groups"):
-            for group_name in self.chat_groups:
-                await self.channel_layer.group_discard(group_name, self.channel_name)
-        if getattr(self, 'presence_registered', False):
-            await sync_to_async(mark_user_disconnected)(self.scope['user'].id)
-            self.presence_registered = False
+            groups.append(self.user_group)
+        await group_discard_many(self.channel_layer, groups, self.channel_name)
+        self.stop_batching()
+        await self.unregister_presence()
 
     async def receive_json(self, content):
         msg_type = content.get("type")
 
+        # Un solo formato per chat_id: la cache di appartenenza e i gruppi usano
+        # l'UUID canonico, come gli eventi chat.membership che la aggiornano
+        if content.get("chat_id"):
+            try:
+                content["chat_id"] = parse_chat_id(content["chat_id"])
+            except ValueError:
+                await self.send_json({"type": "error", "message": "chat_id non valido"})
+                return
+
         if msg_type == "message.send":
             await self._handle_send_message(content)
         elif msg_type == "mark_read":
             await self._handle_mark_read(content)
         elif msg_type == "chat.join":
             await self._handle_chat_join(content)
+        elif msg_type == "history.fetch":
+            await self._handle_history_fetch(content)
+        elif msg_type == "translate.batch":
+            await self._handle_translate_batch(content)
 
     # ── Handlers per i messaggi dal client ────────────────────
 
@@ -272,37 +435,36 @@ class GlobalChatConsumer(AsyncJsonWebsocketConsumer):
             await self.send_json({"type": "error", "message": "chat_id e body sono obbligatori"})
             return
 
+        try:
+            client_msg_id = parse_client_msg_id(content.get("client_msg_id"))
+        except ValueError:
+            await self.send_json({"type": "error", "message": "client_msg_id non valido"})
+            return
+
         if not await self._is_participant(chat_id):
             await self.send_json({"type": "error", "message": "Non sei partecipante di questa chat"})
             return
 
-        # Crea il messaggio nel database
-        msg = await self._create_message(chat_id, self.user.id, body)
+        # Crea il messaggio (ricontrollando la partecipazione) e legge i destinatari in un solo hop
+        sent = await self._send_message(chat_id, self.user.id, body, client_msg_id)
+        if sent is None:
+            self.memberships.pop(chat_id, None)
+            await self.send_json({"type": "error", "message": "Non sei partecipante di questa chat"})
+            return
 
-        # Broadcast a tutti i consumer connessi alla chat
-        await self.channel_layer.group_send(
-            f"chat_{chat_id}",
-            {
-                "type": "chat.message",
-                "message": msg,
-                "chat_id": str(chat_id),
-            },
-        )
+        if not sent.created:
+            # Reinvio dopo una riconnessione: il messaggio è già stato consegnato,
+            # si conferma solo al mittente senza ripetere broadcast e unread.update
+            await self.send_json({"type": "new_message", "chat_id": str(chat_id), "data": sent.payload})
+            return
+
+        # Broadcast a tutti i consumer connessi alla chat (payload serializzato una volta sola)
+        await self.channel_layer.group_send(f"chat_{chat_id}", chat_message_event(chat_id, sent.payload))
 
         # Invia aggiornamenti unread a tutti gli altri partecipanti
-        participant_ids = await self._get_other_participant_ids(chat_id, self.user.id)
-        chat_type = await self._get_chat_type(chat_id)
-        for uid in participant_ids:
-            unread = await self._get_unread_count_for_user(chat_id, uid)
-            await self.channel_layer.group_send(
-                f"user_{uid}",
-                {
-                    "type": "unread.update",
-                    "chat_id": str(chat_id),
-                    "chat_type": chat_type,
-                    "unread_count": unread,
-                },
-            )
+        await send_unread_updates(
+            self.channel_layer, chat_id, sent.chat_type, sent.recipient_unread_counts
+        )
 
     async def _handle_mark_read(self, content):
         chat_id = content.get("chat_id")
@@ -313,12 +475,16 @@ class GlobalChatConsumer(AsyncJsonWebsocketConsumer):
             return
 
         await self._mark_read(chat_id)
-        await self.send_json({
+        # Stessa coda degli unread_update broadcast: in modalità batch coalesce_events
+        # tiene solo l'ultimo valore, così un conteggio vecchio ancora in coda non
+        # arriva al client dopo lo zero
+        text = dumps({
             "type": "unread_update",
-            "chat_id": str(chat_id),
-            "chat_type": await self._get_chat_type(chat_id),
+            "chat_id": chat_id,
+            "chat_type": self.memberships[chat_id],
             "unread_count": 0,
         })
+        await self.send_event("unread_update", chat_id, text)
 
     async def _handle_chat_join(self, content):
         """Aggiunge il consumer al gruppo di una nuova chat."""
@@ -327,111 +493,186 @@ class GlobalChatConsumer(AsyncJsonWebsocketConsumer):
             return
 
         if await self._is_participant(chat_id):
-            group_name = f"chat_{chat_id}"
-            if group_name not in self.chat_groups:
-                self.chat_groups.add(group_name)
-                await self.channel_layer.group_add(group_name, self.channel_name)
+            await self._join_chat_group(chat_id)
+
+    async def _handle_history_fetch(self, content):
+        """Pagina di cronologia con cursori before_id/after_id (stessa semantica della REST)."""
+        chat_id = content.get("chat_id")
+        if not chat_id:
+            await self.send_json({"type": "error", "message": "chat_id è obbligatorio"})
+            return
+
+        try:
+            before_id, after_id, limit = parse_history_fetch(content)
+        except (TypeError, ValueError):
+            await self.send_json({"type": "error", "message": "before_id, after_id e limit devono essere interi"})
+            return
+
+        if not await self._is_participant(chat_id):
+            await self.send_json({"type": "error", "message": "Non sei partecipante di questa chat"})
+            return
+
+        history = await self._get_message_history(chat_id, before_id, after_id, limit)
+        await self.send_json({
+            "type": "history",
+            "chat_id": str(chat_id),
+            "before_id": before_id,
+            "after_id": after_id,
+            **history,
+        })
+
+    async def _handle_translate_batch(self, content):
+        """Traduzione di più messaggi di una chat (stessa semantica di POST messages/translate/)."""
+        chat_id = content.get("chat_id")
+        target_language = content.get("target_language")
+        if not chat_id or not target_language:
+            await self.send_json({"type": "error", "message": "chat_id e target_language sono obbligatori"})
+            return
+        if normalize_language_code(target_language) not in supported_languages():
+            await self.send_json({"type": "error", "message": "Lingua di destinazione non supportata"})
+            return
+        try:
+            message_ids = parse_message_ids(content.get("message_ids"))
+        except (TypeError, ValueError):
+            await self.send_json({"type": "error", "message": "message_ids non valido"})
+            return
+
+        if not await self._is_participant(chat_id):
+            await self.send_json({"type": "error", "message": "Non sei partecipante di questa chat"})
+            return
+
+        try:
+            data = await self._translate_messages(chat_id, message_ids, target_language)
+        except TranslationServiceNotConfigured:
+            await self.send_json({"type": "error", "message": "Nessun provider di traduzione configurato"})
+            return
+        except TranslationProviderError as exc:
+            await self.send_json({"type": "error", "message": str(exc)})
+            return
+
+        await self.send_json({
+            "type": "translations",
+            "chat_id": str(chat_id),
+            "target_language": normalize_language_code(target_language),
+            "data": data,
+        })
+
+    # ── Cache di appartenenza ─────────────────────────────────
+
+    async def _is_participant(self, chat_id):
+        """
+        Autorizza i frame usando la cache in memoria; solo le chat non ancora
+        note (es. appena create) richiedono una verifica sul database.
+        """
+        chat_id = str(chat_id)
+        if chat_id in self.memberships:
+            return True
+
+        chat_type = await self._get_membership_chat_type(chat_id)
+        if chat_type is None:
+            return False
+        self.memberships[chat_id] = chat_type
+        return True
+
+    async def _join_chat_group(self, chat_id):
+        group_name = f"chat_{chat_id}"
+        if group_name not in self.chat_groups:
+            self.chat_groups.add(group_name)
+            await self.channel_layer.group_add(group_name, self.channel_name)
+
+    async def _leave_chat_group(self, chat_id):
+        group_name = f"chat_{chat_id}"
+        if group_name in self.chat_groups:
+            self.chat_groups.discard(group_name)
+            await self.channel_layer.group_discard(group_name, self.channel_name)
 
     # ── Event handlers (dal channel layer) ────────────────────
 
     async def chat_message(self, event):
         """Nuovo messaggio in una chat — inoltra al client."""
-        await self.send_json({
-            "type": "new_message",
-            "chat_id": event["chat_id"],
-            "data": event["message"],
-        })
+        chat_id = event["chat_id"]
+        text = raw_frame({"type": "new_message", "chat_id": chat_id}, data=event_message_json(event))
+        await self.send_event("new_message", chat_id, text)
 
     async def unread_update(self, event):
         """Aggiornamento conteggio non-letti — inoltra al client."""
-        await self.send_json({
+        chat_id = event["chat_id"]
+        text = dumps({
             "type": "unread_update",
-            "chat_id": event["chat_id"],
+            "chat_id": chat_id,
             "chat_type": event.get("chat_type", ""),
             "unread_count": event["unread_count"],
         })
+        await self.send_event("unread_update", chat_id, text)
+
+    async def chat_membership(self, event):
+        """L'utente è stato aggiunto o rimosso da una chat — aggiorna cache e gruppi."""
+        chat_id = event["chat_id"]
+        if event["action"] == MEMBERSHIP_ADDED:
+            self.memberships[chat_id] = event.get("chat_type", "")
+            await self._join_chat_group(chat_id)
+        else:
+            self.memberships.pop(chat_id, None)
+            await self._leave_chat_group(chat_id)
+
+    async def translation_ready(self, event):
+        """Esito di una traduzione asincrona richiesta dall'utente (mai raggruppato in batch)."""
+        await self.send_json(translation_ready_frame(event))
 
     # ── DB helpers ────────────────────────────────────────────
 
     @database_sync_to_async
-    def _get_user_chat_ids(self):
-        return list(
-            ChatParticipant.objects.filter(user_id=self.user.id)
-            .values_list("chat_id", flat=True)
-        )
+    def _get_user_memberships(self):
+        return {
+            str(chat_id): chat_type
+            for chat_id, chat_type in ChatParticipant.objects.filter(user_id=self.user.id)
+            .values_list("chat_id", "chat__chat_type")
+        }
 
     @database_sync_to_async
     def _get_all_unread_counts(self):
         """Restituisce { chat_id: { unread_count, chat_type } } per tutte le chat con messaggi non letti."""
-        participants = (
-            ChatParticipant.objects.filter(user_id=self.user.id)
-            .select_related("chat")
-        )
-        result = {}
-        for part in participants:
-            last_read = part.last_read_at or part.joined_at
-            count = (
-                Message.objects.filter(chat_id=part.chat_id, created_at__gt=last_read)
-                .exclude(sender_id=self.user.id)
-                .count()
-            )
-            if count > 0:
-                result[str(part.chat_id)] = {
-                    "unread_count": count,
-                    "chat_type": part.chat.chat_type,
-                }
-        return result
+        return get_unread_counts_for_user(self.user.id)
 
     @database_sync_to_async
-    def _is_participant(self, chat_id):
-        return ChatParticipant.objects.filter(
-            chat_id=chat_id, user_id=self.user.id
-        ).exists()
+    def _get_membership_chat_type(self, chat_id):
+        return (
+            ChatParticipant.objects.filter(chat_id=chat_id, user_id=self.user.id)
+            .values_list("chat__chat_type", flat=True)
+            .first()
+        )
 
     @database_sync_to_async
-    def _create_message(self, chat_id, user_id, body):
-        msg = Message.objects.create(chat_id=chat_id, sender_id=user_id, body=body)
-        return {
-            "id": msg.id,
-            "sender_id": user_id,
-            "body": msg.body,
-            "created_at": msg.created_at.isoformat(),
-            "client_msg_id": str(msg.client_msg_id),
-        }
+    def _send_message(self, chat_id, user_id, body, client_msg_id=None):
+        return send_message(chat_id, user_id, body, client_msg_id)
 
     @database_sync_to_async
-    def _get_other_participant_ids(self, chat_id, sender_id):
-        return list(
-            ChatParticipant.objects.filter(chat_id=chat_id)
-            .exclude(user_id=sender_id)
-            .values_list("user_id", flat=True)
-        )
+    def _get_message_history(self, chat_id, before_id, after_id, limit):
+        return message_history_payload(chat_id, before_id, after_id, limit, user_id=self.user.id)
+
+    async def _translate_messages(self, chat_id, message_ids, target_language):
+        """
+        Come translate_messages, ma solo letture e scritture passano dal thread
+        condiviso del database: la chiamata al provider (fino a TRANSLATION_HTTP_TIMEOUT
+        per provider) gira in un thread a parte e non blocca gli altri socket.
+        """
+        batch = await self._load_message_translations(chat_id, message_ids, target_language)
+        misses = batch.misses
+        translated = {}
+        if misses:
+            results = await sync_to_async(translate_texts, thread_sensitive=False)(misses, batch.language)
+            translated = dict(zip(misses, results))
+        return await self._save_message_translations(batch, translated)
 
     @database_sync_to_async
-    def _get_chat_type(self, chat_id):
-        try:
-            return Chat.objects.get(id=chat_id).chat_type
-        except Chat.DoesNotExist:
-            return ""
+    def _load_message_translations(self, chat_id, message_ids, target_language):
+        return load_message_translations(chat_id, self.user.id, message_ids, target_language)
 
     @database_sync_to_async
-    def _get_unread_count_for_user(self, chat_id, user_id):
-        part = (
-            ChatParticipant.objects.filter(chat_id=chat_id, user_id=user_id)
-            .only("last_read_at", "joined_at")
-            .first()
-        )
-        if not part:
-            return 0
-        last_read = part.last_read_at or part.joined_at
-        return (
-            Message.objects.filter(chat_id=chat_id, created_at__gt=last_read)
-            .exclude(sender_id=user_id)
-            .count()
-        )
+    def _save_message_translations(self, batch, translated):
+        translations = save_message_translations(batch, translated)
+        return MessageTranslationSerializer(translations, many=True).data
 
     @database_sync_to_async
     def _mark_read(self, chat_id):
-        ChatParticipant.objects.filter(
-            chat_id=chat_id, user_id=self.user.id
-        ).update(last_read_at=timezone.now())
\ No newline at end of file
+        mark_chat_read(chat_id, self.user.id)
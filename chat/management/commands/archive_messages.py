@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.services.archive import ARCHIVE_BATCH_SIZE, archivable_messages, archive_cutoff, archive_messages
+
+
+class Command(BaseCommand):
+    help = "Sposta nella tabella di archivio i messaggi più vecchi della soglia di conservazione"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+            help="Archivia i messaggi più vecchi di N giorni (default CHAT_ARCHIVE_AFTER_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help="Messaggi spostati per transazione.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Pausa in secondi tra un lotto e l'altro.",
+        )
+        parser.add_argument(
+            "--chat",
+            dest="chat_ids",
+            action="append",
+            help="Limita l'archiviazione a una chat (ripetibile).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Conta i messaggi da archiviare senza spostarli.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options["older_than_days"])
+        if options["dry_run"]:
+            count = archivable_messages(cutoff, options.get("chat_ids")).count()
+            self.stdout.write(f"{count} messaggi precedenti a {cutoff:%Y-%m-%d} da archiviare.")
+            return
+
+        archived = archive_messages(
+            cutoff,
+            batch_size=options["batch_size"],
+            chat_ids=options.get("chat_ids"),
+            sleep=options["sleep"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{archived} messaggi archiviati."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import ChatParticipant
+from chat.services.unread import rebuild_unread_counts
+
+
+class Command(BaseCommand):
+    help = "Ricalcola ChatParticipant.unread_count a partire da last_read_at"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chat",
+            dest="chat_ids",
+            action="append",
+            help="Limita il ricalcolo a una chat (ripetibile).",
+        )
+        parser.add_argument(
+            "--user",
+            dest="user_ids",
+            action="append",
+            type=int,
+            help="Limita il ricalcolo a un utente (ripetibile).",
+        )
+
+    def handle(self, *args, **options):
+        queryset = ChatParticipant.objects.all()
+        if options.get("chat_ids"):
+            queryset = queryset.filter(chat_id__in=options["chat_ids"])
+        if options.get("user_ids"):
+            queryset = queryset.filter(user_id__in=options["user_ids"])
+
+        updated = rebuild_unread_counts(queryset)
+        self.stdout.write(self.style.SUCCESS(f"Contatori non letti ricalcolati per {updated} partecipanti."))
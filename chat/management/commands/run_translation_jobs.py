@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import TranslationJob
+from chat.services.translation_jobs import run_translation_job
+
+
+class Command(BaseCommand):
+    help = "Esegue le traduzioni asincrone rimaste in sospeso (ad es. dopo un riavvio)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=10,
+            help="Rimette in coda i job avviati da più di N minuti e ancora 'in corso' (worker interrotto).",
+        )
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(minutes=options["stale_minutes"])
+        TranslationJob.objects.filter(
+            status=TranslationJob.STATUS_RUNNING, started_at__lt=stale_before
+        ).update(status=TranslationJob.STATUS_PENDING, started_at=None)
+
+        job_ids = list(
+            TranslationJob.objects.filter(status=TranslationJob.STATUS_PENDING)
+            .order_by("created_at")
+            .values_list("id", flat=True)
+        )
+        completed = sum(1 for job_id in job_ids if run_translation_job(job_id) is not None)
+        self.stdout.write(self.style.SUCCESS(f"{completed} traduzioni in sospeso eseguite."))
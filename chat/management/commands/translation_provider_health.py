@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.services.provider_health import METRICS, provider_health_snapshot, reset_provider_health
+
+
+class Command(BaseCommand):
+    help = "Mostra stato del circuit breaker, latenza media e contatori dei provider di traduzione"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Richiude i breaker e azzera latenza e contatori.",
+        )
+
+    def handle(self, *args, **options):
+        names = [name.strip().lower() for name in settings.TRANSLATION_PROVIDER_PRIORITY]
+        if options["reset"]:
+            reset_provider_health(names)
+            self.stdout.write(self.style.SUCCESS("Stato dei provider azzerato."))
+            return
+
+        for name, health in provider_health_snapshot(names).items():
+            latency = health["latency_ms"]
+            latency_label = f"{latency:.0f}ms" if latency is not None else "n/d"
+            counters = " ".join(f"{metric}={health[metric]}" for metric in METRICS)
+            self.stdout.write(
+                f"{name}: {health['state']} (errori consecutivi {health['consecutive_failures']}, latenza {latency_label}) {counters}"
+            )
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_count(apps, schema_editor):
+    ChatParticipant = apps.get_model('chat', 'ChatParticipant')
+    Message = apps.get_model('chat', 'Message')
+    unread = (
+        Message.objects.filter(
+            chat_id=OuterRef('chat_id'),
+            created_at__gt=Coalesce(OuterRef('last_read_at'), OuterRef('joined_at')),
+        )
+        .exclude(sender_id=OuterRef('user_id'))
+        .order_by()
+        .values('chat_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    ChatParticipant.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatparticipant_last_read_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:00
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_direct_keys(apps, schema_editor):
+    """
+    Assegna direct_key alle chat dirette esistenti con esattamente due partecipanti.
+    Se la stessa coppia ha più chat, la chiave va alla più vecchia; le altre restano
+    senza chiave (leggibili, ma non più restituite da get_or_create_direct_chat).
+    """
+    Chat = apps.get_model('chat', 'Chat')
+    ChatParticipant = apps.get_model('chat', 'ChatParticipant')
+
+    members = defaultdict(list)
+    rows = (
+        ChatParticipant.objects.filter(chat__chat_type='direct')
+        .order_by('chat__created_at', 'chat_id')
+        .values_list('chat_id', 'user_id')
+    )
+    for chat_id, user_id in rows.iterator():
+        members[chat_id].append(user_id)
+
+    seen = set()
+    to_update = []
+    for chat_id, user_ids in members.items():
+        if len(user_ids) != 2:
+            continue
+        low, high = sorted(user_ids)
+        key = f"{low}:{high}"
+        if key in seen:
+            continue
+        seen.add(key)
+        to_update.append(Chat(id=chat_id, direct_key=key))
+
+    Chat.objects.bulk_update(to_update, ['direct_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_client_msg_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='direct_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:34
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_message_translations(apps, schema_editor):
+    """
+    Popola la memoria di traduzione con le traduzioni dei messaggi già salvate,
+    così il riuso per testo identico continua a funzionare senza nuove chiamate.
+    """
+    MessageTranslation = apps.get_model('chat', 'MessageTranslation')
+    TranslationMemo = apps.get_model('chat', 'TranslationMemo')
+
+    batch = []
+    rows = MessageTranslation.objects.order_by('created_at').values_list(
+        'message__body', 'target_language', 'translated_text', 'provider', 'detected_source_language'
+    )
+    for body, target_language, translated_text, provider, detected in rows.iterator():
+        if not body or not body.strip():
+            continue
+        batch.append(TranslationMemo(
+            source_hash=hashlib.sha256(body.encode('utf-8')).hexdigest(),
+            target_language=target_language,
+            text_format='text',
+            translated_text=translated_text,
+            provider=provider,
+            detected_source_language=detected,
+        ))
+        if len(batch) >= 500:
+            TranslationMemo.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TranslationMemo.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_archivedmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemo',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('source_hash', models.CharField(max_length=64)),
+                ('target_language', models.CharField(max_length=10)),
+                ('text_format', models.CharField(default='text', max_length=10)),
+                ('translated_text', models.TextField()),
+                ('provider', models.CharField(choices=[('deepl', 'DeepL'), ('google', 'Google Cloud Translation')], max_length=20)),
+                ('detected_source_language', models.CharField(blank=True, max_length=10, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source_hash', 'target_language', 'text_format'), name='chat_translation_memo_unique_key')],
+            },
+        ),
+        migrations.RunPython(backfill_message_translations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_translationmemo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('message', 'Messaggio'), ('post', 'Post'), ('card', 'Card')], max_length=10)),
+                ('object_id', models.CharField(max_length=255)),
+                ('target_language', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'In attesa'), ('running', 'In corso'), ('done', 'Completato'), ('failed', 'Fallito')], default='pending', max_length=10)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='translation_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='chat_transl_status_54863a_idx')],
+            },
+        ),
+    ]
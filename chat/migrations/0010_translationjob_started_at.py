@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:16
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_started_at(apps, schema_editor):
+    # Job in corso al momento della migrazione: l'inizio più prudente noto è la creazione
+    TranslationJob = apps.get_model('chat', 'TranslationJob')
+    TranslationJob.objects.filter(status='running', started_at__isnull=True).update(started_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_translationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='translationjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_started_at, migrations.RunPython.noop),
+    ]
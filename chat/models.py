@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 import uuid
 
@@ -44,9 +44,24 @@ class Chat(models.Model):
     
     created_at = models.DateTimeField(default=timezone.now)
 
+    # Anteprima inbox denormalizzata (aggiornata in chat/signals.py alla creazione di un Message)
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    # Coppia ordinata di user id ("<min>:<max>") per le chat dirette: garantisce
+    # una sola chat per coppia e rende la ricerca un lookup sull'indice univoco
+    direct_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
     class Meta:
         indexes = [
             models.Index(fields=['chat_type', 'created_at']),
+            models.Index(fields=['last_message_at']),
         ]
 
     def __str__(self):
@@ -62,88 +77,88 @@ class Chat(models.Model):
         """Proprietà per mantenere compatibilità con codice esistente."""
         return self.chat_type in ['group', 'general_group']
 
+    @staticmethod
+    def make_direct_key(user_a_id, user_b_id):
+        """Chiave canonica della chat diretta tra due utenti, indipendente dall'ordine."""
+        low, high = sorted((int(user_a_id), int(user_b_id)))
+        return f"{low}:{high}"
+
     @staticmethod
     def get_or_create_direct_chat(user_a, user_b):
         """
         Restituisce la chat diretta esistente tra due utenti o la crea.
-        Una chat diretta è semplicemente una chat con esattamente 2 partecipanti.
+        La ricerca usa l'indice univoco su direct_key; se due richieste concorrenti
+        creano la stessa chat, la seconda recupera quella inserita dalla prima.
         """
-        from django.db.models import Count
-        
-        # Cerca una chat diretta esistente tra questi due utenti
-        existing_chat = Chat.objects.annotate(
-            participant_count=Count('participants')
-        ).filter(
-            chat_type='direct',
-            participant_count=2,
-            participants=user_a
-        ).filter(
-            participants=user_b
-        ).first()
-        
+        key = Chat.make_direct_key(user_a.pk, user_b.pk)
+
+        existing_chat = Chat.objects.filter(direct_key=key).first()
         if existing_chat:
             return existing_chat
-        
-        # Crea una nuova chat diretta
-        chat = Chat.objects.create(
-            chat_type='direct',
-            created_by=user_a
-        )
-        
-        # Aggiungi entrambi i partecipanti (nessuno è admin nelle chat dirette)
-        ChatParticipant.objects.create(chat=chat, user=user_a, role='member')
-        ChatParticipant.objects.create(chat=chat, user=user_b, role='member')
-        
+
+        try:
+            with transaction.atomic():
+                # Crea una nuova chat diretta
+                chat = Chat.objects.create(
+                    chat_type='direct',
+                    created_by=user_a,
+                    direct_key=key
+                )
+
+                # Aggiungi entrambi i partecipanti (nessuno è admin nelle chat dirette)
+                ChatParticipant.objects.bulk_create([
+                    ChatParticipant(chat=chat, user_id=user_id, role='member')
+                    for user_id in {user_a.pk, user_b.pk}
+                ])
+        except IntegrityError:
+            return Chat.objects.get(direct_key=key)
+
         return chat
 
     @staticmethod
     def create_group(name, creator, participant_ids=None, description=None, chat_type='group', club_ids=None):
-        """Crea una nuova chat di gruppo con più di 2 partecipanti."""
-        chat = Chat.objects.create(
-            chat_type=chat_type,
-            name=name,
-            description=description,
-            created_by=creator
-        )
-
-        if chat_type == 'gemellaggio' and club_ids:
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            clubs = User.objects.filter(id__in=club_ids, user_type='CLUB')
-            chat.related_clubs.set(clubs)
-            
-            # Note: The 'm2m_changed' signal on Chat.related_clubs (in signals.py)
-            # automatically adds all members of these clubs to the chat.
-        
-        # Aggiungi il creatore come admin
-        # Check if creator is already added (e.g. via club)
-        if not ChatParticipant.objects.filter(chat=chat, user=creator).exists():
-            ChatParticipant.objects.create(
-                chat=chat,
-                user=creator,
-                role='admin'
+        """
+        Crea una nuova chat di gruppo con più di 2 partecipanti.
+        Gli id vengono validati con una sola query e i partecipanti inseriti
+        con un unico bulk_create, tutto nella stessa transazione.
+        """
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+
+        with transaction.atomic():
+            chat = Chat.objects.create(
+                chat_type=chat_type,
+                name=name,
+                description=description,
+                created_by=creator
             )
-        else:
-            # Update role to admin if they were added as member
-            ChatParticipant.objects.filter(chat=chat, user=creator).update(role='admin')
-        
-        # Aggiungi altri partecipanti come membri (non per gemellaggi)
-        if participant_ids and chat_type != 'gemellaggio':
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            for user_id in participant_ids:
-                if user_id != creator.id:
-                    if not ChatParticipant.objects.filter(chat=chat, user_id=user_id).exists():
-                        try:
-                            user = User.objects.get(pk=user_id)
-                            ChatParticipant.objects.create(
-                                chat=chat,
-                                user=user,
-                                role='member'
-                            )
-                        except User.DoesNotExist:
-                            pass
-        
+
+            if chat_type == 'gemellaggio' and club_ids:
+                clubs = User.objects.filter(id__in=club_ids, user_type='CLUB')
+                chat.related_clubs.set(clubs)
+
+                # Note: The 'm2m_changed' signal on Chat.related_clubs (in signals.py)
+                # automatically adds all members of these clubs to the chat.
+
+            # Il creatore è admin; gli altri partecipanti membri (non per gemellaggi)
+            participants = [ChatParticipant(chat=chat, user=creator, role='admin')]
+            if participant_ids and chat_type != 'gemellaggio':
+                member_ids = User.objects.filter(
+                    pk__in=set(participant_ids) - {creator.id}
+                ).values_list('id', flat=True)
+                participants.extend(
+                    ChatParticipant(chat=chat, user_id=user_id, role='member')
+                    for user_id in member_ids
+                )
+
+            # Il creatore potrebbe essere già stato aggiunto (es. via club): in quel caso diventa admin
+            ChatParticipant.objects.bulk_create(
+                participants,
+                update_conflicts=True,
+                unique_fields=['chat', 'user'],
+                update_fields=['role'],
+            )
+
         return chat
 
 
@@ -159,6 +174,8 @@ class ChatParticipant(models.Model):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='member')
     joined_at = models.DateTimeField(default=timezone.now)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    # Contatore denormalizzato dei messaggi non letti (aggiornato in chat/signals.py)
+    unread_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         unique_together = ['chat', 'user']
@@ -174,7 +191,33 @@ class Message(models.Model):
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     body = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now, db_index=True)
-    client_msg_id = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
+    # Fornito dal client per rendere idempotenti i reinvii (generato dal server se assente)
+    client_msg_id = models.UUIDField(default=uuid.uuid4, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["chat", "id"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["chat", "sender", "client_msg_id"],
+                name="chat_message_unique_client_msg_id",
+            ),
+        ]
+
+
+class ArchivedMessage(models.Model):
+    """
+    Messaggio spostato in archivio (tabella fredda) da chat/services/archive.py.
+    Conserva lo stesso id del messaggio originale; le traduzioni sono compattate
+    in un unico campo JSON { lingua: { text, provider, detected_source_language } }.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="archived_messages")
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    client_msg_id = models.UUIDField()
+    translations = models.JSONField(default=dict, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [models.Index(fields=["chat", "id"])]
@@ -204,4 +247,72 @@ class MessageTranslation(models.Model):
         ]
 
     def __str__(self):
-        return f"Translation({self.message_id}, {self.target_language})"
\ No newline at end of file
+        return f"Translation({self.message_id}, {self.target_language})"
+
+class TranslationMemo(models.Model):
+    """
+    Shared translation memory for messages, posts and cards, keyed by the
+    SHA-256 of the source text, the target language and the text format.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    source_hash = models.CharField(max_length=64)
+    target_language = models.CharField(max_length=10)
+    text_format = models.CharField(max_length=10, default='text')
+    translated_text = models.TextField()
+    provider = models.CharField(max_length=20, choices=MessageTranslation.PROVIDER_CHOICES)
+    detected_source_language = models.CharField(max_length=10, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source_hash', 'target_language', 'text_format'],
+                name='chat_translation_memo_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"TranslationMemo({self.source_hash[:12]}, {self.target_language}, {self.text_format})"
+
+
+class TranslationJob(models.Model):
+    """
+    Asynchronous translation request (message, post or card) processed by the
+    worker pool in chat/services/translation_jobs.py; the result is pushed to
+    the requester's user_{id} group as a translation.ready event.
+    """
+
+    KIND_CHOICES = [
+        ('message', 'Messaggio'),
+        ('post', 'Post'),
+        ('card', 'Card'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'In attesa'),
+        (STATUS_RUNNING, 'In corso'),
+        (STATUS_DONE, 'Completato'),
+        (STATUS_FAILED, 'Fallito'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='translation_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=255)
+    target_language = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"TranslationJob({self.kind}:{self.object_id}, {self.target_language}, {self.status})"
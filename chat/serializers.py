@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Chat, Message, ChatParticipant, MessageTranslation
-from .services.presence import is_user_online
+from .services.presence import is_user_online, is_users_online
+from .services.unread import get_unread_count
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -9,12 +10,45 @@ class MessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     chat = serializers.PrimaryKeyRelatedField(read_only=True)
     sender = serializers.PrimaryKeyRelatedField(read_only=True)
+    # Facoltativo: se il client lo invia, i reinvii della stessa richiesta non duplicano il messaggio
+    client_msg_id = serializers.UUIDField(required=False)
     
     class Meta:
         model = Message
         fields = ["id", "chat", "sender", "sender_username", "body", "created_at", "client_msg_id"]
         read_only_fields = ["id", "created_at"]
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Chiave di idempotenza: si imposta solo alla creazione
+        if self.instance is not None:
+            fields["client_msg_id"].read_only = True
+        return fields
+
+
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ["id", "sender", "sender_username", "body", "created_at"]
+        read_only_fields = fields
+
+
+class ChatParticipantListSerializer(serializers.ListSerializer):
+    """
+    Risolve la presenza di tutti i partecipanti con un'unica lookup batch,
+    oppure riusa quella già calcolata per l'intera pagina (context['online_status']).
+    """
+
+    def to_representation(self, data):
+        participants = list(data.all() if hasattr(data, 'all') else data)
+        online_status = self.context.get('online_status')
+        if online_status is None:
+            online_status = is_users_online(p.user_id for p in participants)
+        self.child.online_status = online_status
+        return super().to_representation(participants)
+
 
 class ChatParticipantSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(source='user.id', read_only=True)
@@ -22,42 +56,64 @@ class ChatParticipantSerializer(serializers.ModelSerializer):
     is_online = serializers.SerializerMethodField()
 
     def get_is_online(self, obj):
+        online_status = getattr(self, 'online_status', None)
+        if online_status is not None and obj.user_id in online_status:
+            return online_status[obj.user_id]
         return is_user_online(obj.user_id)
     
     class Meta:
         model = ChatParticipant
         fields = ['user_id', 'username', 'role', 'joined_at', 'is_online']
+        list_serializer_class = ChatParticipantListSerializer
+
+
+class ChatListSerializer(serializers.ListSerializer):
+    """Risolve la presenza dei partecipanti di tutte le chat della pagina con un solo MGET."""
+
+    def to_representation(self, data):
+        chats = list(data.all() if hasattr(data, 'all') else data)
+        user_ids = {
+            participant.user_id
+            for chat in chats
+            for participant in chat.chat_participants.all()
+        }
+        self.context['online_status'] = is_users_online(user_ids)
+        return super().to_representation(chats)
 
 
 class ChatSerializer(serializers.ModelSerializer):
     participants_details = ChatParticipantSerializer(source='chat_participants', many=True, read_only=True)
     participant_count = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
+    last_message = LastMessageSerializer(read_only=True)
     
     class Meta:
         model = Chat
         fields = [
             "id", "chat_type", "name", "description",
-            "created_by", "created_at", "participants_details", "participant_count", "unread_count"
+            "created_by", "created_at", "participants_details", "participant_count", "unread_count",
+            "last_message", "last_message_at",
         ]
-        read_only_fields = ["id", "created_at", "created_by"]
+        read_only_fields = ["id", "created_at", "created_by", "last_message_at"]
+        list_serializer_class = ChatListSerializer
 
     def get_participant_count(self, obj):
+        # Annotato da ChatViewSet.get_queryset per lista e dettaglio
+        annotated = getattr(obj, "participant_count", None)
+        if annotated is not None:
+            return annotated
         return obj.chat_participants.count()
 
     def get_unread_count(self, obj):
+        annotated = getattr(obj, "unread_count", None)
+        if annotated is not None:
+            return annotated
+
         request = self.context.get("request")
         if not request or not hasattr(request, "user"):
             return 0
 
-        participant = obj.chat_participants.filter(user=request.user).only(
-            "last_read_at", "joined_at"
-        ).first()
-        if not participant:
-            return 0
-
-        last_read_at = participant.last_read_at or participant.joined_at
-        return obj.messages.filter(created_at__gt=last_read_at).exclude(sender=request.user).count()
+        return get_unread_count(obj.id, request.user.id)
 
 
 class CreateGroupChatSerializer(serializers.Serializer):
@@ -0,0 +1,105 @@
+"""
+Archiviazione dei messaggi vecchi: sposta Message e MessageTranslation oltre la
+soglia di conservazione nella tabella fredda ArchivedMessage.
+
+Il lavoro procede a lotti di id crescenti, ognuno in una transazione breve, così
+da non tenere lock prolungati sulla tabella calda. L'ultimo messaggio di ogni
+chat (anteprima inbox, Chat.last_message) resta sempre nella tabella calda.
+
+Poiché si archivia per età e gli id sono crescenti, in ogni chat gli id
+archiviati sono sempre minori di quelli ancora caldi: get_message_page sfrutta
+questo invariante per unire le due tabelle senza riordinare.
+"""
+
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ArchivedMessage, Chat, Message, MessageTranslation
+
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_cutoff(days: Optional[int] = None) -> datetime:
+    """Istante prima del quale i messaggi vanno archiviati (default CHAT_ARCHIVE_AFTER_DAYS)."""
+    if days is None:
+        days = settings.CHAT_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_messages(cutoff: datetime, chat_ids: Optional[Iterable] = None):
+    """Messaggi più vecchi di cutoff, esclusi quelli usati come anteprima inbox."""
+    queryset = Message.objects.filter(created_at__lt=cutoff).exclude(
+        id__in=Chat.objects.filter(last_message__isnull=False).values("last_message_id")
+    )
+    if chat_ids:
+        queryset = queryset.filter(chat_id__in=chat_ids)
+    return queryset
+
+
+def _archive_batch(queryset, after_id: int, batch_size: int) -> List[int]:
+    """Archivia un lotto di messaggi con id > after_id; restituisce gli id archiviati."""
+    with transaction.atomic():
+        messages = list(queryset.filter(id__gt=after_id).order_by("id")[:batch_size])
+        if not messages:
+            return []
+        ids = [msg.id for msg in messages]
+
+        translations = {}
+        for row in MessageTranslation.objects.filter(message_id__in=ids).values(
+            "message_id", "target_language", "translated_text", "provider", "detected_source_language"
+        ):
+            translations.setdefault(row["message_id"], {})[row["target_language"]] = {
+                "text": row["translated_text"],
+                "provider": row["provider"],
+                "detected_source_language": row["detected_source_language"],
+            }
+
+        # ignore_conflicts: un lotto interrotto dopo l'inserimento può essere ripetuto
+        ArchivedMessage.objects.bulk_create(
+            [
+                ArchivedMessage(
+                    id=msg.id,
+                    chat_id=msg.chat_id,
+                    sender_id=msg.sender_id,
+                    body=msg.body,
+                    created_at=msg.created_at,
+                    client_msg_id=msg.client_msg_id,
+                    translations=translations.get(msg.id, {}),
+                )
+                for msg in messages
+            ],
+            ignore_conflicts=True,
+        )
+        MessageTranslation.objects.filter(message_id__in=ids).delete()
+        Message.objects.filter(id__in=ids).delete()
+    return ids
+
+
+def archive_messages(
+    cutoff: datetime,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    chat_ids: Optional[Iterable] = None,
+    sleep: float = 0,
+) -> int:
+    """
+    Sposta in ArchivedMessage i messaggi creati prima di cutoff, con le loro traduzioni.
+    `sleep` introduce una pausa (secondi) tra un lotto e l'altro per limitare il carico.
+    Restituisce il numero di messaggi archiviati.
+    """
+    queryset = archivable_messages(cutoff, chat_ids)
+    archived = 0
+    last_id = 0
+    while True:
+        ids = _archive_batch(queryset, last_id, batch_size)
+        if not ids:
+            return archived
+        archived += len(ids)
+        last_id = ids[-1]
+        if sleep:
+            time.sleep(sleep)
@@ -0,0 +1,46 @@
+"""
+Serializzazione JSON dei frame WebSocket.
+
+Usa orjson se installato, altrimenti il modulo json della libreria standard
+(con separatori compatti). I payload broadcast possono essere serializzati una
+sola volta e inseriti già codificati nel frame di ogni destinatario (raw_frame).
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    orjson = None
+
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(text):
+        return orjson.loads(text)
+
+else:
+    JSON_BACKEND = "json"
+    # Istanza riusata: json.dumps con argomenti non predefiniti ne crea una per chiamata
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def dumps(obj) -> str:
+        return _encoder.encode(obj)
+
+    def loads(text):
+        return json.loads(text)
+
+
+def raw_frame(fields: dict, **raw: str) -> str:
+    """
+    Compone un oggetto JSON dai campi `fields` (serializzati qui) e dai campi `raw`,
+    già in formato JSON, che vengono inseriti così come sono. I nomi dei campi sono
+    identificatori semplici e non richiedono escape.
+    """
+    parts = [f'"{key}":{dumps(value)}' for key, value in fields.items()]
+    parts.extend(f'"{key}":{value}' for key, value in raw.items())
+    return "{" + ",".join(parts) + "}"
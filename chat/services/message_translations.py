@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+from django.db import transaction
+
+from ..models import Message, MessageTranslation
+from ..serializers import MessageTranslationSerializer
+from .translation import (
+    TranslationProviderError,
+    TranslationResult,
+    get_memoized_translations,
+    memoize_translations,
+    normalize_language_code,
+    translate_texts,
+)
+
+
+TRANSLATION_BATCH_MAX_MESSAGES = 50
+
+
+def parse_message_ids(value) -> List[int]:
+    """Converte la lista message_ids ricevuta dal client; ValueError se non valida o troppo lunga."""
+    if not isinstance(value, (list, tuple)) or not value:
+        raise ValueError("message_ids must be a non-empty list")
+    if len(value) > TRANSLATION_BATCH_MAX_MESSAGES:
+        raise ValueError("too many message_ids")
+    ids = [int(item) for item in value]
+    if any(message_id < 0 for message_id in ids):
+        raise ValueError("message_ids must be positive")
+    return list(dict.fromkeys(ids))
+
+
+@dataclass
+class PendingMessageTranslations:
+    """Messaggi da tradurre e traduzioni già note, letti da load_message_translations."""
+
+    language: str
+    messages: List[Message]
+    pending: List[Message]
+    found: Dict[str, TranslationResult]
+
+    @property
+    def misses(self) -> List[str]:
+        """Testi distinti da inviare al provider."""
+        return list(dict.fromkeys(msg.body for msg in self.pending if msg.body not in self.found))
+
+
+def load_message_translations(
+    chat_id, user_id: int, message_ids: List[int], target_language: str
+) -> PendingMessageTranslations:
+    """
+    Fase di lettura di translate_messages: messaggi richiesti, quelli ancora senza
+    traduzione salvata e le traduzioni già presenti nella memoria condivisa.
+    Solo le chat di cui user_id è partecipante: per gli altri il risultato è vuoto.
+    """
+    language = normalize_language_code(target_language)
+    messages = list(
+        Message.objects.filter(chat_id=chat_id, id__in=message_ids, chat__chat_participants__user_id=user_id)
+        .exclude(sender_id=user_id)
+        .exclude(body="")
+        .only("id", "body")
+    )
+    translated_ids = set(
+        MessageTranslation.objects.filter(
+            message__in=messages, target_language=language
+        ).values_list("message_id", flat=True)
+    )
+    pending = [msg for msg in messages if msg.id not in translated_ids and msg.body.strip()]
+    found = get_memoized_translations([msg.body for msg in pending], language) if pending else {}
+    return PendingMessageTranslations(language, messages, pending, found)
+
+
+def save_message_translations(
+    batch: PendingMessageTranslations, translated: Dict[str, TranslationResult]
+) -> List[MessageTranslation]:
+    """
+    Fase di scrittura: memorizza i risultati del provider (testo sorgente -> risultato),
+    salva le traduzioni dei messaggi e le restituisce dal messaggio più recente.
+    """
+    if translated:
+        memoize_translations(translated, batch.language)
+    results = {**batch.found, **translated}
+    if batch.pending:
+        with transaction.atomic():
+            MessageTranslation.objects.bulk_create(
+                [
+                    MessageTranslation(
+                        message_id=msg.id,
+                        target_language=batch.language,
+                        translated_text=results[msg.body].text,
+                        provider=results[msg.body].provider,
+                        detected_source_language=results[msg.body].detected_source_language,
+                    )
+                    for msg in batch.pending
+                ],
+                ignore_conflicts=True,
+            )
+
+    return list(
+        MessageTranslation.objects.filter(message__in=batch.messages, target_language=batch.language)
+        .order_by("-message_id")
+    )
+
+
+def translate_messages(chat_id, user_id: int, message_ids: List[int], target_language: str) -> List[MessageTranslation]:
+    """
+    Traduce una finestra di messaggi della chat nella lingua richiesta.
+
+    Le traduzioni già salvate sono lette con una query; i testi mancanti passano
+    dalla memoria di traduzione condivisa e i restanti sono inviati al provider in
+    un'unica richiesta multi-testo. I messaggi dell'utente stesso, quelli vuoti e
+    gli id estranei alla chat sono ignorati.
+
+    Le tre fasi (load_message_translations, translate_texts, save_message_translations)
+    sono separate perché il consumer WebSocket esegue la chiamata al provider fuori
+    dal thread condiviso degli accessi al database.
+
+    Solleva TranslationServiceNotConfigured / TranslationProviderError come translate_text.
+    Restituisce le traduzioni ordinate dal messaggio più recente.
+    """
+    batch = load_message_translations(chat_id, user_id, message_ids, target_language)
+    misses = batch.misses
+    translated = dict(zip(misses, translate_texts(misses, batch.language))) if misses else {}
+    return save_message_translations(batch, translated)
+
+
+def run_message_translation_job(job) -> dict:
+    """Gestore dei TranslationJob di tipo "message" (vedi translation_jobs.py)."""
+    message = Message.objects.only("id", "chat_id").get(pk=job.object_id)
+    translations = translate_messages(message.chat_id, job.user_id, [message.id], job.target_language)
+    if not translations:
+        raise TranslationProviderError("Il messaggio è vuoto, impossibile tradurre")
+    return MessageTranslationSerializer(translations[0]).data
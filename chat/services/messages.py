@@ -0,0 +1,199 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.db import IntegrityError, transaction
+
+from ..models import ArchivedMessage, ChatParticipant, Message
+from .unread import get_recipient_unread_counts
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+@dataclass
+class SentMessage:
+    payload: dict
+    chat_type: str
+    recipient_unread_counts: Dict[int, int] = field(default_factory=dict)
+    # False se il client_msg_id era già stato ricevuto (reinvio): niente fan-out
+    created: bool = True
+
+
+@dataclass
+class MessagePage:
+    messages: List[Message]
+    has_more: bool
+
+
+def message_payload(msg: Message) -> dict:
+    """Rappresentazione di un messaggio inviata ai client WebSocket."""
+    return {
+        "id": msg.id,
+        "sender_id": msg.sender_id,
+        "body": msg.body,
+        "created_at": msg.created_at.isoformat(),
+        "client_msg_id": str(msg.client_msg_id),
+    }
+
+
+def parse_chat_id(value) -> str:
+    """
+    Forma canonica (UUID minuscolo con trattini) del chat_id ricevuto dal client:
+    è la chiave usata da gruppi e cache di appartenenza. ValueError se non valido.
+    """
+    return str(uuid.UUID(str(value)))
+
+
+def parse_client_msg_id(value) -> Optional[uuid.UUID]:
+    """Converte il client_msg_id ricevuto dal client (None se assente); ValueError se non valido."""
+    if value in (None, ""):
+        return None
+    return uuid.UUID(str(value))
+
+
+def create_message_once(chat_id, sender_id: int, client_msg_id=None, **fields):
+    """
+    Crea il messaggio, oppure restituisce quello già salvato con lo stesso
+    (chat, sender, client_msg_id). Restituisce (message, created).
+    Va chiamata dentro una transazione.
+    """
+    if client_msg_id is None:
+        return Message.objects.create(chat_id=chat_id, sender_id=sender_id, **fields), True
+
+    existing = Message.objects.filter(
+        chat_id=chat_id, sender_id=sender_id, client_msg_id=client_msg_id
+    ).first()
+    if existing is not None:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            msg = Message.objects.create(
+                chat_id=chat_id, sender_id=sender_id, client_msg_id=client_msg_id, **fields
+            )
+    except IntegrityError:
+        # Reinvio concorrente: l'altra richiesta ha già inserito la riga
+        return (
+            Message.objects.get(chat_id=chat_id, sender_id=sender_id, client_msg_id=client_msg_id),
+            False,
+        )
+    return msg, True
+
+
+def send_message(chat_id, sender_id: int, body: str, client_msg_id=None) -> Optional[SentMessage]:
+    """
+    Unità di lavoro sincrona per message.send: verifica la partecipazione,
+    crea il messaggio (i segnali post_save aggiornano non letti e anteprima)
+    e legge tipo chat e non letti dei destinatari, in un'unica transazione.
+    Restituisce None se il mittente non partecipa alla chat.
+
+    Se client_msg_id è già stato ricevuto restituisce il messaggio esistente
+    con created=False, senza toccare contatori né destinatari.
+    """
+    with transaction.atomic():
+        chat_type = (
+            ChatParticipant.objects.filter(chat_id=chat_id, user_id=sender_id)
+            .values_list("chat__chat_type", flat=True)
+            .first()
+        )
+        if chat_type is None:
+            return None
+
+        msg, created = create_message_once(chat_id, sender_id, client_msg_id, body=body)
+        if not created:
+            return SentMessage(payload=message_payload(msg), chat_type=chat_type, created=False)
+        unread_counts = get_recipient_unread_counts(chat_id, sender_id)
+
+    return SentMessage(
+        payload=message_payload(msg),
+        chat_type=chat_type,
+        recipient_unread_counts=unread_counts,
+    )
+
+
+def parse_history_cursor(value) -> Optional[int]:
+    """Converte before_id/after_id in intero (None se assente); ValueError se non valido."""
+    if value in (None, ""):
+        return None
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError("cursor must be positive")
+    return cursor
+
+
+def get_message_page(
+    chat_id,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    queryset=None,
+    archive_queryset=None,
+) -> MessagePage:
+    """
+    Paginazione keyset sull'indice (chat, id): costo O(pagina) a qualunque profondità.
+
+    - senza cursori: gli ultimi `limit` messaggi;
+    - before_id: i `limit` messaggi precedenti a before_id (scroll verso il passato);
+    - after_id: i `limit` messaggi successivi ad after_id (recupero dopo riconnessione).
+
+    I messaggi sono sempre restituiti dal più recente al più vecchio; has_more indica
+    se esistono altri messaggi nella direzione richiesta.
+
+    I messaggi archiviati (ArchivedMessage) hanno id minori di tutti quelli ancora
+    nella tabella calda della stessa chat: verso il passato l'archivio è letto solo
+    quando la tabella calda non basta a riempire la pagina, verso il futuro è letto
+    per primo e completato con i messaggi caldi.
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+    if queryset is None:
+        queryset = Message.objects.all()
+    if archive_queryset is None:
+        archive_queryset = ArchivedMessage.objects.select_related("sender")
+    queryset = queryset.filter(chat_id=chat_id)
+    archive_queryset = archive_queryset.filter(chat_id=chat_id)
+
+    if after_id is not None:
+        rows = list(archive_queryset.filter(id__gt=after_id).order_by("id")[: limit + 1])
+        if len(rows) <= limit:
+            rows += queryset.filter(id__gt=after_id).order_by("id")[: limit + 1 - len(rows)]
+        return MessagePage(messages=rows[:limit][::-1], has_more=len(rows) > limit)
+
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+        archive_queryset = archive_queryset.filter(id__lt=before_id)
+    rows = list(queryset.order_by("-id")[: limit + 1])
+    if len(rows) <= limit:
+        if rows:
+            archive_queryset = archive_queryset.filter(id__lt=rows[-1].id)
+        rows += archive_queryset.order_by("-id")[: limit + 1 - len(rows)]
+    return MessagePage(messages=rows[:limit], has_more=len(rows) > limit)
+
+
+def message_history_payload(
+    chat_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE, user_id: Optional[int] = None
+) -> dict:
+    """
+    Pagina di cronologia nel formato dei frame WebSocket history. Con user_id la
+    lettura è limitata alle chat di cui l'utente è ancora partecipante: una cache
+    di appartenenza non aggiornata nel consumer non basta a leggere i messaggi.
+    """
+    queryset = archive_queryset = None
+    if user_id is not None:
+        queryset = Message.objects.filter(chat__chat_participants__user_id=user_id)
+        archive_queryset = ArchivedMessage.objects.select_related("sender").filter(
+            chat__chat_participants__user_id=user_id
+        )
+    page = get_message_page(
+        chat_id,
+        before_id=before_id,
+        after_id=after_id,
+        limit=limit,
+        queryset=queryset,
+        archive_queryset=archive_queryset,
+    )
+    return {
+        "data": [message_payload(msg) for msg in page.messages],
+        "has_more": page.has_more,
+    }
@@ -1,24 +1,182 @@
-from django.core.cache import cache
+"""
+Presenza online degli utenti, condivisa tra tutti i worker.
+
+Ogni utente ha un contatore di connessioni aperte, incrementato e decrementato
+atomicamente (INCR/DECR). La chiave ha un TTL rinnovato dall'heartbeat di ogni
+connessione: se un worker termina senza chiudere i socket, il contatore scade
+e l'utente non resta online per sempre.
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRESENCE_TTL = 60
 
 
 def _connection_count_key(user_id: int) -> str:
     return f"chat:presence:connections:{user_id}"
 
 
+class BasePresenceBackend:
+    def __init__(self, ttl: int = DEFAULT_PRESENCE_TTL) -> None:
+        self.ttl = ttl
+
+    def connect(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def disconnect(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def heartbeat(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def online_counts(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        raise NotImplementedError
+
+
+class RedisPresenceBackend(BasePresenceBackend):
+    """Backend condiviso su Redis: INCR/DECR atomici, TTL rinnovato via EXPIRE, batch via MGET."""
+
+    def __init__(self, client, ttl: int = DEFAULT_PRESENCE_TTL) -> None:
+        super().__init__(ttl)
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str, ttl: int = DEFAULT_PRESENCE_TTL) -> "RedisPresenceBackend":
+        import redis
+
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def connect(self, user_id: int) -> None:
+        key = _connection_count_key(user_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def disconnect(self, user_id: int) -> None:
+        key = _connection_count_key(user_id)
+        remaining = self.client.decr(key)
+        if remaining < 0:
+            # La chiave era già scaduta: compensa senza perdere INCR concorrenti
+            self.client.incrby(key, -remaining)
+
+    def heartbeat(self, user_id: int) -> None:
+        self.client.expire(_connection_count_key(user_id), self.ttl)
+
+    def online_counts(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        values = self.client.mget([_connection_count_key(user_id) for user_id in user_ids])
+        return {user_id: int(value or 0) for user_id, value in zip(user_ids, values)}
+
+
+class CachePresenceBackend(BasePresenceBackend):
+    """
+    Backend su django.core.cache, per sviluppo locale con un solo processo.
+    Con LocMemCache i contatori non sono condivisi tra worker.
+    """
+
+    def connect(self, user_id: int) -> None:
+        from django.core.cache import cache
+
+        key = _connection_count_key(user_id)
+        cache.add(key, 0, timeout=self.ttl)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=self.ttl)
+        cache.touch(key, self.ttl)
+
+    def disconnect(self, user_id: int) -> None:
+        from django.core.cache import cache
+
+        key = _connection_count_key(user_id)
+        try:
+            if cache.decr(key) < 0:
+                cache.set(key, 0, timeout=self.ttl)
+        except ValueError:
+            pass
+
+    def heartbeat(self, user_id: int) -> None:
+        from django.core.cache import cache
+
+        cache.touch(_connection_count_key(user_id), self.ttl)
+
+    def online_counts(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        from django.core.cache import cache
+
+        keys = {_connection_count_key(user_id): user_id for user_id in user_ids}
+        values = cache.get_many(list(keys))
+        return {user_id: int(values.get(key) or 0) for key, user_id in keys.items()}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_presence_backend() -> BasePresenceBackend:
+    # I consumer chiamano il backend da più thread: un solo client per processo
+    global _backend
+    backend = _backend
+    if backend is None:
+        with _backend_lock:
+            if _backend is None:
+                ttl = getattr(settings, "CHAT_PRESENCE_TTL", DEFAULT_PRESENCE_TTL)
+                if getattr(settings, "CHAT_PRESENCE_BACKEND", "cache") == "redis":
+                    _backend = RedisPresenceBackend.from_url(settings.CHAT_PRESENCE_REDIS_URL, ttl)
+                else:
+                    _backend = CachePresenceBackend(ttl)
+            backend = _backend
+    return backend
+
+
+@receiver(setting_changed)
+def _reset_presence_backend(setting, **kwargs):
+    global _backend
+    if setting.startswith("CHAT_PRESENCE_"):
+        _backend = None
+
+
+def presence_heartbeat_interval() -> float:
+    """Intervallo tra due heartbeat: un terzo del TTL, per tollerare un heartbeat perso."""
+    return get_presence_backend().ttl / 3
+
+
+def _safely(action: str, func, *args):
+    try:
+        return func(*args)
+    except Exception:
+        logger.warning("Presence %s failed", action, exc_info=True)
+        return None
+
+
 def mark_user_connected(user_id: int) -> None:
-    key = _connection_count_key(user_id)
-    current = cache.get(key, 0) or 0
-    cache.set(key, int(current) + 1, timeout=None)
+    _safely("connect", get_presence_backend().connect, user_id)
 
 
 def mark_user_disconnected(user_id: int) -> None:
-    key = _connection_count_key(user_id)
-    current = cache.get(key, 0) or 0
-    next_value = max(int(current) - 1, 0)
-    cache.set(key, next_value, timeout=None)
+    _safely("disconnect", get_presence_backend().disconnect, user_id)
+
+
+def touch_user_presence(user_id: int) -> None:
+    _safely("heartbeat", get_presence_backend().heartbeat, user_id)
+
+
+def is_users_online(user_ids: Iterable[int]) -> Dict[int, bool]:
+    """Restituisce { user_id: online } con un solo round-trip verso il backend."""
+    user_ids = list(user_ids)
+    counts = _safely("lookup", get_presence_backend().online_counts, user_ids) or {}
+    return {user_id: counts.get(user_id, 0) > 0 for user_id in user_ids}
 
 
 def is_user_online(user_id: int) -> bool:
-    key = _connection_count_key(user_id)
-    count = cache.get(key, 0) or 0
-    return int(count) > 0
+    return is_users_online([user_id])[user_id]
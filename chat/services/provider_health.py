@@ -0,0 +1,190 @@
+"""
+Stato di salute dei provider di traduzione: circuit breaker e latenza media.
+
+Lo stato vive nella cache Django (alias TRANSLATION_BREAKER_CACHE), così tutti i
+worker che condividono la cache vedono lo stesso breaker: dopo
+TRANSLATION_BREAKER_FAILURES errori consecutivi il provider è "open" e viene
+saltato senza chiamarlo per TRANSLATION_BREAKER_RESET_SECONDS; scaduto il
+periodo passa "half_open" e una sola richiesta di prova decide se richiuderlo
+o riaprirlo. Con CACHE_BACKEND=locmem (sviluppo) lo stato è per processo.
+
+Ogni provider tiene anche una media mobile esponenziale della latenza: quelli
+più lenti di TRANSLATION_BREAKER_SLOW_MS passano in fondo alla catena. Un
+provider in fondo non riceve più traffico e quindi nuovi campioni: la media
+scade dopo TRANSLATION_BREAKER_RESET_SECONDS senza aggiornamenti, così il
+provider torna al suo posto e la richiesta successiva ne rimisura la latenza.
+I contatori (successi, errori, aperture, richieste saltate, fallback) si
+leggono con `python manage.py translation_provider_health`.
+
+Se la cache non risponde (es. Redis irraggiungibile) il breaker non blocca le
+traduzioni: l'errore è registrato nel log, i provider sono trattati come
+"closed" e stato e contatori non vengono aggiornati.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+METRICS = ("successes", "failures", "trips", "short_circuits", "fallbacks")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class ProviderHealth:
+    name: str
+    state: str
+    failures: int = 0
+    latency_ms: Optional[float] = None
+
+    @property
+    def is_slow(self) -> bool:
+        return self.latency_ms is not None and self.latency_ms > settings.TRANSLATION_BREAKER_SLOW_MS
+
+
+def _cache():
+    return caches[getattr(settings, "TRANSLATION_BREAKER_CACHE", "default")]
+
+
+def _safely(action: str, func, *args, default=None):
+    try:
+        return func(*args)
+    except Exception:
+        logger.warning("Translation breaker %s failed", action, exc_info=True)
+        return default
+
+
+def _key(name: str, field: str) -> str:
+    return f"translation:breaker:{name}:{field}"
+
+
+def _incr(cache, key: str) -> int:
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Chiave rimossa tra add e incr
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def count(name: str, metric: str) -> None:
+    _safely("metric", _incr, _cache(), _key(name, f"metric:{metric}"))
+
+
+def provider_health(names: Iterable[str]) -> List[ProviderHealth]:
+    """Stato di ciascun provider, letto con una sola get_many."""
+    names = list(names)
+    keys = [_key(name, field) for name in names for field in ("open", "failures", "latency")]
+    values = _safely("read", _cache().get_many, keys, default={})
+    threshold = settings.TRANSLATION_BREAKER_FAILURES
+    health = []
+    for name in names:
+        failures = values.get(_key(name, "failures")) or 0
+        if _key(name, "open") in values:
+            state = OPEN
+        elif failures >= threshold:
+            state = HALF_OPEN
+        else:
+            state = CLOSED
+        health.append(ProviderHealth(name, state, failures, values.get(_key(name, "latency"))))
+    return health
+
+
+def route_providers(providers: Sequence[T]) -> List[Tuple[T, ProviderHealth]]:
+    """
+    Abbina a ogni provider il suo stato e sposta in fondo quelli lenti,
+    mantenendo per il resto l'ordine di priorità.
+    """
+    health = provider_health(provider.name for provider in providers)
+    return sorted(zip(providers, health), key=lambda pair: pair[1].is_slow)
+
+
+def acquire_probe(name: str) -> bool:
+    """True per la sola richiesta di prova ammessa su un provider half_open."""
+    return _safely(
+        "probe",
+        _cache().add,
+        _key(name, "probe"),
+        True,
+        settings.TRANSLATION_BREAKER_RESET_SECONDS,
+        default=True,
+    )
+
+
+def record_success(name: str, latency: Optional[float] = None, clear_failures: bool = True) -> None:
+    """
+    Registra una risposta del provider: azzera gli errori (clear_failures=False
+    risparmia la scrittura quando il chiamante sa che erano già a zero) e
+    aggiorna la latenza media con il campione `latency` in secondi.
+    """
+    _safely("success", _record_success, name, latency, clear_failures)
+
+
+def _record_success(name: str, latency: Optional[float], clear_failures: bool) -> None:
+    cache = _cache()
+    if clear_failures:
+        cache.delete_many([_key(name, "failures"), _key(name, "probe")])
+    if latency is not None:
+        sample = latency * 1000
+        previous = cache.get(_key(name, "latency"))
+        if previous is not None:
+            alpha = settings.TRANSLATION_BREAKER_EWMA_ALPHA
+            sample = alpha * sample + (1 - alpha) * previous
+        cache.set(_key(name, "latency"), sample, timeout=settings.TRANSLATION_BREAKER_RESET_SECONDS)
+    _incr(cache, _key(name, "metric:successes"))
+
+
+def record_failure(name: str) -> bool:
+    """Registra un errore del provider; True se questo errore apre il breaker."""
+    return _safely("failure", _record_failure, name, default=False)
+
+
+def _record_failure(name: str) -> bool:
+    cache = _cache()
+    failures = _incr(cache, _key(name, "failures"))
+    cache.delete(_key(name, "probe"))
+    _incr(cache, _key(name, "metric:failures"))
+    if failures < settings.TRANSLATION_BREAKER_FAILURES:
+        return False
+    # add: con più worker che falliscono insieme l'apertura è contata una volta
+    if not cache.add(_key(name, "open"), True, timeout=settings.TRANSLATION_BREAKER_RESET_SECONDS):
+        return False
+    _incr(cache, _key(name, "metric:trips"))
+    logger.warning(
+        "Translation provider %s disabled for %ss after %s consecutive failures",
+        name,
+        settings.TRANSLATION_BREAKER_RESET_SECONDS,
+        failures,
+    )
+    return True
+
+
+def provider_health_snapshot(names: Iterable[str]) -> Dict[str, dict]:
+    """Stato, latenza media e contatori per provider (comando translation_provider_health)."""
+    names = list(names)
+    counters = _cache().get_many([_key(name, f"metric:{metric}") for name in names for metric in METRICS])
+    return {
+        health.name: {
+            "state": health.state,
+            "consecutive_failures": health.failures,
+            "latency_ms": health.latency_ms,
+            **{metric: counters.get(_key(health.name, f"metric:{metric}"), 0) for metric in METRICS},
+        }
+        for health in provider_health(names)
+    }
+
+
+def reset_provider_health(names: Iterable[str]) -> None:
+    """Richiude i breaker e azzera latenza e contatori dei provider indicati."""
+    fields = ("open", "failures", "probe", "latency") + tuple(f"metric:{metric}" for metric in METRICS)
+    _cache().delete_many([_key(name, field) for name in names for field in fields])
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_ADDED = "added"
+MEMBERSHIP_REMOVED = "removed"
+
+
+def chat_message_event(chat_id, payload):
+    """
+    Evento chat.message con il payload già serializzato: il JSON viene prodotto
+    una sola volta e riusato da ogni socket destinatario.
+    """
+    return {"type": "chat.message", "chat_id": str(chat_id), "message_json": dumps(payload)}
+
+
+def event_message_json(event):
+    """Payload serializzato di un evento chat.message (accetta anche il formato con "message")."""
+    if "message_json" in event:
+        return event["message_json"]
+    return dumps(event["message"])
+
+
+async def _gather_limited(calls):
+    """Esegue in parallelo le coroutine prodotte da `calls`, al massimo CHAT_FANOUT_CONCURRENCY alla volta."""
+    semaphore = asyncio.Semaphore(getattr(settings, "CHAT_FANOUT_CONCURRENCY", 50))
+
+    async def _run(call):
+        async with semaphore:
+            await call()
+
+    await asyncio.gather(*(_run(call) for call in calls))
+
+
+async def group_send_many(channel_layer, events):
+    """
+    Esegue in parallelo una group_send per ogni coppia (group, message),
+    limitando le chiamate concorrenti a CHAT_FANOUT_CONCURRENCY.
+    """
+    await _gather_limited(
+        functools.partial(channel_layer.group_send, group, message) for group, message in events
+    )
+
+
+async def group_add_many(channel_layer, groups, channel_name):
+    """Iscrive il canale a tutti i gruppi in parallelo: la latenza non cresce col numero di chat."""
+    await _gather_limited(
+        functools.partial(channel_layer.group_add, group, channel_name) for group in groups
+    )
+
+
+async def group_discard_many(channel_layer, groups, channel_name):
+    """Rimuove il canale da tutti i gruppi in parallelo."""
+    await _gather_limited(
+        functools.partial(channel_layer.group_discard, group, channel_name) for group in groups
+    )
+
+
+async def send_unread_updates(channel_layer, chat_id, chat_type, unread_counts):
+    """Invia gli eventi unread.update ai gruppi user_{id} dei destinatari."""
+    await group_send_many(
+        channel_layer,
+        (
+            (
+                f"user_{uid}",
+                {
+                    "type": "unread.update",
+                    "chat_id": str(chat_id),
+                    "chat_type": chat_type,
+                    "unread_count": unread,
+                },
+            )
+            for uid, unread in unread_counts.items()
+        ),
+    )
+
+
+def notify_membership_changed(chat_id, chat_type, user_ids, action):
+    """
+    Notifica ai socket degli utenti (gruppi user_{id}) che sono stati aggiunti
+    o rimossi da una chat, così GlobalChatConsumer aggiorna la propria cache
+    di appartenenza. L'invio avviene dopo il commit della transazione corrente.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    event = {
+        "type": "chat.membership",
+        "chat_id": str(chat_id),
+        "chat_type": chat_type,
+        "action": action,
+    }
+
+    def _send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(group_send_many)(
+                channel_layer, ((f"user_{uid}", event) for uid in user_ids)
+            )
+        except Exception:
+            logger.exception("Chat membership notification failed for chat %s", chat_id)
+
+    transaction.on_commit(_send)
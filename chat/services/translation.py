@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import html
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import requests
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..models import TranslationMemo
+from . import provider_health
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +37,18 @@ class TranslationProviderError(TranslationServiceError):
     """Raised when the upstream provider returns an error."""
 
 
+class TranslationRequestRejected(TranslationProviderError):
+    """The provider refused this request (4xx): it is up, so the breaker does not count it."""
+
+
+def _request_error(message: str, exc: requests.RequestException) -> TranslationProviderError:
+    response = getattr(exc, "response", None)
+    status = response.status_code if response is not None else None
+    if status is not None and 400 <= status < 500 and status not in (408, 429):
+        return TranslationRequestRejected(message)
+    return TranslationProviderError(message)
+
+
 @dataclass
 class TranslationResult:
     text: str
@@ -41,8 +65,55 @@ def supported_languages() -> List[str]:
     return [code.lower() for code in getattr(settings, "TRANSLATION_SUPPORTED_LANGUAGES", [])]
 
 
+# Settings that require rebuilding the long-lived provider instances
+PROVIDER_SETTINGS = frozenset({
+    "DEEPL_API_KEY",
+    "DEEPL_API_URL",
+    "GOOGLE_TRANSLATE_API_KEY",
+    "GOOGLE_TRANSLATE_API_URL",
+    "TRANSLATION_PROVIDER_PRIORITY",
+    "TRANSLATION_HTTP_TIMEOUT",
+    "TRANSLATION_HTTP_POOL_SIZE",
+    "TRANSLATION_HTTP_RETRIES",
+    "TRANSLATION_HTTP_BACKOFF",
+})
+
+
+def build_http_session() -> requests.Session:
+    """
+    Session with a keep-alive connection pool and retry/backoff for upstream APIs.
+    Only connection failures and 5xx responses are retried: a read timeout is
+    not, so a slow provider costs one timeout before the next in the chain.
+    A 429 is not retried and Retry-After is ignored (it may ask for minutes):
+    the chain moves on to the next provider and the breaker counts the failure.
+    """
+    retries = getattr(settings, "TRANSLATION_HTTP_RETRIES", 2)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=getattr(settings, "TRANSLATION_HTTP_BACKOFF", 0.3),
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, "TRANSLATION_HTTP_POOL_SIZE", 10)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class BaseTranslationProvider:
     name = ""
+    # Maximum number of texts accepted by a single upstream request
+    max_batch_size = 1
+
+    def __init__(self) -> None:
+        self.session = build_http_session()
 
     def is_configured(self) -> bool:
         raise NotImplementedError
@@ -53,13 +124,27 @@ class BaseTranslationProvider:
         target_language: str,
         text_format: str = "text",
     ) -> TranslationResult:
+        return self.translate_many([text], target_language, text_format)[0]
+
+    def close(self) -> None:
+        self.session.close()
+
+    def translate_many(
+        self,
+        texts: Sequence[str],
+        target_language: str,
+        text_format: str = "text",
+    ) -> List[TranslationResult]:
+        """Translates up to max_batch_size texts with one upstream request, preserving order."""
         raise NotImplementedError
 
 
 class DeepLTranslationProvider(BaseTranslationProvider):
     name = "deepl"
+    max_batch_size = 50
 
     def __init__(self) -> None:
+        super().__init__()
         self.api_key = getattr(settings, "DEEPL_API_KEY", None)
         self.api_url = getattr(settings, "DEEPL_API_URL", "https://api-free.deepl.com/v2/translate")
         self.timeout = getattr(settings, "TRANSLATION_HTTP_TIMEOUT", 10)
@@ -67,38 +152,44 @@ class DeepLTranslationProvider(BaseTranslationProvider):
     def is_configured(self) -> bool:
         return bool(self.api_key)
 
-    def translate(self, text: str, target_language: str, text_format: str = "text") -> TranslationResult:
+    def translate_many(
+        self, texts: Sequence[str], target_language: str, text_format: str = "text"
+    ) -> List[TranslationResult]:
         payload = {
             "auth_key": self.api_key,
             "target_lang": target_language.upper(),
-            "text": text,
+            "text": list(texts),
         }
         if text_format == "html":
             payload["tag_handling"] = "html"
         try:
-            response = requests.post(self.api_url, data=payload, timeout=self.timeout)
+            response = self.session.post(self.api_url, data=payload, timeout=self.timeout)
             response.raise_for_status()
             data = response.json()
         except requests.RequestException as exc:
             logger.exception("DeepL translation failed")
-            raise TranslationProviderError("Errore durante la traduzione con DeepL") from exc
+            raise _request_error("Errore durante la traduzione con DeepL", exc) from exc
 
         translations = data.get("translations") or []
-        if not translations:
+        if len(translations) != len(texts):
             raise TranslationProviderError("DeepL non ha restituito risultati")
 
-        entry = translations[0]
-        return TranslationResult(
-            text=entry.get("text", ""),
-            provider=self.name,
-            detected_source_language=(entry.get("detected_source_language") or "").lower() or None,
-        )
+        return [
+            TranslationResult(
+                text=entry.get("text", ""),
+                provider=self.name,
+                detected_source_language=(entry.get("detected_source_language") or "").lower() or None,
+            )
+            for entry in translations
+        ]
 
 
 class GoogleTranslateProvider(BaseTranslationProvider):
     name = "google"
+    max_batch_size = 128
 
     def __init__(self) -> None:
+        super().__init__()
         self.api_key = getattr(settings, "GOOGLE_TRANSLATE_API_KEY", None)
         self.api_url = getattr(
             settings,
@@ -110,15 +201,17 @@ class GoogleTranslateProvider(BaseTranslationProvider):
     def is_configured(self) -> bool:
         return bool(self.api_key)
 
-    def translate(self, text: str, target_language: str, text_format: str = "text") -> TranslationResult:
+    def translate_many(
+        self, texts: Sequence[str], target_language: str, text_format: str = "text"
+    ) -> List[TranslationResult]:
         params = {"key": self.api_key}
         payload = {
-            "q": text,
+            "q": list(texts),
             "target": target_language.lower(),
             "format": "html" if text_format == "html" else "text",
         }
         try:
-            response = requests.post(self.api_url, params=params, json=payload, timeout=self.timeout)
+            response = self.session.post(self.api_url, params=params, json=payload, timeout=self.timeout)
             response.raise_for_status()
             data = response.json()
         except requests.RequestException as exc:
@@ -135,27 +228,59 @@ class GoogleTranslateProvider(BaseTranslationProvider):
             except Exception:
                 logger.exception("Google Translate error parsing failed")
             logger.exception("Google Translate request failed")
-            raise TranslationProviderError(error_detail) from exc
+            raise _request_error(error_detail, exc) from exc
 
         translations = (data.get("data") or {}).get("translations") or []
-        if not translations:
+        if len(translations) != len(texts):
             raise TranslationProviderError("Google Translate non ha restituito risultati")
 
-        entry = translations[0]
-        detected = entry.get("detectedSourceLanguage")
-        translated_text = entry.get("translatedText", "")
-        return TranslationResult(
-            text=html.unescape(translated_text),
-            provider=self.name,
-            detected_source_language=detected.lower() if isinstance(detected, str) else None,
-        )
+        results = []
+        for entry in translations:
+            detected = entry.get("detectedSourceLanguage")
+            results.append(TranslationResult(
+                text=html.unescape(entry.get("translatedText", "")),
+                provider=self.name,
+                detected_source_language=detected.lower() if isinstance(detected, str) else None,
+            ))
+        return results
+
+
+_providers: Optional[Dict[str, BaseTranslationProvider]] = None
+_providers_lock = threading.Lock()
+
+
+def _get_providers() -> Dict[str, BaseTranslationProvider]:
+    """Long-lived provider instances (and their connection pools), built on first use."""
+    global _providers
+    providers = _providers
+    if providers is None:
+        with _providers_lock:
+            if _providers is None:
+                _providers = {
+                    "deepl": DeepLTranslationProvider(),
+                    "google": GoogleTranslateProvider(),
+                }
+            providers = _providers
+    return providers
+
+
+def reset_translation_providers() -> None:
+    """Closes the pooled sessions; providers are rebuilt from settings on next use."""
+    global _providers
+    with _providers_lock:
+        providers, _providers = _providers, None
+    for provider in (providers or {}).values():
+        provider.close()
+
+
+@receiver(setting_changed)
+def _reconfigure_providers(setting, **kwargs):
+    if setting in PROVIDER_SETTINGS:
+        reset_translation_providers()
 
 
 def _get_provider_chain() -> List[BaseTranslationProvider]:
-    providers_map = {
-        "deepl": DeepLTranslationProvider(),
-        "google": GoogleTranslateProvider(),
-    }
+    providers_map = _get_providers()
     priority = [name.strip().lower() for name in getattr(settings, "TRANSLATION_PROVIDER_PRIORITY", ["deepl", "google"])]
     ordered = []
     for provider_name in priority:
@@ -165,8 +290,20 @@ def _get_provider_chain() -> List[BaseTranslationProvider]:
     return ordered
 
 
-def translate_text(text: str, target_language: str, text_format: str = "text") -> TranslationResult:
-    if not text.strip():
+def translate_texts(
+    texts: Sequence[str], target_language: str, text_format: str = "text"
+) -> List[TranslationResult]:
+    """
+    Translates several texts with as few upstream requests as possible: each
+    provider receives them in chunks of its max_batch_size. Results keep the
+    order of `texts`; if a provider fails the whole list moves to the next one.
+
+    Providers whose circuit breaker is open are skipped without a request and
+    slow ones are tried last (see provider_health.py).
+    """
+    if not texts:
+        return []
+    if any(not text.strip() for text in texts):
         raise TranslationProviderError("Il messaggio è vuoto, impossibile tradurre")
 
     normalized_language = normalize_language_code(target_language)
@@ -178,25 +315,236 @@ def translate_text(text: str, target_language: str, text_format: str = "text") -
         raise TranslationServiceNotConfigured("Nessun provider di traduzione configurato")
 
     last_error: Optional[Exception] = None
-    for provider in provider_chain:
+    for provider, health in provider_health.route_providers(provider_chain):
+        if health.state == provider_health.OPEN or (
+            health.state == provider_health.HALF_OPEN and not provider_health.acquire_probe(provider.name)
+        ):
+            provider_health.count(provider.name, "short_circuits")
+            continue
+        # Only a provider with recorded failures has breaker state to clear
+        clear_failures = bool(health.failures)
         try:
-            return provider.translate(text=text, target_language=normalized_language, text_format=text_format)
+            results: List[TranslationResult] = []
+            for start in range(0, len(texts), provider.max_batch_size):
+                started = time.monotonic()
+                results.extend(provider.translate_many(
+                    texts[start:start + provider.max_batch_size],
+                    target_language=normalized_language,
+                    text_format=text_format,
+                ))
+                provider_health.record_success(provider.name, time.monotonic() - started, clear_failures)
+                clear_failures = False
+        except TranslationRequestRejected as exc:
+            last_error = exc
+            provider_health.record_success(provider.name, clear_failures=clear_failures)
+            logger.warning("Translation rejected by provider %s", provider.name, exc_info=True)
+            continue
         except TranslationProviderError as exc:
             last_error = exc
+            provider_health.record_failure(provider.name)
             logger.warning("Translation failed with provider %s", provider.name, exc_info=True)
             continue
+        if provider is not provider_chain[0]:
+            provider_health.count(provider.name, "fallbacks")
+        return results
 
     if last_error:
         raise TranslationProviderError(str(last_error))
-    raise TranslationProviderError("Impossibile completare la traduzione")
+    # Every provider skipped by its breaker
+    raise TranslationProviderError("Servizio di traduzione temporaneamente non disponibile")
+
+
+def translate_text(text: str, target_language: str, text_format: str = "text") -> TranslationResult:
+    return translate_texts([text], target_language, text_format=text_format)[0]
+
+
+MemoKey = Tuple[str, str, str]
+
+
+class _TranslationLRU:
+    """Small thread-safe LRU in front of the TranslationMemo table."""
+
+    def __init__(self) -> None:
+        self._entries: "OrderedDict[MemoKey, TranslationResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: MemoKey) -> Optional[TranslationResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def set(self, key: MemoKey, result: TranslationResult) -> None:
+        max_size = getattr(settings, "TRANSLATION_MEMO_LRU_SIZE", 2048)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_memo_lru = _TranslationLRU()
+
+
+def translation_memo_key(text: str, target_language: str, text_format: str = "text") -> MemoKey:
+    """Memo key: (sha256 of the source text, normalized target language, text format)."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digest, normalize_language_code(target_language), text_format
+
+
+def get_memoized_translations(
+    texts: Sequence[str], target_language: str, text_format: str = "text"
+) -> Dict[str, TranslationResult]:
+    """
+    Returns previous translations of the given texts (from any message, post or
+    card), keyed by source text. The in-process LRU is checked first; the
+    remaining texts are looked up in the TranslationMemo table with one query.
+    """
+    found: Dict[str, TranslationResult] = {}
+    missing: Dict[str, str] = {}
+    for text in set(texts):
+        if not text or not text.strip():
+            continue
+        key = translation_memo_key(text, target_language, text_format)
+        result = _memo_lru.get(key)
+        if result is not None:
+            found[text] = result
+        else:
+            missing[key[0]] = text
+    if not missing:
+        return found
+
+    language = normalize_language_code(target_language)
+    rows = TranslationMemo.objects.filter(
+        source_hash__in=missing, target_language=language, text_format=text_format
+    ).values_list("source_hash", "translated_text", "provider", "detected_source_language")
+    for source_hash, translated_text, provider, detected in rows:
+        result = TranslationResult(text=translated_text, provider=provider, detected_source_language=detected)
+        found[missing[source_hash]] = result
+        _memo_lru.set((source_hash, language, text_format), result)
+    return found
+
+
+def memoize_translations(
+    translations: Dict[str, TranslationResult], target_language: str, text_format: str = "text"
+) -> None:
+    """Stores provider results (source text -> result) so later requests skip the provider."""
+    rows = []
+    for text, result in translations.items():
+        if not text or not text.strip():
+            continue
+        key = translation_memo_key(text, target_language, text_format)
+        rows.append(TranslationMemo(
+            source_hash=key[0],
+            target_language=key[1],
+            text_format=key[2],
+            translated_text=result.text,
+            provider=result.provider,
+            detected_source_language=result.detected_source_language,
+        ))
+        _memo_lru.set(key, result)
+    if rows:
+        TranslationMemo.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def get_memoized_translation(
+    text: str, target_language: str, text_format: str = "text"
+) -> Optional[TranslationResult]:
+    return get_memoized_translations([text], target_language, text_format).get(text)
+
+
+def memoize_translation(
+    text: str, target_language: str, result: TranslationResult, text_format: str = "text"
+) -> None:
+    memoize_translations({text: result}, target_language, text_format)
+
+
+def translate_segments(
+    segments: Sequence[Tuple[str, str]], target_language: str
+) -> List[TranslationResult]:
+    """
+    Translates the fields of one object, given as (text, text_format) pairs, in
+    about one provider round-trip: memo hits are resolved first, the remaining
+    texts of each format go out as one multi-text request, and when several
+    formats are involved (e.g. plain title and HTML body) those requests run
+    concurrently. Results keep the order of `segments`.
+    """
+    by_format: Dict[str, List[str]] = {}
+    for text, text_format in segments:
+        by_format.setdefault(text_format, []).append(text)
+
+    found = {
+        text_format: get_memoized_translations(texts, target_language, text_format)
+        for text_format, texts in by_format.items()
+    }
+    misses = {}
+    for text_format, texts in by_format.items():
+        pending = list(dict.fromkeys(text for text in texts if text not in found[text_format]))
+        if pending:
+            misses[text_format] = pending
+
+    if len(misses) > 1:
+        # Only the provider calls run in the pool; memo reads and writes stay on this thread
+        with ThreadPoolExecutor(max_workers=len(misses)) as pool:
+            futures = {
+                text_format: pool.submit(translate_texts, texts, target_language, text_format)
+                for text_format, texts in misses.items()
+            }
+            translated = {text_format: future.result() for text_format, future in futures.items()}
+    else:
+        translated = {
+            text_format: translate_texts(texts, target_language, text_format=text_format)
+            for text_format, texts in misses.items()
+        }
+
+    for text_format, results in translated.items():
+        new_entries = dict(zip(misses[text_format], results))
+        memoize_translations(new_entries, target_language, text_format)
+        found[text_format].update(new_entries)
+    return [found[text_format][text] for text, text_format in segments]
+
+
+def translate_texts_memoized(
+    texts: Sequence[str], target_language: str, text_format: str = "text"
+) -> List[TranslationResult]:
+    """
+    translate_texts() backed by the shared translation memo: known texts are read
+    from the memo, the distinct misses go to the provider in one batch.
+    """
+    return translate_segments([(text, text_format) for text in texts], target_language)
+
+
+def translate_text_memoized(text: str, target_language: str, text_format: str = "text") -> TranslationResult:
+    """translate_text() backed by the shared translation memo."""
+    return translate_texts_memoized([text], target_language, text_format)[0]
+
+
+def clear_translation_lru() -> None:
+    """Empties the in-process LRU (the TranslationMemo table is untouched)."""
+    _memo_lru.clear()
 
 
 __all__ = [
+    "get_memoized_translation",
+    "get_memoized_translations",
+    "memoize_translation",
+    "memoize_translations",
     "translate_text",
+    "translate_text_memoized",
+    "translate_segments",
+    "translate_texts",
+    "translate_texts_memoized",
     "TranslationResult",
     "TranslationServiceError",
     "TranslationServiceNotConfigured",
     "TranslationProviderError",
+    "TranslationRequestRejected",
     "normalize_language_code",
+    "reset_translation_providers",
     "supported_languages",
 ]
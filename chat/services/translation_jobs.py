@@ -0,0 +1,150 @@
+"""
+Traduzioni asincrone: l'endpoint registra un TranslationJob e risponde 202,
+un pool di thread del processo esegue la traduzione e il risultato arriva al
+richiedente come evento translation.ready sul gruppo user_{id}.
+
+Il pool (TRANSLATION_JOB_WORKERS thread) tiene i worker delle richieste liberi
+dalle chiamate ai provider; al più TRANSLATION_PROVIDER_CONCURRENCY job del pool
+chiamano i provider contemporaneamente. Il limite vale solo per il pool: le
+traduzioni sincrone non aspettano mai che un job lento liberi un posto.
+I job rimasti in sospeso dopo un riavvio si recuperano con
+`python manage.py run_translation_jobs`.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ..models import TranslationJob
+from .translation import TranslationServiceError
+
+logger = logging.getLogger(__name__)
+
+# Gestore per tipo di contenuto: riceve il job e restituisce la traduzione serializzata
+JOB_HANDLERS = {
+    "message": "chat.services.message_translations.run_message_translation_job",
+    "post": "forum.services.translation.run_post_translation_job",
+    "card": "section.services.translation.run_card_translation_job",
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_job_slots: Optional[threading.BoundedSemaphore] = None
+_executor_lock = threading.Lock()
+
+
+def async_mode_requested(request) -> bool:
+    """True se il client chiede la modalità job (mode=async nel body o nella query)."""
+    mode = request.data.get("mode") or request.query_params.get("mode")
+    return mode == "async"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _job_slots
+    with _executor_lock:
+        if _executor is None:
+            _job_slots = threading.BoundedSemaphore(settings.TRANSLATION_PROVIDER_CONCURRENCY)
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TRANSLATION_JOB_WORKERS,
+                thread_name_prefix="translation-job",
+            )
+        return _executor
+
+
+def enqueue_translation_job(user_id: int, kind: str, object_id, target_language: str) -> TranslationJob:
+    """Registra il job; l'esecuzione parte dopo il commit della transazione corrente."""
+    job = TranslationJob.objects.create(
+        user_id=user_id,
+        kind=kind,
+        object_id=str(object_id),
+        target_language=target_language,
+    )
+    transaction.on_commit(lambda: submit_translation_job(job.id))
+    return job
+
+
+def submit_translation_job(job_id) -> None:
+    """Affida il job al pool; con TRANSLATION_JOB_WORKERS=0 lo esegue subito (sviluppo e test)."""
+    if settings.TRANSLATION_JOB_WORKERS <= 0:
+        run_translation_job(job_id)
+    else:
+        _get_executor().submit(_run_in_worker, job_id)
+
+
+def _run_in_worker(job_id) -> None:
+    close_old_connections()
+    try:
+        with _job_slots:
+            run_translation_job(job_id)
+    except Exception:
+        logger.exception("Translation job %s crashed", job_id)
+    finally:
+        close_old_connections()
+
+
+def run_translation_job(job_id) -> Optional[TranslationJob]:
+    """
+    Esegue il job se è ancora in attesa (l'aggiornamento condizionale evita che
+    due worker lo eseguano entrambi), salva l'esito e notifica il richiedente.
+    """
+    claimed = TranslationJob.objects.filter(
+        id=job_id, status=TranslationJob.STATUS_PENDING
+    ).update(status=TranslationJob.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        return None
+
+    job = TranslationJob.objects.get(id=job_id)
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        job.result = handler(job)
+        job.status = TranslationJob.STATUS_DONE
+    except TranslationServiceError as exc:
+        job.status = TranslationJob.STATUS_FAILED
+        job.error = str(exc)
+    except ObjectDoesNotExist:
+        job.status = TranslationJob.STATUS_FAILED
+        job.error = "Contenuto non trovato."
+    except Exception:
+        logger.exception("Translation job %s failed", job.id)
+        job.status = TranslationJob.STATUS_FAILED
+        job.error = "Impossibile completare la traduzione"
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "error", "finished_at"])
+    notify_translation_ready(job)
+    return job
+
+
+def translation_job_payload(job: TranslationJob) -> dict:
+    """Stato del job come inviato ai client (evento translation.ready e GET del job)."""
+    return {
+        "job_id": str(job.id),
+        "kind": job.kind,
+        "object_id": job.object_id,
+        "target_language": job.target_language,
+        "status": job.status,
+        "data": job.result,
+        "error": job.error or None,
+    }
+
+
+def notify_translation_ready(job: TranslationJob) -> None:
+    """Invia translation.ready al gruppo user_{id} del richiedente."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            f"user_{job.user_id}",
+            {"type": "translation.ready", **translation_job_payload(job)},
+        )
+    except Exception:
+        logger.exception("Translation job %s notification failed", job.id)
@@ -0,0 +1,78 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import ChatParticipant, Message
+
+
+def get_unread_counts_for_user(user_id: int) -> dict:
+    """
+    Restituisce { chat_id: { unread_count, chat_type } } per tutte le chat
+    dell'utente con messaggi non letti, letti dal contatore denormalizzato.
+    """
+    rows = (
+        ChatParticipant.objects.filter(user_id=user_id, unread_count__gt=0)
+        .values_list("chat_id", "chat__chat_type", "unread_count")
+    )
+    return {
+        str(chat_id): {"unread_count": unread, "chat_type": chat_type}
+        for chat_id, chat_type, unread in rows
+    }
+
+
+def get_unread_count(chat_id, user_id: int) -> int:
+    """Conteggio non letti di un singolo partecipante (0 se non partecipa)."""
+    count = (
+        ChatParticipant.objects.filter(chat_id=chat_id, user_id=user_id)
+        .values_list("unread_count", flat=True)
+        .first()
+    )
+    return count or 0
+
+
+def get_recipient_unread_counts(chat_id, sender_id: int) -> dict:
+    """Restituisce { user_id: unread_count } per tutti i partecipanti tranne il mittente."""
+    return dict(
+        ChatParticipant.objects.filter(chat_id=chat_id)
+        .exclude(user_id=sender_id)
+        .values_list("user_id", "unread_count")
+    )
+
+
+def increment_unread_counts(chat_id, sender_id: int) -> int:
+    """Incrementa atomicamente il contatore di tutti i partecipanti tranne il mittente."""
+    return (
+        ChatParticipant.objects.filter(chat_id=chat_id)
+        .exclude(user_id=sender_id)
+        .update(unread_count=F("unread_count") + 1)
+    )
+
+
+def mark_chat_read(chat_id, user_id: int) -> int:
+    """Segna la chat come letta per l'utente e azzera il contatore."""
+    return ChatParticipant.objects.filter(chat_id=chat_id, user_id=user_id).update(
+        last_read_at=timezone.now(),
+        unread_count=0,
+    )
+
+
+def rebuild_unread_counts(queryset=None) -> int:
+    """
+    Ricalcola unread_count a partire da last_read_at (o joined_at) con un
+    singolo UPDATE correlato. Restituisce il numero di righe aggiornate.
+    """
+    if queryset is None:
+        queryset = ChatParticipant.objects.all()
+
+    unread = (
+        Message.objects.filter(
+            chat_id=OuterRef("chat_id"),
+            created_at__gt=Coalesce(OuterRef("last_read_at"), OuterRef("joined_at")),
+        )
+        .exclude(sender_id=OuterRef("user_id"))
+        .order_by()
+        .values("chat_id")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return queryset.update(unread_count=Coalesce(Subquery(unread), 0))
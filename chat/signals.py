@@ -1,57 +1,129 @@
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import m2m_changed, post_init, post_save
+from django.db.models import Q
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Chat, ChatParticipant
+from .models import Chat, ChatParticipant, Message
+from .services.realtime import MEMBERSHIP_ADDED, notify_membership_changed
+from .services.unread import increment_unread_counts
 
 User = get_user_model()
 
+def _gemellaggio_state(user):
+    """
+    (club_id, user_type) letti da __dict__, per non innescare query
+    sui campi differiti (only()/defer()). None se non caricati.
+    """
+    state = user.__dict__
+    if "club_id" not in state or "user_type" not in state:
+        return None
+    return state["club_id"], state["user_type"]
+
+
+@receiver(post_init, sender=User)
+def remember_user_club(sender, instance, **kwargs):
+    """Memorizza club e tipo utente caricati, per riconoscere i salvataggi che li cambiano."""
+    instance._gemellaggio_state = _gemellaggio_state(instance)
+
+
 @receiver(post_save, sender=User)
-def sync_user_gemellaggi(sender, instance, created, **kwargs):
+def sync_user_gemellaggi(sender, instance, created, update_fields=None, **kwargs):
     """
     When a user is assigned to a club, add them to all existing Gemellaggio chats of that club.
+    Saves that don't touch the club (or user type) are skipped without queries.
     """
-    if instance.user_type == User.Types.NORMAL and instance.club:
-        # Find all gemellaggi involving this club
-        gemellaggi = Chat.objects.filter(
-            chat_type='gemellaggio',
-            related_clubs=instance.club
-        )
-        
-        for chat in gemellaggi:
-            ChatParticipant.objects.get_or_create(
-                chat=chat,
-                user=instance,
-                defaults={'role': 'member'}
-            )
+    if update_fields is not None and not {"club", "user_type"} & set(update_fields):
+        return
+
+    current = _gemellaggio_state(instance)
+    previous = getattr(instance, "_gemellaggio_state", None)
+    instance._gemellaggio_state = current
+    if not created and current is not None and current == previous:
+        return
+
+    if instance.user_type != User.Types.NORMAL or not instance.club_id:
+        return
+
+    # Gemellaggi del club in cui l'utente non è ancora partecipante
+    missing_chats = list(
+        Chat.objects.filter(chat_type='gemellaggio', related_clubs=instance.club_id)
+        .exclude(chat_participants__user=instance)
+        .values_list('id', 'chat_type')
+    )
+    if not missing_chats:
+        return
+
+    ChatParticipant.objects.bulk_create(
+        [ChatParticipant(chat_id=chat_id, user=instance, role='member') for chat_id, _ in missing_chats],
+        ignore_conflicts=True,
+    )
+    # bulk_create non emette segnali: le notifiche vanno inviate esplicitamente
+    for chat_id, chat_type in missing_chats:
+        notify_membership_changed(chat_id, chat_type, [instance.id], MEMBERSHIP_ADDED)
 
 @receiver(m2m_changed, sender=Chat.related_clubs.through)
 def sync_club_gemellaggi(sender, instance, action, reverse, model, pk_set, **kwargs):
     """
     When clubs are added to a Gemellaggio, add all their members to the chat.
+    The membership diff is computed in memory and written with bulk operations,
+    so the number of queries does not depend on the size of the clubs.
+    """
+    if action != "post_add" or not pk_set:
+        return
+    chat = instance
+    if chat.chat_type != 'gemellaggio':
+        return
+
+    existing = dict(
+        ChatParticipant.objects.filter(chat=chat).values_list('user_id', 'role')
+    )
+
+    # Add the clubs themselves as admins
+    new_admin_ids = [club_id for club_id in pk_set if club_id not in existing]
+    promoted_ids = [
+        club_id for club_id in pk_set
+        if club_id in existing and existing[club_id] != 'admin'
+    ]
+    if promoted_ids:
+        ChatParticipant.objects.filter(chat=chat, user_id__in=promoted_ids).update(role='admin')
+
+    # Add only normal users subscribed to either club
+    member_ids = User.objects.filter(
+        user_type=User.Types.NORMAL,
+        club_id__in=pk_set,
+    ).values_list('id', flat=True)
+    new_member_ids = [
+        user_id for user_id in member_ids
+        if user_id not in existing and user_id not in pk_set
+    ]
+
+    ChatParticipant.objects.bulk_create(
+        [ChatParticipant(chat=chat, user_id=user_id, role='admin') for user_id in new_admin_ids]
+        + [ChatParticipant(chat=chat, user_id=user_id, role='member') for user_id in new_member_ids],
+        ignore_conflicts=True,
+    )
+
+    # bulk_create non emette segnali: le notifiche vanno inviate esplicitamente
+    notify_membership_changed(
+        chat.id, chat.chat_type, new_admin_ids + new_member_ids, MEMBERSHIP_ADDED
+    )
+
+
+@receiver(post_save, sender=Message)
+def bump_unread_counts(sender, instance, created, **kwargs):
+    """
+    When a message is created, increment the unread counter of every other participant.
+    """
+    if created:
+        increment_unread_counts(instance.chat_id, instance.sender_id)
+
+
+@receiver(post_save, sender=Message)
+def update_chat_last_message(sender, instance, created, **kwargs):
+    """
+    Keep the denormalised inbox preview (Chat.last_message / last_message_at) in sync.
+    Runs in the same transaction as the message insert.
     """
-    if action == "post_add":
-        chat = instance
-        if chat.chat_type == 'gemellaggio':
-            # Get the added clubs
-            clubs = model.objects.filter(pk__in=pk_set)
-            
-            # Add the clubs themselves as admins
-            for club in clubs:
-                ChatParticipant.objects.update_or_create(
-                    chat=chat,
-                    user=club,
-                    defaults={'role': 'admin'}
-                )
-            
-            # Add only normal users subscribed to either club
-            members = User.objects.filter(
-                user_type=User.Types.NORMAL,
-                club__in=clubs
-            )
-            
-            for member in members:
-                ChatParticipant.objects.get_or_create(
-                    chat=chat,
-                    user=member,
-                    defaults={'role': 'member'}
-                )
+    if created:
+        Chat.objects.filter(pk=instance.chat_id).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=instance.created_at)
+        ).update(last_message=instance, last_message_at=instance.created_at)
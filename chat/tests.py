@@ -1,4 +1,4 @@
-from django.test import TestCase, TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from channels.testing import WebsocketCommunicator
 from channels.layers import get_channel_layer
@@ -9,11 +9,16 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from unittest.mock import patch
 from .models import Chat, Message, ChatParticipant, MessageTranslation
 from .services.translation import (
+    BaseTranslationProvider,
     TranslationProviderError,
     TranslationResult,
     TranslationServiceNotConfigured,
+    clear_translation_lru,
 )
 import json
+import threading
+import uuid
+from io import StringIO
 
 User = get_user_model()
 
@@ -357,6 +362,7 @@ class MessageViewSetTest(APITestCase):
 
 class MessageTranslationAPITest(APITestCase):
     def setUp(self):
+        clear_translation_lru()
         self.client = APIClient()
         self.user1 = User.objects.create_user(
             username="user1", email="user1@test.com", password="testpass123"
@@ -443,3 +449,1709 @@ class MessageTranslationAPITest(APITestCase):
             MessageTranslation.objects.filter(message=other_message, target_language='en').count(),
             1,
         )
+
+    @patch('chat.views.translate_text')
+    def test_translate_reuses_memo_from_database(self, mock_translate):
+        from .models import TranslationMemo
+
+        mock_translate.return_value = TranslationResult(text='Hello world', provider='deepl', detected_source_language='it')
+        self.client.post(self.url, {'target_language': 'en'}, format='json')
+        self.assertEqual(TranslationMemo.objects.count(), 1)
+        mock_translate.reset_mock()
+
+        # Un altro processo: LRU vuota, la memoria è letta dalla tabella
+        clear_translation_lru()
+        other_message = Message.objects.create(chat=self.chat, sender=self.user1, body='Ciao mondo')
+        other_url = f"/api/chats/{self.chat.id}/messages/{other_message.id}/translate/"
+        with patch('chat.services.translation._memo_lru.set') as lru_set:
+            response = self.client.post(other_url, {'target_language': 'en'}, format='json')
+        self.assertEqual(response.data['translated_text'], 'Hello world')
+        lru_set.assert_called_once()
+        mock_translate.assert_not_called()
+
+    def test_memoized_translation_shared_with_posts_and_cards(self):
+        from .services.translation import memoize_translation, translate_text_memoized
+
+        memoize_translation('Ciao mondo', 'en', TranslationResult(text='Hello world', provider='google'))
+        clear_translation_lru()
+        with patch('chat.services.translation.translate_texts') as provider_call:
+            provider_call.return_value = [TranslationResult(text='<p>Hello world</p>', provider='google')]
+            result = translate_text_memoized('Ciao mondo', 'EN')
+            html_call = translate_text_memoized('Ciao mondo', 'en', text_format='html')
+        self.assertEqual(result.text, 'Hello world')
+        self.assertEqual(provider_call.call_count, 1)
+        self.assertEqual(html_call.text, '<p>Hello world</p>')
+
+
+class UnreadCountsQueryTest(TestCase):
+    """Test per il calcolo aggregato dei conteggi non letti."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.sender = User.objects.create_user(
+            username="sender", email="sender@test.com", password="testpass123"
+        )
+
+    def test_unread_counts_single_query_with_200_chats(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .services.unread import get_unread_counts_for_user, rebuild_unread_counts
+
+        joined_at = timezone.now() - timedelta(days=1)
+        chats = Chat.objects.bulk_create(
+            [Chat(chat_type='group', name=f"Gruppo {i}") for i in range(200)]
+        )
+        ChatParticipant.objects.bulk_create(
+            [ChatParticipant(chat=chat, user=self.user, joined_at=joined_at) for chat in chats]
+        )
+        messages = []
+        for index, chat in enumerate(chats):
+            # Una chat su due ha messaggi non letti (2 dall'altro utente + 1 proprio)
+            if index % 2 == 0:
+                messages.append(Message(chat=chat, sender=self.sender, body="a"))
+                messages.append(Message(chat=chat, sender=self.sender, body="b"))
+                messages.append(Message(chat=chat, sender=self.user, body="mio"))
+        Message.objects.bulk_create(messages)
+
+        # Messaggi precedenti all'ultima lettura non vengono contati
+        ChatParticipant.objects.filter(chat=chats[0], user=self.user).update(
+            last_read_at=timezone.now() + timedelta(seconds=1)
+        )
+
+        # bulk_create non emette post_save: riallinea i contatori denormalizzati
+        rebuild_unread_counts()
+
+        with self.assertNumQueries(1):
+            counts = get_unread_counts_for_user(self.user.id)
+
+        self.assertEqual(len(counts), 99)
+        self.assertNotIn(str(chats[0].id), counts)
+        self.assertEqual(counts[str(chats[2].id)], {"unread_count": 2, "chat_type": "group"})
+        self.assertNotIn(str(chats[1].id), counts)
+
+    def test_message_creation_bumps_counter_and_mark_read_resets_it(self):
+        from .services.unread import mark_chat_read
+
+        chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=chat, user=self.user)
+        ChatParticipant.objects.create(chat=chat, user=self.sender)
+
+        Message.objects.create(chat=chat, sender=self.sender, body="uno")
+        Message.objects.create(chat=chat, sender=self.sender, body="due")
+
+        reader = ChatParticipant.objects.get(chat=chat, user=self.user)
+        sender = ChatParticipant.objects.get(chat=chat, user=self.sender)
+        self.assertEqual(reader.unread_count, 2)
+        self.assertEqual(sender.unread_count, 0)
+
+        mark_chat_read(chat.id, self.user.id)
+        reader.refresh_from_db()
+        self.assertEqual(reader.unread_count, 0)
+        self.assertIsNotNone(reader.last_read_at)
+
+    def test_rebuild_command_restores_counter(self):
+        from django.core.management import call_command
+
+        chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=chat, user=self.user)
+        ChatParticipant.objects.create(chat=chat, user=self.sender)
+        Message.objects.create(chat=chat, sender=self.sender, body="uno")
+        ChatParticipant.objects.filter(chat=chat).update(unread_count=42)
+
+        call_command("rebuild_unread_counts", stdout=StringIO())
+
+        self.assertEqual(ChatParticipant.objects.get(chat=chat, user=self.user).unread_count, 1)
+        self.assertEqual(ChatParticipant.objects.get(chat=chat, user=self.sender).unread_count, 0)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class GlobalChatConsumerTest(TransactionTestCase):
+    """Test per il GlobalChatConsumer (ws/global/)"""
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username="sender", email="sender@test.com", password="testpass123"
+        )
+        self.recipients = [
+            User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@test.com", password="testpass123"
+            )
+            for i in range(3)
+        ]
+        self.chat = Chat.objects.create(chat_type='gemellaggio', name="Gemellaggio")
+        ChatParticipant.objects.create(chat=self.chat, user=self.sender, role='admin')
+        for user in self.recipients:
+            ChatParticipant.objects.create(chat=self.chat, user=user)
+
+    def _connect(self, user, query=""):
+        from backend.asgi import application
+
+        token = str(RefreshToken.for_user(user).access_token)
+        return WebsocketCommunicator(application, f"/ws/global/?token={token}{query}")
+
+    async def test_send_message_fans_out_unread_updates(self):
+        sender_ws = self._connect(self.sender)
+        recipient_ws = self._connect(self.recipients[0])
+        self.assertTrue((await sender_ws.connect())[0])
+        self.assertTrue((await recipient_ws.connect())[0])
+        self.assertEqual((await sender_ws.receive_json_from())["type"], "init")
+        self.assertEqual((await recipient_ws.receive_json_from())["type"], "init")
+
+        await sender_ws.send_json_to({
+            "type": "message.send",
+            "chat_id": str(self.chat.id),
+            "body": "Ciao a tutti",
+        })
+
+        ack = await sender_ws.receive_json_from(timeout=5)
+        self.assertEqual(ack["type"], "new_message")
+        self.assertEqual(ack["data"]["body"], "Ciao a tutti")
+
+        frames = [
+            await recipient_ws.receive_json_from(timeout=5),
+            await recipient_ws.receive_json_from(timeout=5),
+        ]
+        unread = next(frame for frame in frames if frame["type"] == "unread_update")
+        self.assertEqual(unread["chat_id"], str(self.chat.id))
+        self.assertEqual(unread["chat_type"], "gemellaggio")
+        self.assertEqual(unread["unread_count"], 1)
+        self.assertTrue(any(frame["type"] == "new_message" for frame in frames))
+
+        await sender_ws.disconnect()
+        await recipient_ws.disconnect()
+
+
+    async def test_membership_events_refresh_consumer_cache(self):
+        from .services.realtime import MEMBERSHIP_ADDED, MEMBERSHIP_REMOVED, notify_membership_changed
+
+        outsider = await database_sync_to_async(User.objects.create_user)(
+            username="outsider", email="outsider@test.com", password="testpass123"
+        )
+        other_chat = await database_sync_to_async(Chat.objects.create)(chat_type='group', name="Altro")
+        await database_sync_to_async(ChatParticipant.objects.create)(
+            chat=other_chat, user=self.sender, role='admin'
+        )
+
+        outsider_ws = self._connect(outsider)
+        sender_ws = self._connect(self.sender)
+        self.assertTrue((await outsider_ws.connect())[0])
+        self.assertTrue((await sender_ws.connect())[0])
+        await outsider_ws.receive_json_from()
+        await sender_ws.receive_json_from()
+
+        @database_sync_to_async
+        def add_outsider():
+            ChatParticipant.objects.create(chat=other_chat, user=outsider)
+            notify_membership_changed(other_chat.id, other_chat.chat_type, [outsider.id], MEMBERSHIP_ADDED)
+
+        await add_outsider()
+
+        # Il socket dell'utente aggiunto entra nel gruppo della chat senza chat.join
+        await sender_ws.send_json_to({"type": "message.send", "chat_id": str(other_chat.id), "body": "Benvenuto"})
+        await sender_ws.receive_json_from(timeout=5)
+        frames = [
+            await outsider_ws.receive_json_from(timeout=5),
+            await outsider_ws.receive_json_from(timeout=5),
+        ]
+        self.assertIn("new_message", [frame["type"] for frame in frames])
+
+        @database_sync_to_async
+        def remove_outsider():
+            ChatParticipant.objects.filter(chat=other_chat, user=outsider).delete()
+            notify_membership_changed(other_chat.id, other_chat.chat_type, [outsider.id], MEMBERSHIP_REMOVED)
+
+        await remove_outsider()
+
+        await outsider_ws.send_json_to({"type": "message.send", "chat_id": str(other_chat.id), "body": "Ciao"})
+        error = await outsider_ws.receive_json_from(timeout=5)
+        self.assertEqual(error["type"], "error")
+
+        await outsider_ws.disconnect()
+        await sender_ws.disconnect()
+
+    async def test_non_canonical_chat_id_does_not_survive_removal(self):
+        from .services.messages import message_history_payload
+        from .services.realtime import MEMBERSHIP_REMOVED, notify_membership_changed
+
+        member = self.recipients[0]
+        upper_id = str(self.chat.id).upper()
+        ws = self._connect(member)
+        self.assertTrue((await ws.connect())[0])
+        await ws.receive_json_from()
+
+        await ws.send_json_to({"type": "history.fetch", "chat_id": upper_id})
+        frame = await ws.receive_json_from(timeout=5)
+        self.assertEqual((frame["type"], frame["chat_id"]), ("history", str(self.chat.id)))
+
+        @database_sync_to_async
+        def remove_member_and_post():
+            ChatParticipant.objects.filter(chat=self.chat, user=member).delete()
+            notify_membership_changed(self.chat.id, self.chat.chat_type, [member.id], MEMBERSHIP_REMOVED)
+            Message.objects.create(chat=self.chat, sender=self.sender, body="Dopo la rimozione")
+
+        await remove_member_and_post()
+
+        for chat_id in (upper_id, str(self.chat.id).replace("-", "")):
+            await ws.send_json_to({"type": "history.fetch", "chat_id": chat_id})
+            frame = await ws.receive_json_from(timeout=5)
+            self.assertEqual(frame["type"], "error")
+
+        await ws.send_json_to({"type": "history.fetch", "chat_id": "non-un-uuid"})
+        self.assertEqual(await ws.receive_json_from(timeout=5), {"type": "error", "message": "chat_id non valido"})
+
+        # Anche con una cache di appartenenza non aggiornata la lettura sul database è vuota
+        page = await database_sync_to_async(message_history_payload)(self.chat.id, user_id=member.id)
+        self.assertEqual(page["data"], [])
+        await ws.disconnect()
+
+    async def test_presence_calls_run_off_the_database_thread(self):
+        threads = []
+
+        def record(user_id):
+            threads.append(threading.current_thread())
+
+        with patch('chat.consumers.mark_user_connected', record), patch('chat.consumers.mark_user_disconnected', record):
+            ws = self._connect(self.sender)
+            self.assertTrue((await ws.connect())[0])
+            await ws.receive_json_from()
+            await ws.disconnect()
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    async def test_history_fetch_pages_backwards(self):
+        @database_sync_to_async
+        def create_history():
+            return [
+                Message.objects.create(chat=self.chat, sender=self.recipients[0], body=f"m{i}").id
+                for i in range(5)
+            ]
+
+        ids = await create_history()
+        ws = self._connect(self.sender)
+        self.assertTrue((await ws.connect())[0])
+        await ws.receive_json_from()
+
+        await ws.send_json_to({"type": "history.fetch", "chat_id": str(self.chat.id), "limit": 2})
+        page = await ws.receive_json_from(timeout=5)
+        self.assertEqual(page["type"], "history")
+        self.assertEqual([m["id"] for m in page["data"]], [ids[4], ids[3]])
+        self.assertTrue(page["has_more"])
+
+        await ws.send_json_to({
+            "type": "history.fetch",
+            "chat_id": str(self.chat.id),
+            "before_id": ids[1],
+            "limit": 2,
+        })
+        page = await ws.receive_json_from(timeout=5)
+        self.assertEqual([m["id"] for m in page["data"]], [ids[0]])
+        self.assertFalse(page["has_more"])
+
+        await ws.disconnect()
+
+    async def test_translate_batch_frame(self):
+        @database_sync_to_async
+        def create_messages():
+            clear_translation_lru()
+            return [
+                Message.objects.create(chat=self.chat, sender=self.recipients[0], body=body).id
+                for body in ("Ciao", "Buonasera")
+            ]
+
+        class ThreadRecordingProvider(FakeTranslationProvider):
+            def translate_many(self, texts, target_language, text_format="text"):
+                self.thread = threading.current_thread()
+                return super().translate_many(texts, target_language, text_format)
+
+        ids = await create_messages()
+        provider = ThreadRecordingProvider()
+        ws = self._connect(self.sender)
+        self.assertTrue((await ws.connect())[0])
+        await ws.receive_json_from()
+
+        with patch('chat.services.translation._get_provider_chain', return_value=[provider]):
+            await ws.send_json_to({
+                "type": "translate.batch",
+                "chat_id": str(self.chat.id),
+                "message_ids": ids,
+                "target_language": "EN",
+            })
+            frame = await ws.receive_json_from(timeout=5)
+
+        self.assertEqual(frame["type"], "translations")
+        self.assertEqual(frame["target_language"], "en")
+        self.assertEqual([row["translated_text"] for row in frame["data"]], ["[en] Buonasera", "[en] Ciao"])
+        self.assertEqual(provider.requests, [["Ciao", "Buonasera"]])
+        # La chiamata al provider non occupa il thread condiviso degli accessi al database
+        self.assertIsNot(provider.thread, threading.main_thread())
+        await ws.disconnect()
+
+    async def test_translation_ready_is_forwarded(self):
+        ws = self._connect(self.sender)
+        self.assertTrue((await ws.connect())[0])
+        await ws.receive_json_from()
+
+        await get_channel_layer().group_send(f"user_{self.sender.id}", {
+            "type": "translation.ready",
+            "job_id": "job-1",
+            "kind": "message",
+            "object_id": "5",
+            "target_language": "en",
+            "status": "done",
+            "data": {"translated_text": "Hello"},
+            "error": None,
+        })
+        frame = await ws.receive_json_from(timeout=5)
+        self.assertEqual(frame["type"], "translation_ready")
+        self.assertEqual(frame["job_id"], "job-1")
+        self.assertEqual(frame["data"], {"translated_text": "Hello"})
+        await ws.disconnect()
+
+    async def test_resent_client_msg_id_is_not_broadcast_twice(self):
+        sender_ws = self._connect(self.sender)
+        recipient_ws = self._connect(self.recipients[0])
+        self.assertTrue((await sender_ws.connect())[0])
+        self.assertTrue((await recipient_ws.connect())[0])
+        await sender_ws.receive_json_from()
+        await recipient_ws.receive_json_from()
+
+        frame = {
+            "type": "message.send",
+            "chat_id": str(self.chat.id),
+            "body": "Una volta sola",
+            "client_msg_id": "3f2b8c1e-8a4d-4e8b-9a57-2c1d0e6f9b10",
+        }
+        await sender_ws.send_json_to(frame)
+        first = await sender_ws.receive_json_from(timeout=5)
+        await recipient_ws.receive_json_from(timeout=5)
+        await recipient_ws.receive_json_from(timeout=5)
+
+        # Il client si riconnette e reinvia lo stesso frame
+        await sender_ws.send_json_to(frame)
+        second = await sender_ws.receive_json_from(timeout=5)
+        self.assertEqual(second["type"], "new_message")
+        self.assertEqual(second["data"]["id"], first["data"]["id"])
+        self.assertTrue(await recipient_ws.receive_nothing(timeout=0.2))
+
+        @database_sync_to_async
+        def state():
+            return (
+                Message.objects.filter(chat=self.chat).count(),
+                ChatParticipant.objects.get(chat=self.chat, user=self.recipients[0]).unread_count,
+            )
+
+        self.assertEqual(await state(), (1, 1))
+
+        await sender_ws.disconnect()
+        await recipient_ws.disconnect()
+
+    async def test_batch_mode_groups_broadcast_events(self):
+        sender_ws = self._connect(self.sender)
+        recipient_ws = self._connect(self.recipients[0], "&batch=300ms")
+        self.assertTrue((await sender_ws.connect())[0])
+        self.assertTrue((await recipient_ws.connect())[0])
+        await sender_ws.receive_json_from()
+        init = await recipient_ws.receive_json_from()
+        self.assertEqual(init["data"]["batch_ms"], 300)
+
+        for body in ("uno", "due"):
+            await sender_ws.send_json_to({"type": "message.send", "chat_id": str(self.chat.id), "body": body})
+            await sender_ws.receive_json_from(timeout=5)
+
+        events = []
+        while len([e for e in events if e["type"] == "new_message"]) < 2:
+            frame = await recipient_ws.receive_json_from(timeout=5)
+            self.assertEqual(frame["type"], "batch")
+            events.extend(frame["events"])
+
+        self.assertEqual(
+            [e["data"]["body"] for e in events if e["type"] == "new_message"], ["uno", "due"]
+        )
+        unread = [e for e in events if e["type"] == "unread_update"]
+        self.assertEqual(unread[-1]["unread_count"], 2)
+
+        await sender_ws.disconnect()
+        await recipient_ws.disconnect()
+
+    async def test_batch_mode_mark_read_is_not_overtaken_by_queued_unread(self):
+        import asyncio
+
+        sender_ws = self._connect(self.sender)
+        recipient_ws = self._connect(self.recipients[0], "&batch=200ms")
+        self.assertTrue((await sender_ws.connect())[0])
+        self.assertTrue((await recipient_ws.connect())[0])
+        await sender_ws.receive_json_from()
+        await recipient_ws.receive_json_from()
+
+        await sender_ws.send_json_to({"type": "message.send", "chat_id": str(self.chat.id), "body": "ciao"})
+        await sender_ws.receive_json_from(timeout=5)
+        # unread_update (1) ora in coda nel batch del destinatario
+        await asyncio.sleep(0.05)
+        await recipient_ws.send_json_to({"type": "mark_read", "chat_id": str(self.chat.id)})
+
+        events = []
+        while not await recipient_ws.receive_nothing(timeout=0.5):
+            frame = await recipient_ws.receive_json_from(timeout=5)
+            events.extend(frame["events"] if frame["type"] == "batch" else [frame])
+
+        self.assertEqual([e["unread_count"] for e in events if e["type"] == "unread_update"], [0])
+
+        await sender_ws.disconnect()
+        await recipient_ws.disconnect()
+
+    async def test_connect_rejects_expired_token_and_inactive_user(self):
+        from datetime import timedelta
+        from backend.asgi import application
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        expired = AccessToken.for_user(self.sender)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        ws = WebsocketCommunicator(application, f"/ws/global/?token={expired}")
+        self.assertEqual(await ws.connect(), (False, 4001))
+
+        ws = WebsocketCommunicator(application, "/ws/global/?token=non-un-jwt")
+        self.assertEqual(await ws.connect(), (False, 4002))
+
+        inactive = self.recipients[0]
+        token = str(RefreshToken.for_user(inactive).access_token)
+        inactive.is_active = False
+        await database_sync_to_async(inactive.save)()
+        ws = WebsocketCommunicator(application, f"/ws/global/?token={token}")
+        self.assertEqual(await ws.connect(), (False, 4002))
+
+class SendMessageServiceTest(TestCase):
+    """Test per l'unità di lavoro usata da message.send."""
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username="sender", email="sender@test.com", password="testpass123"
+        )
+        self.recipient = User.objects.create_user(
+            username="recipient", email="recipient@test.com", password="testpass123"
+        )
+        self.outsider = User.objects.create_user(
+            username="outsider", email="outsider@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='group', name="Gruppo")
+        ChatParticipant.objects.create(chat=self.chat, user=self.sender, role='admin')
+        ChatParticipant.objects.create(chat=self.chat, user=self.recipient)
+
+    def test_send_message_returns_payload_chat_type_and_recipients(self):
+        from .services.messages import send_message
+
+        sent = send_message(self.chat.id, self.sender.id, "Ciao")
+
+        self.assertEqual(sent.chat_type, "group")
+        self.assertEqual(sent.payload["body"], "Ciao")
+        self.assertEqual(sent.payload["sender_id"], self.sender.id)
+        self.assertEqual(sent.recipient_unread_counts, {self.recipient.id: 1})
+        self.assertTrue(Message.objects.filter(id=sent.payload["id"]).exists())
+
+    def test_send_message_rejects_non_participant(self):
+        from .services.messages import send_message
+
+        self.assertIsNone(send_message(self.chat.id, self.outsider.id, "Ciao"))
+        self.assertFalse(Message.objects.filter(chat=self.chat).exists())
+
+    def test_send_message_is_idempotent_on_client_msg_id(self):
+        from .services.messages import send_message
+
+        client_msg_id = uuid.uuid4()
+        first = send_message(self.chat.id, self.sender.id, "Ciao", client_msg_id)
+        replay = send_message(self.chat.id, self.sender.id, "Ciao", client_msg_id)
+
+        self.assertTrue(first.created)
+        self.assertFalse(replay.created)
+        self.assertEqual(replay.payload["id"], first.payload["id"])
+        self.assertEqual(replay.recipient_unread_counts, {})
+        self.assertEqual(Message.objects.filter(chat=self.chat).count(), 1)
+        self.assertEqual(
+            ChatParticipant.objects.get(chat=self.chat, user=self.recipient).unread_count, 1
+        )
+
+
+class FakeRedis:
+    """Stand-in minimale di redis-py (stile fakeredis) con TTL su orologio controllabile."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.store = {}
+        self.expiry = {}
+        self.calls = []
+
+    def _purge(self, key):
+        deadline = self.expiry.get(key)
+        if deadline is not None and deadline <= self.now:
+            self.store.pop(key, None)
+            self.expiry.pop(key, None)
+
+    def get(self, key):
+        self.calls.append("get")
+        self._purge(key)
+        return self.store.get(key)
+
+    def mget(self, keys):
+        self.calls.append("mget")
+        for key in keys:
+            self._purge(key)
+        return [self.store.get(key) for key in keys]
+
+    def incrby(self, key, amount):
+        self.calls.append("incrby")
+        self._purge(key)
+        self.store[key] = int(self.store.get(key, 0)) + amount
+        return self.store[key]
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def decr(self, key):
+        return self.incrby(key, -1)
+
+    def expire(self, key, seconds):
+        self.calls.append("expire")
+        self._purge(key)
+        if key not in self.store:
+            return False
+        self.expiry[key] = self.now + seconds
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+
+class FakeRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+class PresenceServiceTest(TestCase):
+    """Test per il backend di presenza condiviso (Redis)."""
+
+    def setUp(self):
+        from .services.presence import RedisPresenceBackend
+
+        self.redis = FakeRedis()
+        self.backend = RedisPresenceBackend(self.redis, ttl=60)
+        patcher = patch("chat.services.presence._backend", self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connection_counter_is_shared_and_atomic(self):
+        from .services.presence import is_user_online, mark_user_connected, mark_user_disconnected
+
+        mark_user_connected(1)
+        mark_user_connected(1)
+        mark_user_disconnected(1)
+        self.assertTrue(is_user_online(1))
+
+        mark_user_disconnected(1)
+        self.assertFalse(is_user_online(1))
+
+    def test_presence_expires_without_heartbeat(self):
+        from .services.presence import is_user_online, mark_user_connected, touch_user_presence
+
+        mark_user_connected(1)
+        self.redis.now = 50
+        touch_user_presence(1)
+        self.redis.now = 100
+        self.assertTrue(is_user_online(1))
+
+        # Worker terminato: nessun heartbeat, la chiave scade
+        self.redis.now = 200
+        self.assertFalse(is_user_online(1))
+
+    def test_disconnect_after_expiry_does_not_go_negative(self):
+        from .services.presence import is_user_online, mark_user_connected, mark_user_disconnected
+
+        mark_user_connected(1)
+        self.redis.now = 120
+        mark_user_disconnected(1)
+        mark_user_connected(1)
+        self.assertTrue(is_user_online(1))
+
+    def test_batch_lookup_uses_single_round_trip(self):
+        from .services.presence import is_users_online, mark_user_connected
+
+        mark_user_connected(1)
+        mark_user_connected(3)
+        self.redis.calls.clear()
+
+        self.assertEqual(is_users_online([1, 2, 3]), {1: True, 2: False, 3: True})
+        self.assertEqual(self.redis.calls, ["mget"])
+
+    def test_chat_list_resolves_presence_once_per_page(self):
+        self.user = User.objects.create_user(
+            username="lister", email="lister@test.com", password="testpass123"
+        )
+        members = [
+            User.objects.create_user(
+                username=f"presence{i}", email=f"presence{i}@test.com", password="testpass123"
+            )
+            for i in range(4)
+        ]
+        for index in range(5):
+            chat = Chat.objects.create(chat_type='group', name=f"Gruppo {index}")
+            ChatParticipant.objects.create(chat=chat, user=self.user, role='admin')
+            for member in members:
+                ChatParticipant.objects.create(chat=chat, user=member)
+
+        from .services.presence import mark_user_connected
+
+        mark_user_connected(members[0].id)
+        self.redis.calls.clear()
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get("/api/chats/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(self.redis.calls, ["mget"])
+        online = {
+            p["user_id"]: p["is_online"]
+            for chat in response.data
+            for p in chat["participants_details"]
+        }
+        self.assertTrue(online[members[0].id])
+        self.assertFalse(online[members[1].id])
+
+
+class ChatListQueryCountTest(APITestCase):
+    """Regressione: la lista chat costa un numero fisso di query."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="owner", email="owner@test.com", password="testpass123"
+        )
+        self.others = [
+            User.objects.create_user(
+                username=f"other{i}", email=f"other{i}@test.com", password="testpass123"
+            )
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def _create_chats(self, count):
+        for index in range(count):
+            chat = Chat.objects.create(chat_type='group', name=f"Gruppo {index}")
+            ChatParticipant.objects.create(chat=chat, user=self.user, role='admin')
+            for other in self.others:
+                ChatParticipant.objects.create(chat=chat, user=other)
+            Message.objects.create(chat=chat, sender=self.others[0], body="Ciao")
+
+    def test_list_query_count_does_not_grow_with_chats(self):
+        self._create_chats(3)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/chats/")
+        self.assertEqual(len(response.data), 3)
+
+        self._create_chats(12)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/chats/")
+        self.assertEqual(len(response.data), 15)
+
+        first = response.data[0]
+        self.assertEqual(first["participant_count"], 4)
+        self.assertEqual(first["unread_count"], 1)
+        self.assertEqual(len(first["participants_details"]), 4)
+
+    def test_list_is_sorted_by_activity_with_preview(self):
+        self._create_chats(3)
+        quiet = Chat.objects.create(chat_type='group', name="Silenziosa")
+        ChatParticipant.objects.create(chat=quiet, user=self.user, role='admin')
+        busy = Chat.objects.get(name="Gruppo 0")
+        latest = Message.objects.create(chat=busy, sender=self.others[1], body="Ultimo")
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/chats/")
+
+        self.assertEqual(response.data[0]["id"], str(busy.id))
+        self.assertEqual(response.data[0]["last_message"]["id"], latest.id)
+        self.assertEqual(response.data[0]["last_message"]["body"], "Ultimo")
+        self.assertEqual(response.data[0]["last_message"]["sender_username"], "other1")
+        self.assertEqual(response.data[-1]["id"], str(quiet.id))
+        self.assertIsNone(response.data[-1]["last_message"])
+
+
+class MessageHistoryPaginationTest(APITestCase):
+    """Test per la paginazione a cursore della cronologia messaggi."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.other = User.objects.create_user(
+            username="writer", email="writer@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=self.chat, user=self.user)
+        ChatParticipant.objects.create(chat=self.chat, user=self.other)
+        self.ids = [
+            Message.objects.create(chat=self.chat, sender=self.other, body=f"Messaggio {i}").id
+            for i in range(7)
+        ]
+        self.url = f"/api/chats/{self.chat.id}/messages/"
+        self.client.force_authenticate(user=self.user)
+
+    def test_latest_page_and_before_cursor(self):
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual([m["id"] for m in response.data], self.ids[:3:-1])
+        self.assertEqual(response["X-Has-More"], "true")
+
+        response = self.client.get(self.url, {"limit": 3, "before_id": self.ids[4]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[3], self.ids[2], self.ids[1]])
+        self.assertEqual(response["X-Has-More"], "true")
+
+        response = self.client.get(self.url, {"limit": 3, "before_id": self.ids[1]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[0]])
+        self.assertEqual(response["X-Has-More"], "false")
+
+    @override_settings(CORS_ALLOW_ALL_ORIGINS=True)
+    def test_has_more_header_exposed_to_cross_origin_clients(self):
+        response = self.client.get(self.url, {"limit": 3}, HTTP_ORIGIN="https://app.example.com")
+        self.assertIn("X-Has-More", response["Access-Control-Expose-Headers"])
+
+    def test_after_cursor_returns_following_messages(self):
+        response = self.client.get(self.url, {"limit": 2, "after_id": self.ids[2]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[4], self.ids[3]])
+        self.assertEqual(response["X-Has-More"], "true")
+
+    def test_scrolling_back_does_not_mark_read(self):
+        self.client.get(self.url, {"before_id": self.ids[3]})
+        participant = ChatParticipant.objects.get(chat=self.chat, user=self.user)
+        self.assertEqual(participant.unread_count, 7)
+
+        self.client.get(self.url)
+        participant.refresh_from_db()
+        self.assertEqual(participant.unread_count, 0)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"before_id": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MessageCreateIdempotencyTest(APITestCase):
+    """Test per l'invio REST idempotente tramite client_msg_id."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="testpass123"
+        )
+        self.other = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=self.chat, user=self.user)
+        ChatParticipant.objects.create(chat=self.chat, user=self.other)
+        self.url = f"/api/chats/{self.chat.id}/messages/"
+        self.client.force_authenticate(user=self.user)
+
+    def test_retry_with_same_client_msg_id_returns_existing_message(self):
+        data = {"body": "Ciao", "client_msg_id": str(uuid.uuid4())}
+
+        first = self.client.post(self.url, data, format="json")
+        retry = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(retry.data["client_msg_id"], data["client_msg_id"])
+        self.assertEqual(Message.objects.filter(chat=self.chat).count(), 1)
+        self.assertEqual(
+            ChatParticipant.objects.get(chat=self.chat, user=self.other).unread_count, 1
+        )
+
+    def test_messages_without_client_msg_id_are_always_created(self):
+        self.client.post(self.url, {"body": "Uno"}, format="json")
+        self.client.post(self.url, {"body": "Uno"}, format="json")
+        self.assertEqual(Message.objects.filter(chat=self.chat).count(), 2)
+
+    def test_client_msg_id_cannot_be_changed_on_update(self):
+        first = self.client.post(self.url, {"body": "Uno", "client_msg_id": str(uuid.uuid4())}, format="json")
+        second = self.client.post(self.url, {"body": "Due"}, format="json")
+
+        response = self.client.patch(
+            f"{self.url}{second.data['id']}/",
+            {"body": "Due (modificato)", "client_msg_id": first.data["client_msg_id"]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["body"], "Due (modificato)")
+        self.assertEqual(response.data["client_msg_id"], second.data["client_msg_id"])
+
+
+class GemellaggioSyncTest(TestCase):
+    """Test per la sincronizzazione set-based dei partecipanti dei gemellaggi."""
+
+    def setUp(self):
+        self.clubs = [
+            User.objects.create_user(
+                username=f"club{i}", email=f"club{i}@test.com", password="testpass123",
+                user_type=User.Types.CLUB,
+            )
+            for i in range(2)
+        ]
+        User.objects.bulk_create([
+            User(
+                username=f"socio{c}_{i}", email=f"socio{c}_{i}@test.com", password="!",
+                club=club,
+            )
+            for c, club in enumerate(self.clubs)
+            for i in range(30)
+        ])
+        self.chat = Chat.objects.create(chat_type='gemellaggio', name="Gemellaggio")
+
+    def test_twinning_clubs_uses_constant_queries(self):
+        ChatParticipant.objects.create(chat=self.chat, user=self.clubs[0], role='member')
+
+        # 2 query per l'add sulla M2M + 4 del segnale (lettura, promozione, soci, bulk insert)
+        with self.assertNumQueries(6):
+            self.chat.related_clubs.add(*self.clubs)
+
+        participants = dict(
+            ChatParticipant.objects.filter(chat=self.chat).values_list('user_id', 'role')
+        )
+        self.assertEqual(len(participants), 62)
+        self.assertEqual(participants[self.clubs[0].id], 'admin')
+        self.assertEqual(participants[self.clubs[1].id], 'admin')
+
+    def test_user_save_without_club_change_skips_sync(self):
+        self.chat.related_clubs.add(self.clubs[0])
+        user = User.objects.get(username="socio1_0")
+
+        with self.assertNumQueries(1):
+            user.bio = "Nuova bio"
+            user.save()
+
+        user.club = self.clubs[0]
+        user.save()
+        self.assertTrue(ChatParticipant.objects.filter(chat=self.chat, user=user).exists())
+
+
+class CreateGroupTest(TestCase):
+    """Test per la creazione set-based delle chat di gruppo."""
+
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username="creator", email="creator@test.com", password="testpass123"
+        )
+        self.members = User.objects.bulk_create([
+            User(username=f"membro{i}", email=f"membro{i}@test.com", password="!")
+            for i in range(40)
+        ])
+
+    def test_create_group_query_count_does_not_grow_with_members(self):
+        ids = [user.id for user in self.members] + [self.creator.id, 999999]
+
+        with self.assertNumQueries(5):
+            chat = Chat.create_group("Grande gruppo", self.creator, ids, chat_type='general_group')
+
+        roles = dict(ChatParticipant.objects.filter(chat=chat).values_list('user_id', 'role'))
+        self.assertEqual(len(roles), 41)
+        self.assertEqual(roles[self.creator.id], 'admin')
+        self.assertNotIn(999999, roles)
+
+    def test_gemellaggio_creator_club_is_promoted_to_admin(self):
+        clubs = [
+            User.objects.create_user(
+                username=f"club{i}", email=f"club{i}@test.com", password="testpass123",
+                user_type=User.Types.CLUB,
+            )
+            for i in range(2)
+        ]
+
+        chat = Chat.create_group(
+            "Gemellaggio", clubs[0], chat_type='gemellaggio', club_ids=[club.id for club in clubs]
+        )
+
+        roles = dict(ChatParticipant.objects.filter(chat=chat).values_list('user_id', 'role'))
+        self.assertEqual(roles, {clubs[0].id: 'admin', clubs[1].id: 'admin'})
+
+
+class DirectChatTest(APITestCase):
+    """Test per la chat diretta identificata dalla coppia di utenti (direct_key)."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username="alice", email="alice@test.com", password="testpass123"
+        )
+        self.bob = User.objects.create_user(
+            username="bob", email="bob@test.com", password="testpass123"
+        )
+
+    def test_same_chat_is_returned_regardless_of_order(self):
+        chat = Chat.get_or_create_direct_chat(self.alice, self.bob)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Chat.get_or_create_direct_chat(self.bob, self.alice), chat)
+
+        self.assertEqual(chat.direct_key, f"{self.alice.id}:{self.bob.id}")
+        self.assertEqual(
+            set(chat.chat_participants.values_list('user_id', flat=True)),
+            {self.alice.id, self.bob.id},
+        )
+
+    def test_concurrent_insert_returns_existing_chat(self):
+        chat = Chat.get_or_create_direct_chat(self.alice, self.bob)
+
+        # Simula una richiesta concorrente che non ha visto la chat appena creata
+        with patch.object(Chat.objects, "filter", return_value=Chat.objects.none()):
+            again = Chat.get_or_create_direct_chat(self.alice, self.bob)
+
+        self.assertEqual(again, chat)
+        self.assertEqual(Chat.objects.filter(chat_type='direct').count(), 1)
+
+    def test_direct_endpoint(self):
+        self.client.force_authenticate(user=self.alice)
+
+        first = self.client.post("/api/chats/direct/", {"user_id": self.bob.id}, format="json")
+        second = self.client.post("/api/chats/direct/", {"user_id": self.bob.id}, format="json")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["id"], second.data["id"])
+
+
+class BatchingHelpersTest(TestCase):
+    """Test per la negoziazione e la coalescenza della modalità batch."""
+
+    def test_parse_batch_interval(self):
+        from .consumers import BATCH_MAX_INTERVAL_MS, BATCH_MIN_INTERVAL_MS, parse_batch_interval
+
+        self.assertEqual(parse_batch_interval(b"token=abc&batch=50ms"), 50)
+        self.assertEqual(parse_batch_interval("batch=80"), 80)
+        self.assertEqual(parse_batch_interval("batch=1ms"), BATCH_MIN_INTERVAL_MS)
+        self.assertEqual(parse_batch_interval("batch=60000ms"), BATCH_MAX_INTERVAL_MS)
+        self.assertIsNone(parse_batch_interval("token=abc"))
+        self.assertIsNone(parse_batch_interval("batch=veloce"))
+        self.assertIsNone(parse_batch_interval("batch=0"))
+
+    def test_coalesce_keeps_latest_unread_update_per_chat(self):
+        from .consumers import coalesce_events
+
+        events = [
+            {"type": "new_message", "chat_id": "a", "data": {"id": 1}},
+            {"type": "unread_update", "chat_id": "a", "unread_count": 1},
+            {"type": "unread_update", "chat_id": "b", "unread_count": 4},
+            {"type": "new_message", "chat_id": "a", "data": {"id": 2}},
+            {"type": "unread_update", "chat_id": "a", "unread_count": 2},
+        ]
+
+        self.assertEqual(coalesce_events(events), [events[0], events[2], events[3], events[4]])
+
+
+class JsonCodecTest(TestCase):
+    """Test per la serializzazione dei frame WebSocket."""
+
+    def test_raw_frame_embeds_pre_serialised_payload(self):
+        from .services.json_codec import dumps, loads, raw_frame
+
+        payload = {"id": 7, "body": "Ciao \"mondo\" è già qui", "sender_id": 3}
+        text = raw_frame({"type": "new_message", "chat_id": "abc"}, data=dumps(payload))
+
+        self.assertEqual(loads(text), {"type": "new_message", "chat_id": "abc", "data": payload})
+        self.assertEqual(loads(raw_frame({}, data=dumps(payload))), {"data": payload})
+
+    def test_chat_message_event_is_serialised_once(self):
+        from .services.realtime import chat_message_event, event_message_json
+
+        payload = {"id": 1, "body": "Ciao"}
+        with patch("chat.services.realtime.dumps", wraps=json.dumps) as dumps:
+            event = chat_message_event("abc", payload)
+            for _ in range(3):
+                event_message_json(event)
+
+        self.assertEqual(dumps.call_count, 1)
+        # Eventi nel vecchio formato (payload non serializzato) restano supportati
+        self.assertEqual(json.loads(event_message_json({"message": payload})), payload)
+
+
+class GroupSubscriptionTest(TestCase):
+    """Test per le iscrizioni ai gruppi in parallelo."""
+
+    async def test_group_add_many_runs_concurrently_within_limit(self):
+        import asyncio
+        from .services.realtime import group_add_many, group_discard_many
+
+        class SlowLayer:
+            def __init__(self):
+                self.groups, self.active, self.peak = set(), 0, 0
+
+            async def _call(self, action, group):
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                await asyncio.sleep(0.01)
+                action(group)
+                self.active -= 1
+
+            async def group_add(self, group, channel):
+                await self._call(self.groups.add, group)
+
+            async def group_discard(self, group, channel):
+                await self._call(self.groups.discard, group)
+
+        layer = SlowLayer()
+        groups = [f"chat_{i}" for i in range(30)]
+
+        with override_settings(CHAT_FANOUT_CONCURRENCY=10):
+            await group_add_many(layer, groups, "channel")
+            self.assertEqual(layer.groups, set(groups))
+            self.assertEqual(layer.peak, 10)
+
+            await group_discard_many(layer, groups, "channel")
+            self.assertEqual(layer.groups, set())
+
+
+class ArchiveMessagesTest(APITestCase):
+    """Test per l'archiviazione dei messaggi vecchi e la cronologia che attraversa l'archivio."""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.user = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.other = User.objects.create_user(
+            username="writer", email="writer@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=self.chat, user=self.user)
+        ChatParticipant.objects.create(chat=self.chat, user=self.other)
+        old = timezone.now() - timedelta(days=400)
+        self.ids = [
+            Message.objects.create(
+                chat=self.chat, sender=self.other, body=f"Messaggio {i}",
+                created_at=old if i < 4 else timezone.now(),
+            ).id
+            for i in range(7)
+        ]
+        MessageTranslation.objects.create(
+            message_id=self.ids[0], target_language="en", translated_text="Message 0", provider="fake"
+        )
+        self.url = f"/api/chats/{self.chat.id}/messages/"
+        self.client.force_authenticate(user=self.user)
+
+    def _archive(self, **options):
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("archive_messages", "--older-than-days", "365", stdout=out, **options)
+        return out.getvalue()
+
+    def test_command_moves_old_messages_and_translations(self):
+        from .models import ArchivedMessage
+
+        self.assertIn("4 messaggi archiviati", self._archive(batch_size=3))
+
+        self.assertEqual(list(Message.objects.order_by("id").values_list("id", flat=True)), self.ids[4:])
+        archived = ArchivedMessage.objects.get(id=self.ids[0])
+        self.assertEqual(archived.body, "Messaggio 0")
+        self.assertEqual(archived.translations["en"]["text"], "Message 0")
+        self.assertFalse(MessageTranslation.objects.exists())
+
+    def test_dry_run_and_last_message_are_kept(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.assertIn("4 messaggi", self._archive(dry_run=True))
+        self.assertEqual(Message.objects.count(), 7)
+
+        # L'anteprima inbox di una chat inattiva resta nella tabella calda
+        idle = Chat.objects.create(chat_type='direct')
+        last = Message.objects.create(
+            chat=idle, sender=self.other, body="Ultimo",
+            created_at=timezone.now() - timedelta(days=400),
+        )
+        self._archive()
+        self.assertTrue(Message.objects.filter(id=last.id).exists())
+
+    def test_history_reads_archive_across_boundary(self):
+        self._archive()
+
+        response = self.client.get(self.url, {"limit": 3, "before_id": self.ids[5]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[4], self.ids[3], self.ids[2]])
+        self.assertEqual(response.data[1]["body"], "Messaggio 3")
+        self.assertEqual(response.data[1]["sender_username"], "writer")
+        self.assertEqual(response["X-Has-More"], "true")
+
+        response = self.client.get(self.url, {"limit": 3, "before_id": self.ids[2]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[1], self.ids[0]])
+        self.assertEqual(response["X-Has-More"], "false")
+
+        response = self.client.get(self.url, {"limit": 3, "after_id": self.ids[1]})
+        self.assertEqual([m["id"] for m in response.data], [self.ids[4], self.ids[3], self.ids[2]])
+        self.assertEqual(response["X-Has-More"], "true")
+
+
+class FakeTranslationProvider(BaseTranslationProvider):
+    """Provider locale: traduce anteponendo la lingua e registra ogni richiesta."""
+
+    name = "deepl"
+    max_batch_size = 50
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def is_configured(self):
+        return True
+
+    def translate_many(self, texts, target_language, text_format="text"):
+        self.requests.append(list(texts))
+        return [
+            TranslationResult(text=f"[{target_language}] {text}", provider=self.name, detected_source_language="it")
+            for text in texts
+        ]
+
+
+class BatchTranslationTest(APITestCase):
+    """Test per la traduzione di una finestra di messaggi in un'unica richiesta al provider."""
+
+    def setUp(self):
+        clear_translation_lru()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.other = User.objects.create_user(
+            username="writer", email="writer@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=self.chat, user=self.user)
+        ChatParticipant.objects.create(chat=self.chat, user=self.other)
+        bodies = ["Ciao", "Come stai?", "Ciao", "A domani"]
+        self.messages = [
+            Message.objects.create(chat=self.chat, sender=self.other, body=body) for body in bodies
+        ]
+        self.own = Message.objects.create(chat=self.chat, sender=self.user, body="Mio messaggio")
+        self.url = f"/api/chats/{self.chat.id}/messages/translate/"
+        self.client.force_authenticate(user=self.user)
+        self.provider = FakeTranslationProvider()
+        patcher = patch('chat.services.translation._get_provider_chain', return_value=[self.provider])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_misses_are_sent_in_one_provider_request(self):
+        MessageTranslation.objects.create(
+            message=self.messages[3], target_language="en", translated_text="See you tomorrow", provider="deepl"
+        )
+        ids = [msg.id for msg in self.messages] + [self.own.id]
+
+        response = self.client.post(self.url, {"message_ids": ids, "target_language": "en"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.provider.requests, [["Ciao", "Come stai?"]])
+        self.assertEqual(
+            [(row["message"], row["translated_text"]) for row in response.data],
+            [
+                (self.messages[3].id, "See you tomorrow"),
+                (self.messages[2].id, "[en] Ciao"),
+                (self.messages[1].id, "[en] Come stai?"),
+                (self.messages[0].id, "[en] Ciao"),
+            ],
+        )
+
+        # Seconda richiesta: tutto già salvato, nessuna chiamata al provider
+        response = self.client.post(self.url, {"message_ids": ids, "target_language": "en"}, format="json")
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(self.provider.requests), 1)
+
+    def test_invalid_requests(self):
+        response = self.client.post(self.url, {"message_ids": "1,2", "target_language": "en"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            self.url, {"message_ids": list(range(1, 100)), "target_language": "en"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            self.url, {"message_ids": [self.messages[0].id], "target_language": "ru"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.provider.requests, [])
+
+    def test_providers_send_texts_as_arrays(self):
+        from .services.translation import DeepLTranslationProvider, GoogleTranslateProvider
+
+        deepl, google = DeepLTranslationProvider(), GoogleTranslateProvider()
+        with patch.object(deepl.session, 'post') as post:
+            post.return_value.json.return_value = {
+                "translations": [{"text": "Hi", "detected_source_language": "IT"}, {"text": "Bye"}]
+            }
+            results = deepl.translate_many(["Ciao", "Addio"], "en")
+            self.assertEqual(post.call_args.kwargs["data"]["text"], ["Ciao", "Addio"])
+            self.assertEqual([r.text for r in results], ["Hi", "Bye"])
+            self.assertEqual(results[0].detected_source_language, "it")
+
+        with patch.object(google.session, 'post') as post:
+            post.return_value.json.return_value = {
+                "data": {"translations": [{"translatedText": "Hi &amp; bye"}]}
+            }
+            results = google.translate_many(["Ciao e addio"], "en")
+            self.assertEqual(post.call_args.kwargs["json"]["q"], ["Ciao e addio"])
+            self.assertEqual(results[0].text, "Hi & bye")
+
+
+class TranslationProviderPoolTest(TestCase):
+    """Test per le istanze di provider persistenti e le sessioni HTTP condivise."""
+
+    def tearDown(self):
+        from .services.translation import reset_translation_providers
+
+        reset_translation_providers()
+
+    def test_providers_and_sessions_are_reused_until_settings_change(self):
+        from .services.translation import _get_provider_chain
+
+        with override_settings(DEEPL_API_KEY="key", GOOGLE_TRANSLATE_API_KEY="key"):
+            first = _get_provider_chain()
+            second = _get_provider_chain()
+            self.assertEqual([p.name for p in first], ["deepl", "google"])
+            self.assertIs(first[0], second[0])
+            self.assertIs(first[0].session, second[0].session)
+
+            with override_settings(DEEPL_API_URL="http://127.0.0.1:9/translate"):
+                deepl = _get_provider_chain()[0]
+                self.assertIsNot(deepl, first[0])
+                self.assertEqual(deepl.api_url, "http://127.0.0.1:9/translate")
+
+    @override_settings(TRANSLATION_HTTP_POOL_SIZE=4, TRANSLATION_HTTP_RETRIES=3)
+    def test_session_pool_and_retry_policy(self):
+        from .services.translation import build_http_session
+
+        adapter = build_http_session().get_adapter("https://api-free.deepl.com/v2/translate")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.status, 3)
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertNotIn(429, adapter.max_retries.status_forcelist)
+        self.assertFalse(adapter.max_retries.respect_retry_after_header)
+        self.assertIn("POST", adapter.max_retries.allowed_methods)
+
+    @override_settings(TRANSLATION_PROVIDER_CONCURRENCY=1)
+    def test_sync_translation_does_not_wait_for_busy_provider(self):
+        import time
+        from .services.translation import translate_text
+
+        class BlockingProvider(FakeTranslationProvider):
+            entered = threading.Event()
+            release = threading.Event()
+
+            def translate_many(self, texts, target_language, text_format="text"):
+                if texts == ["lento"]:
+                    self.entered.set()
+                    self.release.wait(5)
+                return super().translate_many(texts, target_language, text_format)
+
+        provider = BlockingProvider()
+        with patch('chat.services.translation._get_provider_chain', return_value=[provider]):
+            worker = threading.Thread(target=translate_text, args=("lento", "en"))
+            worker.start()
+            self.assertTrue(provider.entered.wait(2))
+            try:
+                started = time.monotonic()
+                self.assertEqual(translate_text("veloce", "en").text, "[en] veloce")
+                self.assertLess(time.monotonic() - started, 1)
+            finally:
+                provider.release.set()
+                worker.join()
+
+    def test_rate_limited_provider_fails_fast_and_counts_for_breaker(self):
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from django.core.cache import cache
+        from .services.provider_health import provider_health_snapshot
+        from .services.translation import _get_provider_chain, translate_text
+
+        class RateLimitedHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.send_response(429)
+                self.send_header("Retry-After", "60")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        with override_settings(
+            DEEPL_API_KEY="test",
+            DEEPL_API_URL=f"http://127.0.0.1:{server.server_address[1]}/v2/translate",
+            TRANSLATION_PROVIDER_PRIORITY=["deepl"],
+        ):
+            self.assertEqual(len(_get_provider_chain()), 1)
+            started = time.monotonic()
+            with self.assertRaises(TranslationProviderError):
+                translate_text("Ciao", "en")
+            self.assertLess(time.monotonic() - started, 2)
+
+        self.assertEqual(provider_health_snapshot(["deepl"])["deepl"]["failures"], 1)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    TRANSLATION_JOB_WORKERS=0,
+)
+class TranslationJobTest(APITestCase):
+    """Test per le traduzioni asincrone (mode=async) e la notifica translation.ready."""
+
+    def setUp(self):
+        from asgiref.sync import async_to_sync
+
+        clear_translation_lru()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@test.com", password="testpass123"
+        )
+        self.other = User.objects.create_user(
+            username="writer", email="writer@test.com", password="testpass123"
+        )
+        self.chat = Chat.objects.create(chat_type='direct')
+        ChatParticipant.objects.create(chat=self.chat, user=self.user)
+        ChatParticipant.objects.create(chat=self.chat, user=self.other)
+        self.message = Message.objects.create(chat=self.chat, sender=self.other, body="Ciao mondo")
+        self.url = f"/api/chats/{self.chat.id}/messages/{self.message.id}/translate/"
+        self.client.force_authenticate(user=self.user)
+
+        self.provider = FakeTranslationProvider()
+        patcher = patch('chat.services.translation._get_provider_chain', return_value=[self.provider])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"user_{self.user.id}", self.channel)
+
+    def _receive(self):
+        from asgiref.sync import async_to_sync
+
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def test_async_translation_returns_job_and_pushes_result(self):
+        from .models import TranslationJob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"target_language": "en", "mode": "async"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "pending")
+
+        event = self._receive()
+        self.assertEqual(event["type"], "translation.ready")
+        self.assertEqual(event["job_id"], response.data["job_id"])
+        self.assertEqual(event["status"], "done")
+        self.assertEqual(event["data"]["translated_text"], "[en] Ciao mondo")
+        self.assertEqual(MessageTranslation.objects.get(message=self.message).translated_text, "[en] Ciao mondo")
+
+        job = TranslationJob.objects.get(id=response.data["job_id"])
+        self.assertEqual(job.status, "done")
+        self.assertIsNotNone(job.finished_at)
+
+        detail = self.client.get(f"/api/chats/translation-jobs/{job.id}/")
+        self.assertEqual(detail.data["status"], "done")
+        self.client.force_authenticate(user=self.other)
+        detail = self.client.get(f"/api/chats/translation-jobs/{job.id}/")
+        self.assertEqual(detail.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_existing_translation_is_returned_without_job(self):
+        from .models import TranslationJob
+
+        MessageTranslation.objects.create(
+            message=self.message, target_language="en", translated_text="Hello world", provider="deepl"
+        )
+        response = self.client.post(self.url, {"target_language": "en", "mode": "async"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(TranslationJob.objects.exists())
+
+    def test_failed_job_reports_error(self):
+        from .models import TranslationJob
+        from .services.translation_jobs import run_translation_job
+
+        job = TranslationJob.objects.create(user=self.user, kind="post", object_id=str(uuid.uuid4()), target_language="en")
+        run_translation_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "Contenuto non trovato.")
+        self.assertEqual(self._receive()["status"], "failed")
+        # Un job già eseguito non viene ripreso
+        self.assertIsNone(run_translation_job(job.id))
+
+    def test_stale_check_uses_start_time_not_queue_time(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import TranslationJob
+
+        queued_long_ago = timezone.now() - timedelta(minutes=30)
+        fresh = TranslationJob.objects.create(
+            user=self.user, kind="message", object_id=str(self.message.id), target_language="en",
+            status=TranslationJob.STATUS_RUNNING, started_at=timezone.now(),
+        )
+        stale = TranslationJob.objects.create(
+            user=self.user, kind="message", object_id=str(self.message.id), target_language="en",
+            status=TranslationJob.STATUS_RUNNING, started_at=queued_long_ago,
+        )
+        TranslationJob.objects.filter(id__in=[fresh.id, stale.id]).update(created_at=queued_long_ago)
+
+        call_command("run_translation_jobs", "--stale-minutes", "10", stdout=StringIO())
+
+        fresh.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual(fresh.status, TranslationJob.STATUS_RUNNING)
+        self.assertEqual(stale.status, TranslationJob.STATUS_DONE)
+        self.assertEqual(self.provider.requests, [["Ciao mondo"]])
+
+
+class SegmentTranslationTest(TestCase):
+    """Test per la traduzione dei campi di card e post in circa un round-trip."""
+
+    def setUp(self):
+        clear_translation_lru()
+
+    def test_fields_grouped_by_format_and_memoized(self):
+        from .services.translation import memoize_translation, translate_segments
+
+        memoize_translation("Già tradotto", "en", TranslationResult(text="Already translated", provider="deepl"))
+        provider = FakeTranslationProvider()
+        with patch('chat.services.translation._get_provider_chain', return_value=[provider]):
+            results = translate_segments(
+                [("Titolo", "text"), ("<p>Corpo</p>", "html"), ("Sottotitolo", "text"), ("Già tradotto", "text")],
+                "en",
+            )
+
+        self.assertEqual(
+            [r.text for r in results],
+            ["[en] Titolo", "[en] <p>Corpo</p>", "[en] Sottotitolo", "Already translated"],
+        )
+        self.assertCountEqual(provider.requests, [["Titolo", "Sottotitolo"], ["<p>Corpo</p>"]])
+
+    def test_formats_are_translated_concurrently(self):
+        import time
+        from .services.translation import translate_segments
+
+        class SlowProvider(FakeTranslationProvider):
+            def translate_many(self, texts, target_language, text_format="text"):
+                time.sleep(0.2)
+                return super().translate_many(texts, target_language, text_format)
+
+        with patch('chat.services.translation._get_provider_chain', return_value=[SlowProvider()]):
+            started = time.perf_counter()
+            translate_segments([("Titolo", "text"), ("<p>Corpo</p>", "html")], "en")
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.35)
+
+    def test_provider_error_propagates(self):
+        from .services.translation import translate_segments
+
+        with patch('chat.services.translation._get_provider_chain', return_value=[FakeTranslationProvider()]):
+            with self.assertRaises(TranslationProviderError):
+                translate_segments([("Titolo", "text"), ("", "html")], "en")
+
+
+class FailingTranslationProvider(FakeTranslationProvider):
+    error = TranslationProviderError
+
+    def translate_many(self, texts, target_language, text_format="text"):
+        self.requests.append(list(texts))
+        raise self.error("provider down")
+
+
+class BackupTranslationProvider(FakeTranslationProvider):
+    name = "google"
+
+
+@override_settings(TRANSLATION_BREAKER_FAILURES=2, TRANSLATION_BREAKER_RESET_SECONDS=30, TRANSLATION_BREAKER_SLOW_MS=500)
+class ProviderCircuitBreakerTest(TestCase):
+    """Test per circuit breaker e instradamento dei provider in base allo stato di salute."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _translate(self, *providers):
+        from .services.translation import translate_text
+
+        with patch('chat.services.translation._get_provider_chain', return_value=list(providers)):
+            return translate_text("Ciao", "en")
+
+    def _expire_open_state(self, name):
+        from django.core.cache import cache
+
+        cache.delete(f"translation:breaker:{name}:open")
+
+    def _snapshot(self):
+        from .services.provider_health import provider_health_snapshot
+
+        return provider_health_snapshot(["deepl", "google"])
+
+    def test_breaker_opens_and_skips_failing_provider(self):
+        failing, backup = FailingTranslationProvider(), BackupTranslationProvider()
+        for _ in range(2):
+            self.assertEqual(self._translate(failing, backup).provider, "google")
+
+        result = self._translate(failing, backup)
+
+        self.assertEqual(result.provider, "google")
+        self.assertEqual(len(failing.requests), 2)
+        health = self._snapshot()
+        self.assertEqual(health["deepl"]["state"], "open")
+        self.assertEqual(health["deepl"]["trips"], 1)
+        self.assertEqual(health["deepl"]["short_circuits"], 1)
+        self.assertEqual(health["google"]["fallbacks"], 3)
+
+    def test_all_providers_open_fails_fast(self):
+        failing = FailingTranslationProvider()
+        for _ in range(2):
+            with self.assertRaises(TranslationProviderError):
+                self._translate(failing)
+
+        with self.assertRaisesMessage(TranslationProviderError, "temporaneamente non disponibile"):
+            self._translate(failing)
+        self.assertEqual(len(failing.requests), 2)
+
+    def test_half_open_probe_success_closes_breaker(self):
+        failing, backup = FailingTranslationProvider(), BackupTranslationProvider()
+        for _ in range(2):
+            self._translate(failing, backup)
+        self._expire_open_state("deepl")
+        self.assertEqual(self._snapshot()["deepl"]["state"], "half_open")
+
+        result = self._translate(FakeTranslationProvider(), backup)
+
+        self.assertEqual(result.provider, "deepl")
+        health = self._snapshot()["deepl"]
+        self.assertEqual((health["state"], health["consecutive_failures"]), ("closed", 0))
+
+    def test_half_open_allows_single_probe_and_reopens_on_failure(self):
+        from .services.provider_health import acquire_probe
+
+        failing, backup = FailingTranslationProvider(), BackupTranslationProvider()
+        for _ in range(2):
+            self._translate(failing, backup)
+        self._expire_open_state("deepl")
+        # Un altro worker ha già preso la richiesta di prova
+        self.assertTrue(acquire_probe("deepl"))
+        self.assertEqual(self._translate(failing, backup).provider, "google")
+        self.assertEqual(len(failing.requests), 2)
+
+        from django.core.cache import cache
+
+        cache.delete("translation:breaker:deepl:probe")
+        self._translate(failing, backup)
+
+        health = self._snapshot()["deepl"]
+        self.assertEqual(len(failing.requests), 3)
+        self.assertEqual((health["state"], health["trips"]), ("open", 2))
+
+    def test_rejected_request_falls_back_without_tripping(self):
+        from .services.translation import TranslationRequestRejected
+
+        class RejectingProvider(FailingTranslationProvider):
+            error = TranslationRequestRejected
+
+        rejecting, backup = RejectingProvider(), BackupTranslationProvider()
+        for _ in range(3):
+            self.assertEqual(self._translate(rejecting, backup).provider, "google")
+
+        self.assertEqual(len(rejecting.requests), 3)
+        health = self._snapshot()["deepl"]
+        self.assertEqual(
+            (health["state"], health["consecutive_failures"], health["failures"], health["trips"]),
+            ("closed", 0, 0, 0),
+        )
+
+    def test_client_errors_map_to_rejected(self):
+        import requests
+        from .services.translation import TranslationRequestRejected, _request_error
+
+        def http_error(status_code):
+            response = requests.Response()
+            response.status_code = status_code
+            return requests.HTTPError(response=response)
+
+        self.assertIsInstance(_request_error("x", http_error(400)), TranslationRequestRejected)
+        self.assertNotIsInstance(_request_error("x", http_error(429)), TranslationRequestRejected)
+        self.assertNotIsInstance(_request_error("x", http_error(503)), TranslationRequestRejected)
+        self.assertNotIsInstance(_request_error("x", requests.ConnectionError()), TranslationRequestRejected)
+
+    def test_slow_provider_is_tried_last(self):
+        from .services.provider_health import record_success
+
+        record_success("deepl", 2.0)
+        primary, backup = FakeTranslationProvider(), BackupTranslationProvider()
+
+        self.assertEqual(self._translate(primary, backup).provider, "google")
+        self.assertEqual(primary.requests, [])
+
+    @override_settings(TRANSLATION_BREAKER_RESET_SECONDS=1)
+    def test_slow_provider_is_promoted_again_after_latency_expires(self):
+        import time
+        from .services.provider_health import record_success
+
+        record_success("deepl", 2.0)
+        primary, backup = FakeTranslationProvider(), BackupTranslationProvider()
+        self.assertEqual(self._translate(primary, backup).provider, "google")
+
+        time.sleep(1.1)
+
+        self.assertEqual(self._translate(primary, backup).provider, "deepl")
+        self.assertLess(self._snapshot()["deepl"]["latency_ms"], 500)
+        self.assertEqual(self._translate(primary, backup).provider, "deepl")
+
+    def test_cache_outage_fails_open(self):
+        import redis
+
+        class UnreachableCache:
+            def __getattr__(self, name):
+                def fail(*args, **kwargs):
+                    raise redis.exceptions.ConnectionError("Connection refused")
+                return fail
+
+        failing, backup = FailingTranslationProvider(), BackupTranslationProvider()
+        with patch('chat.services.provider_health._cache', return_value=UnreachableCache()):
+            for _ in range(3):
+                self.assertEqual(self._translate(failing, backup).provider, "google")
+            self.assertEqual(self._translate(FakeTranslationProvider(), backup).provider, "deepl")
+
+        # Nessun provider saltato senza cache: ogni richiesta ha provato DeepL
+        self.assertEqual(len(failing.requests), 3)
+
+    def test_health_command_reports_and_resets(self):
+        from django.core.management import call_command
+
+        failing, backup = FailingTranslationProvider(), BackupTranslationProvider()
+        for _ in range(2):
+            self._translate(failing, backup)
+
+        with override_settings(TRANSLATION_PROVIDER_PRIORITY=["deepl", "google"]):
+            out = StringIO()
+            call_command("translation_provider_health", stdout=out)
+            self.assertIn("deepl: open", out.getvalue())
+            call_command("translation_provider_health", "--reset", stdout=StringIO())
+
+        self.assertEqual(self._snapshot()["deepl"]["state"], "closed")
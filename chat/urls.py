@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ChatViewSet, MessageViewSet
+from .views import ChatViewSet, MessageViewSet, TranslationJobViewSet
 
 chat_list = ChatViewSet.as_view({
     "get": "list",
@@ -44,6 +44,12 @@ message_detail = MessageViewSet.as_view({
 message_translate = MessageViewSet.as_view({
     "post": "translate",
 })
+message_translate_batch = MessageViewSet.as_view({
+    "post": "translate_batch",
+})
+translation_job_detail = TranslationJobViewSet.as_view({
+    "get": "retrieve",
+})
 
 urlpatterns = [
     # Chats (il prefisso api/chats/ è già in backend/urls.py)
@@ -67,8 +73,13 @@ urlpatterns = [
 
     # Messages dentro una chat
     path("<uuid:chat_pk>/messages/", message_list, name="message-list"),
+    # traduzione di più messaggi in una richiesta
+    path("<uuid:chat_pk>/messages/translate/", message_translate_batch, name="message-translate-batch"),
     # dettaglio messaggio
     path("<uuid:chat_pk>/messages/<int:pk>/", message_detail, name="message-detail"),
     # traduzione messaggio
     path("<uuid:chat_pk>/messages/<int:pk>/translate/", message_translate, name="message-translate"),
+
+    # stato di una traduzione asincrona (messaggi, post e card)
+    path("translation-jobs/<uuid:pk>/", translation_job_detail, name="translation-job-detail"),
 ]
\ No newline at end of file
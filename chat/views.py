@@ -1,12 +1,12 @@
 from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 
-from .models import Chat, ChatParticipant, Message, MessageTranslation
+from .models import Chat, ChatParticipant, Message, MessageTranslation, TranslationJob
 from .serializers import (
     ChatSerializer,
     CreateGroupChatSerializer,
@@ -16,10 +16,30 @@ from .serializers import (
 from .services.translation import (
     TranslationProviderError,
     TranslationServiceNotConfigured,
+    get_memoized_translation,
+    memoize_translation,
     normalize_language_code,
     supported_languages,
     translate_text,
 )
+from .services.messages import (
+    HISTORY_PAGE_SIZE,
+    create_message_once,
+    get_message_page,
+    parse_history_cursor,
+)
+from .services.message_translations import (
+    TRANSLATION_BATCH_MAX_MESSAGES,
+    parse_message_ids,
+    translate_messages,
+)
+from .services.realtime import MEMBERSHIP_ADDED, MEMBERSHIP_REMOVED, notify_membership_changed
+from .services.translation_jobs import (
+    async_mode_requested,
+    enqueue_translation_job,
+    translation_job_payload,
+)
+from .services.unread import mark_chat_read
 
 class ChatViewSet(viewsets.ModelViewSet):
     serializer_class = ChatSerializer
@@ -28,7 +48,34 @@ class ChatViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Restituisce tutte le chat in cui l'utente è partecipante."""
         user = self.request.user
-        return Chat.objects.filter(participants=user).distinct()
+        if self.action not in ("list", "retrieve"):
+            return Chat.objects.filter(participants=user).distinct()
+
+        # Lista e dettaglio: conteggi come annotazioni SQL, anteprima dell'ultimo messaggio
+        # e partecipanti precaricati, così il numero di query non dipende dal numero di chat.
+        # La inbox è ordinata per attività recente.
+        participant_count = (
+            ChatParticipant.objects.filter(chat=OuterRef("pk"))
+            .order_by()
+            .values("chat")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        return (
+            Chat.objects.filter(chat_participants__user=user)
+            .annotate(
+                participant_count=Subquery(participant_count),
+                unread_count=F("chat_participants__unread_count"),
+            )
+            .select_related("last_message__sender")
+            .order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+            .prefetch_related(
+                Prefetch(
+                    "chat_participants",
+                    queryset=ChatParticipant.objects.select_related("user"),
+                )
+            )
+        )
 
     @action(detail=False, methods=["post"])
     def direct(self, request):
@@ -72,15 +119,11 @@ class ChatViewSet(viewsets.ModelViewSet):
                 name=serializer.validated_data['name'],
                 creator=request.user,
                 participant_ids=serializer.validated_data.get('participant_ids', []),
+                description=serializer.validated_data.get('description') or None,
                 chat_type=chat_type,
                 club_ids=club_ids
             )
             
-            # Imposta la descrizione se fornita
-            if serializer.validated_data.get('description'):
-                chat.description = serializer.validated_data['description']
-                chat.save()
-            
             return Response(
                 ChatSerializer(chat, context={'request': request}).data,
                 status=status.HTTP_201_CREATED
@@ -129,6 +172,7 @@ class ChatViewSet(viewsets.ModelViewSet):
             )
         
         ChatParticipant.objects.create(chat=chat, user=user_to_add, role='member')
+        notify_membership_changed(chat.id, chat.chat_type, [user_to_add.id], MEMBERSHIP_ADDED)
         return Response(ChatSerializer(chat, context={'request': request}).data)
 
     @action(detail=True, methods=["post"])
@@ -175,6 +219,9 @@ class ChatViewSet(viewsets.ModelViewSet):
             )
         
         participant_to_remove.delete()
+        notify_membership_changed(
+            chat.id, chat.chat_type, [participant_to_remove.user_id], MEMBERSHIP_REMOVED
+        )
         return Response(ChatSerializer(chat, context={'request': request}).data)
 
     @action(detail=True, methods=["post"])
@@ -202,6 +249,7 @@ class ChatViewSet(viewsets.ModelViewSet):
             )
         
         participant.delete()
+        notify_membership_changed(chat.id, chat.chat_type, [request.user.id], MEMBERSHIP_REMOVED)
         
         # Se era l'ultimo partecipante, elimina la chat
         if chat.chat_participants.count() == 0:
@@ -217,9 +265,7 @@ class ChatViewSet(viewsets.ModelViewSet):
         if not chat.participants.filter(pk=request.user.pk).exists():
             raise PermissionDenied("Non fai parte di questa chat.")
 
-        ChatParticipant.objects.filter(chat=chat, user=request.user).update(
-            last_read_at=timezone.now()
-        )
+        mark_chat_read(chat.id, request.user.id)
         return Response({"status": "ok"})
 
 
@@ -236,18 +282,61 @@ class MessageViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         chat = self.get_chat()
-        return Message.objects.filter(chat=chat).select_related("sender").order_by("-created_at")
+        return Message.objects.filter(chat=chat).select_related("sender").order_by("-id")
 
-    def perform_create(self, serializer):
+    def create(self, request, *args, **kwargs):
+        """
+        Invio idempotente: se il client ripete la richiesta con lo stesso client_msg_id
+        viene restituito il messaggio già salvato (200) invece di crearne un altro (201).
+        """
         chat = self.get_chat()
-        serializer.save(sender=self.request.user, chat=chat)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # I segnali post_save aggiornano non letti e anteprima nella stessa transazione
+        with transaction.atomic():
+            message, created = create_message_once(
+                chat.id, request.user.id, **serializer.validated_data
+            )
+
+        data = self.get_serializer(message).data
+        if not created:
+            return Response(data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
 
     def list(self, request, *args, **kwargs):
+        """
+        Cronologia con paginazione a cursore: ?before_id=<id> per i messaggi più vecchi,
+        ?after_id=<id> per quelli più recenti, ?limit=<n> (max 100). L'header X-Has-More
+        indica se esistono altri messaggi nella direzione richiesta.
+        """
         chat = self.get_chat()
-        queryset = self.filter_queryset(self.get_queryset())[:50]
-        serializer = self.get_serializer(queryset, many=True)
-        ChatParticipant.objects.filter(chat=chat, user=request.user).update(last_read_at=timezone.now())
-        return Response(serializer.data)
+        try:
+            before_id = parse_history_cursor(request.query_params.get("before_id"))
+            after_id = parse_history_cursor(request.query_params.get("after_id"))
+            limit = int(request.query_params.get("limit", HISTORY_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "before_id, after_id e limit devono essere numeri interi."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        page = get_message_page(
+            chat.id,
+            before_id=before_id,
+            after_id=after_id,
+            limit=limit,
+            queryset=self.filter_queryset(self.get_queryset()),
+        )
+        serializer = self.get_serializer(page.messages, many=True)
+
+        # Scorrere la cronologia verso il passato non segna la chat come letta
+        if before_id is None:
+            mark_chat_read(chat.id, request.user.id)
+
+        response = Response(serializer.data)
+        response["X-Has-More"] = "true" if page.has_more else "false"
+        return response
 
     def translate(self, request, *args, **kwargs):
         message = self.get_object()
@@ -282,42 +371,29 @@ class MessageViewSet(viewsets.ModelViewSet):
             serializer = MessageTranslationSerializer(existing)
             return Response(serializer.data)
 
-        shared_translation = (
-            MessageTranslation.objects.filter(
-                target_language=normalized_language,
-                message__body=message.body,
-            )
-            .exclude(message=message)
-            .order_by("created_at")
-            .first()
-        )
-        if shared_translation:
-            with transaction.atomic():
-                translation = MessageTranslation.objects.create(
-                    message=message,
-                    target_language=normalized_language,
-                    translated_text=shared_translation.translated_text,
-                    provider=shared_translation.provider,
-                    detected_source_language=shared_translation.detected_source_language,
-                )
-            serializer = MessageTranslationSerializer(translation)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
         if not message.body.strip():
             return Response(
                 {"detail": "Il messaggio è vuoto, impossibile tradurre."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        try:
-            result = translate_text(message.body, normalized_language)
-        except TranslationServiceNotConfigured:
-            return Response(
-                {"detail": "Nessun provider di traduzione configurato."},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE,
-            )
-        except TranslationProviderError as exc:
-            return Response({"detail": str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
+        if async_mode_requested(request):
+            job = enqueue_translation_job(request.user.id, "message", message.id, normalized_language)
+            return Response(translation_job_payload(job), status=status.HTTP_202_ACCEPTED)
+
+        # Memoria condivisa: stesso testo già tradotto altrove (messaggio, post o card)
+        result = get_memoized_translation(message.body, normalized_language)
+        if result is None:
+            try:
+                result = translate_text(message.body, normalized_language)
+            except TranslationServiceNotConfigured:
+                return Response(
+                    {"detail": "Nessun provider di traduzione configurato."},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+            except TranslationProviderError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
+            memoize_translation(message.body, normalized_language, result)
 
         with transaction.atomic():
             translation, _created = MessageTranslation.objects.get_or_create(
@@ -333,3 +409,53 @@ class MessageViewSet(viewsets.ModelViewSet):
         serializer = MessageTranslationSerializer(translation)
         http_status = status.HTTP_201_CREATED if _created else status.HTTP_200_OK
         return Response(serializer.data, status=http_status)
+
+    def translate_batch(self, request, *args, **kwargs):
+        """
+        Traduce una finestra di messaggi: { message_ids: [..], target_language }.
+        Al massimo TRANSLATION_BATCH_MAX_MESSAGES id; i propri messaggi sono ignorati.
+        """
+        chat = self.get_chat()
+        target_language = request.data.get("target_language")
+        if not target_language:
+            return Response(
+                {"detail": "target_language è obbligatorio."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if normalize_language_code(target_language) not in supported_languages():
+            return Response(
+                {"detail": "Lingua di destinazione non supportata."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            message_ids = parse_message_ids(request.data.get("message_ids"))
+        except (TypeError, ValueError):
+            return Response(
+                {
+                    "detail": f"message_ids deve essere una lista di al massimo "
+                    f"{TRANSLATION_BATCH_MAX_MESSAGES} interi."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            translations = translate_messages(chat.id, request.user.id, message_ids, target_language)
+        except TranslationServiceNotConfigured:
+            return Response(
+                {"detail": "Nessun provider di traduzione configurato."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        except TranslationProviderError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response(MessageTranslationSerializer(translations, many=True).data)
+
+
+class TranslationJobViewSet(viewsets.ViewSet):
+    """Stato di una traduzione asincrona (per i client che non hanno ricevuto translation_ready)."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def retrieve(self, request, pk=None):
+        job = get_object_or_404(TranslationJob, pk=pk, user=request.user)
+        return Response(translation_job_payload(job))
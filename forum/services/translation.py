@@ -0,0 +1,55 @@
+from typing import Tuple
+
+from django.db import transaction
+
+from chat.services.translation import TranslationProviderError, normalize_language_code, translate_segments
+
+from ..models import Post, PostTranslation
+from ..serializers import PostTranslationSerializer
+from ..utils import sanitize_rich_text
+
+
+def create_post_translation(post: Post, target_language: str) -> Tuple[PostTranslation, bool]:
+    """
+    Traduce titolo e corpo del post (HTML se presente) e salva la traduzione.
+    Solleva TranslationServiceNotConfigured / TranslationProviderError come translate_text.
+    """
+    body_has_html = bool(post.content_html and post.content_html.strip())
+    body_source = post.content_html if body_has_html else post.description
+
+    # Un'unica richiesta se il corpo è testo semplice, due in parallelo se è HTML
+    title_result, description_result = translate_segments(
+        [
+            (post.title, "text"),
+            (body_source, "html" if body_has_html else "text"),
+        ],
+        target_language,
+    )
+
+    safe_translated_body = (
+        sanitize_rich_text(description_result.text) if body_has_html else description_result.text
+    )
+
+    with transaction.atomic():
+        return PostTranslation.objects.update_or_create(
+            post=post,
+            target_language=target_language,
+            defaults={
+                "translated_title": title_result.text,
+                "translated_description": safe_translated_body,
+                "provider": title_result.provider,
+                "detected_source_language": title_result.detected_source_language,
+            },
+        )
+
+
+def run_post_translation_job(job) -> dict:
+    """Gestore dei TranslationJob di tipo "post" (vedi chat/services/translation_jobs.py)."""
+    post = Post.objects.get(pk=job.object_id)
+    language = normalize_language_code(job.target_language)
+    translation = PostTranslation.objects.filter(post=post, target_language=language).first()
+    if translation is None:
+        if not post.title.strip() and not post.description.strip():
+            raise TranslationProviderError("Il post è vuoto, impossibile tradurre.")
+        translation, _created = create_post_translation(post, language)
+    return PostTranslationSerializer(translation).data
@@ -2,7 +2,6 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from django.db import transaction
 from django.db.models import Count, Prefetch
 from django.utils import timezone
 from .models import Post, Comment, PostTranslation
@@ -14,14 +13,18 @@ from .serializers import (
     CommentCreateSerializer,
     PostTranslationSerializer,
 )
-from .utils import sanitize_rich_text
 from chat.services.translation import (
     TranslationProviderError,
     TranslationServiceNotConfigured,
     normalize_language_code,
     supported_languages,
-    translate_text,
 )
+from chat.services.translation_jobs import (
+    async_mode_requested,
+    enqueue_translation_job,
+    translation_job_payload,
+)
+from .services.translation import create_post_translation
 
 
 class PostPagination(PageNumberPagination):
@@ -137,16 +140,12 @@ class PostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        body_has_html = bool(post.content_html and post.content_html.strip())
-        body_source = post.content_html if body_has_html else post.description
+        if async_mode_requested(request):
+            job = enqueue_translation_job(request.user.id, "post", post.pk, normalized_language)
+            return Response(translation_job_payload(job), status=status.HTTP_202_ACCEPTED)
 
         try:
-            title_result = translate_text(post.title, normalized_language)
-            description_result = translate_text(
-                body_source,
-                normalized_language,
-                text_format="html" if body_has_html else "text",
-            )
+            translation, _created = create_post_translation(post, normalized_language)
         except TranslationServiceNotConfigured:
             return Response(
                 {"detail": "Nessun provider di traduzione configurato."},
@@ -155,22 +154,6 @@ class PostViewSet(viewsets.ModelViewSet):
         except TranslationProviderError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
 
-        safe_translated_body = (
-            sanitize_rich_text(description_result.text) if body_has_html else description_result.text
-        )
-
-        with transaction.atomic():
-            translation, _created = PostTranslation.objects.update_or_create(
-                post=post,
-                target_language=normalized_language,
-                defaults={
-                    "translated_title": title_result.text,
-                    "translated_description": safe_translated_body,
-                    "provider": title_result.provider,
-                    "detected_source_language": title_result.detected_source_language,
-                },
-            )
-
         serializer = PostTranslationSerializer(translation)
         http_status = status.HTTP_201_CREATED if _created else status.HTTP_200_OK
         return Response(serializer.data, status=http_status)
@@ -0,0 +1,97 @@
+"""Helper condivisi dagli script di benchmark (scripts/bench_*.py)."""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+# Add the project root to sys.path so 'backend' module is found
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+
+
+class LatencyChannelLayer(InMemoryChannelLayer):
+    """InMemoryChannelLayer che simula il round-trip verso Redis su group_add/group_send."""
+
+    def __init__(self, latency_ms=0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency_ms / 1000
+
+    async def group_add(self, group, channel):
+        await asyncio.sleep(self.latency)
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        await asyncio.sleep(self.latency)
+        await super().group_send(group, message)
+
+
+def use_channel_layer(latency_ms=0.0, capacity=10000):
+    """Configura il channel layer in memoria (con latenza simulata) per il benchmark."""
+    from channels.layers import channel_layers
+
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "bench_common.LatencyChannelLayer",
+            "CONFIG": {"latency_ms": latency_ms, "capacity": capacity},
+        }
+    }
+    channel_layers.backends.clear()
+
+
+@contextmanager
+def test_database():
+    """Crea un database di test usa-e-getta, come fa il test runner di Django."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def create_users(count, prefix="bench", **extra):
+    """Crea utenti in blocco (password non utilizzabile, nessun hashing)."""
+    from users.models import User
+
+    User.objects.bulk_create(
+        [
+            User(username=f"{prefix}{i}", email=f"{prefix}{i}@bench.local", password="!", **extra)
+            for i in range(count)
+        ]
+    )
+    return list(User.objects.filter(username__startswith=prefix).order_by("id"))
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(label, samples):
+    """Stampa media, p50 e p95 (in ms) di una lista di durate in secondi."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{label:<40} n={len(samples):<5} "
+        f"mean={statistics.mean(samples) * 1000:8.2f}ms "
+        f"p50={statistics.median(samples) * 1000:8.2f}ms "
+        f"p95={p95 * 1000:8.2f}ms"
+    )
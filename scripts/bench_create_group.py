@@ -0,0 +1,68 @@
+"""
+Benchmark: creazione di un general_group da 200 membri,
+inserimento per-utente (exists + get + create) vs Chat.create_group set-based.
+
+    python scripts/bench_create_group.py --members 200 --repeat 20
+"""
+
+import argparse
+
+from bench_common import Timer, create_users, report, test_database
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from chat.models import Chat, ChatParticipant
+from users.models import User
+
+
+def legacy_create_group(name, creator, participant_ids):
+    """Implementazione precedente: tre query per partecipante, fuori transazione."""
+    chat = Chat.objects.create(chat_type="general_group", name=name, created_by=creator)
+    if not ChatParticipant.objects.filter(chat=chat, user=creator).exists():
+        ChatParticipant.objects.create(chat=chat, user=creator, role="admin")
+    for user_id in participant_ids:
+        if user_id != creator.id:
+            if not ChatParticipant.objects.filter(chat=chat, user_id=user_id).exists():
+                try:
+                    user = User.objects.get(pk=user_id)
+                    ChatParticipant.objects.create(chat=chat, user=user, role="member")
+                except User.DoesNotExist:
+                    pass
+    return chat
+
+
+def run(label, create, repeat):
+    samples = []
+    for _ in range(repeat):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries, Timer() as timer:
+            create()
+        samples.append(timer.elapsed)
+    report(f"{label} ({len(queries.captured_queries)} query)", samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark creazione chat di gruppo.")
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with test_database():
+        creator = create_users(1, prefix="creator")[0]
+        member_ids = [user.id for user in create_users(args.members, prefix="member")]
+
+        run(
+            "per-utente",
+            lambda: legacy_create_group("Gruppo", creator, member_ids),
+            args.repeat,
+        )
+        run(
+            "set-based",
+            lambda: Chat.create_group("Gruppo", creator, member_ids, chat_type="general_group"),
+            args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
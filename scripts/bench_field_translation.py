@@ -0,0 +1,78 @@
+"""
+Benchmark: traduzione dei campi di una card (titolo, sottotitolo, contenuto HTML)
+con un provider simulato che impiega --latency-ms per richiesta.
+
+- sequenziale:    tre translate_text in fila (comportamento precedente)
+- segmenti:       translate_segments, titolo e sottotitolo in un'unica richiesta,
+                  contenuto HTML in parallelo
+
+    python scripts/bench_field_translation.py --latency-ms 150 --repeat 10
+"""
+
+import argparse
+import time
+from unittest.mock import patch
+
+from bench_common import Timer, report, test_database
+
+from chat.services.translation import (
+    BaseTranslationProvider,
+    TranslationResult,
+    clear_translation_lru,
+    translate_segments,
+    translate_text_memoized,
+)
+
+
+class SlowProvider(BaseTranslationProvider):
+    name = "deepl"
+    max_batch_size = 50
+    latency = 0.0
+
+    def is_configured(self):
+        return True
+
+    def translate_many(self, texts, target_language, text_format="text"):
+        time.sleep(self.latency)
+        return [TranslationResult(text=text.upper(), provider=self.name) for text in texts]
+
+
+def card_fields(i):
+    return [
+        (f"Evento distrettuale {i}", "text"),
+        (f"Sottotitolo {i}", "text"),
+        (f"<p>Contenuto della card {i}</p>", "html"),
+    ]
+
+
+def sequential(fields):
+    return [translate_text_memoized(text, "en", text_format=text_format) for text, text_format in fields]
+
+
+def segmented(fields):
+    return translate_segments(fields, "en")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark traduzione dei campi di una card.")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    SlowProvider.latency = args.latency_ms / 1000
+    with test_database(), patch("chat.services.translation._get_provider_chain", return_value=[SlowProvider()]):
+        print(f"provider simulato: {args.latency_ms:g}ms per richiesta")
+        for offset, (label, translate) in enumerate((("sequenziale", sequential), ("segmenti", segmented))):
+            clear_translation_lru()
+            samples = []
+            for i in range(args.repeat):
+                # Testi nuovi a ogni giro: nessun riuso dalla memoria di traduzione
+                fields = card_fields(offset * args.repeat + i)
+                with Timer() as timer:
+                    translate(fields)
+                samples.append(timer.elapsed)
+            report(label, samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: costo di serializzazione di un chat.message per fan-out
+verso N socket.
+
+- stdlib per socket:      json.dumps del frame completo per ogni destinatario
+                          (comportamento predefinito di AsyncJsonWebsocketConsumer)
+- codec per socket:       services.json_codec.dumps per ogni destinatario
+                          (orjson se installato)
+- pre-serializzato:       payload serializzato una volta in chat_message_event,
+                          frame composto con raw_frame per ogni destinatario
+
+    python scripts/bench_json_encoding.py --fanout 10 100 1000 --body-chars 200 --repeat 200
+"""
+
+import argparse
+import json
+from datetime import datetime, timezone
+
+from bench_common import Timer, report
+
+from chat.services.json_codec import JSON_BACKEND, dumps, raw_frame
+from chat.services.realtime import chat_message_event, event_message_json
+
+CHAT_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def sample_payload(body_chars):
+    text = "Ciao a tutti, ci vediamo alla riunione del club giovedì alle 20:30! "
+    return {
+        "id": 123456,
+        "sender_id": 42,
+        "body": (text * (body_chars // len(text) + 1))[:body_chars],
+        "created_at": datetime(2025, 11, 2, 10, 37, tzinfo=timezone.utc).isoformat(),
+        "client_msg_id": "c3d4e5f6-a7b8-4c7d-8e1f-2a3b4c5d6e7f",
+    }
+
+
+def stdlib_per_socket(payload, fanout):
+    for _ in range(fanout):
+        json.dumps({"type": "new_message", "chat_id": CHAT_ID, "data": payload})
+
+
+def codec_per_socket(payload, fanout):
+    for _ in range(fanout):
+        dumps({"type": "new_message", "chat_id": CHAT_ID, "data": payload})
+
+
+def pre_serialised(payload, fanout):
+    event = chat_message_event(CHAT_ID, payload)
+    for _ in range(fanout):
+        raw_frame({"type": "new_message", "chat_id": event["chat_id"]}, data=event_message_json(event))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark serializzazione frame WebSocket.")
+    parser.add_argument("--fanout", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--body-chars", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = sample_payload(args.body_chars)
+    print(f"backend JSON: {JSON_BACKEND}, corpo messaggio {args.body_chars} caratteri")
+    for fanout in args.fanout:
+        for label, func in (
+            ("stdlib per socket", stdlib_per_socket),
+            (f"{JSON_BACKEND} per socket", codec_per_socket),
+            (f"pre-serializzato ({JSON_BACKEND})", pre_serialised),
+        ):
+            samples = []
+            for _ in range(args.repeat):
+                with Timer() as timer:
+                    func(payload, fanout)
+                samples.append(timer.elapsed)
+            report(f"fan-out {fanout:<5} {label}", samples)
+
+
+if __name__ == "__main__":
+    main()
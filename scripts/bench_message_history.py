@@ -0,0 +1,72 @@
+"""
+Benchmark: cronologia messaggi su una chat con 1M di messaggi,
+paginazione OFFSET profonda vs paginazione keyset (before_id) sull'indice (chat, id).
+
+    python scripts/bench_message_history.py --messages 1000000 --page-size 50
+"""
+
+import argparse
+
+from bench_common import Timer, create_users, report, test_database
+
+from chat.models import Chat, Message
+from chat.services.messages import get_message_page
+
+BATCH_SIZE = 10000
+
+
+def build_chat(total):
+    sender = create_users(1, prefix="writer")[0]
+    chat = Chat.objects.create(chat_type="general_group", name="Chat benchmark")
+    for start in range(0, total, BATCH_SIZE):
+        Message.objects.bulk_create(
+            [
+                Message(chat=chat, sender=sender, body=f"Messaggio {i}")
+                for i in range(start, min(start + BATCH_SIZE, total))
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return chat
+
+
+def offset_page(chat, offset, page_size):
+    return list(Message.objects.filter(chat=chat).order_by("-id")[offset:offset + page_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark paginazione cronologia messaggi.")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    depths = [d for d in (0, 1_000, 100_000, 500_000, args.messages - args.page_size) if d < args.messages]
+
+    with test_database():
+        print(f"Creazione di {args.messages} messaggi...")
+        with Timer() as timer:
+            chat = build_chat(args.messages)
+        print(f"  completata in {timer.elapsed:.1f}s")
+
+        ids_desc = list(Message.objects.filter(chat=chat).order_by("-id").values_list("id", flat=True))
+
+        for depth in depths:
+            offset_samples, keyset_samples = [], []
+            # Il cursore è l'id dell'ultimo messaggio della pagina precedente
+            before_id = ids_desc[depth - 1] if depth else None
+            for _ in range(args.repeat):
+                with Timer() as timer:
+                    offset_rows = offset_page(chat, depth, args.page_size)
+                offset_samples.append(timer.elapsed)
+
+                with Timer() as timer:
+                    page = get_message_page(chat.id, before_id=before_id, limit=args.page_size)
+                keyset_samples.append(timer.elapsed)
+
+            assert [m.id for m in offset_rows] == [m.id for m in page.messages]
+            report(f"OFFSET  profondità {depth}", offset_samples)
+            report(f"keyset  profondità {depth}", keyset_samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: latenza per chiamata verso un provider di traduzione, connessione
+nuova per ogni richiesta (requests.post e provider ricreati, prima) vs istanze
+persistenti con requests.Session in pool (dopo).
+
+Il provider è un server HTTP locale che risponde come DeepL. --handshake-ms
+simula il costo di apertura di una connessione (TCP + TLS verso un'API remota),
+pagato una volta per connessione; --latency-ms il tempo di elaborazione per richiesta.
+
+    python scripts/bench_translation_http.py --calls 200 --handshake-ms 30 --latency-ms 5
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from bench_common import Timer, report
+
+import requests
+from django.test.utils import override_settings
+
+from chat.services.translation import (
+    DeepLTranslationProvider,
+    _get_provider_chain,
+    reset_translation_providers,
+)
+
+
+class StubDeepLHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Come i server reali: senza TCP_NODELAY header e corpo su keep-alive subiscono il delayed ACK
+    disable_nagle_algorithm = True
+    handshake = 0.0
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubDeepLHandler.connections += 1
+        time.sleep(self.handshake)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        texts = parse_qs(self.rfile.read(length).decode()).get("text", [])
+        time.sleep(self.latency)
+        body = json.dumps({
+            "translations": [{"text": text.upper(), "detected_source_language": "IT"} for text in texts]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def legacy_translate(text):
+    """Implementazione precedente: provider ricreato e requests.post (nuova connessione) per chiamata."""
+    provider = DeepLTranslationProvider()
+    payload = {"auth_key": provider.api_key, "target_lang": "EN", "text": text}
+    response = requests.post(provider.api_url, data=payload, timeout=provider.timeout)
+    response.raise_for_status()
+    return response.json()["translations"][0]["text"]
+
+
+def pooled_translate(text):
+    return _get_provider_chain()[0].translate(text, "en").text
+
+
+def run(label, translate, calls):
+    StubDeepLHandler.connections = 0
+    samples = []
+    for i in range(calls):
+        with Timer() as timer:
+            translate(f"Ciao mondo {i}")
+        samples.append(timer.elapsed)
+    report(f"{label} ({StubDeepLHandler.connections} connessioni)", samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark riuso connessioni verso i provider di traduzione.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=30)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    StubDeepLHandler.handshake = args.handshake_ms / 1000
+    StubDeepLHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDeepLHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v2/translate"
+
+    print(f"stub DeepL: handshake {args.handshake_ms:g}ms, elaborazione {args.latency_ms:g}ms")
+    with override_settings(
+        DEEPL_API_KEY="bench",
+        DEEPL_API_URL=url,
+        TRANSLATION_PROVIDER_PRIORITY=["deepl"],
+        TRANSLATION_SUPPORTED_LANGUAGES=["it", "en"],
+    ):
+        run("connessione per chiamata", legacy_translate, args.calls)
+        run("sessione in pool", pooled_translate, args.calls)
+        reset_translation_providers()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: latenza send-to-ack di message.send su ws/global/ in un gemellaggio
+da 500 membri, fan-out unread.update sequenziale (prima) vs batch (dopo).
+
+    python scripts/bench_unread_fanout.py --members 500 --messages 20 --latency-ms 0.5
+"""
+
+import argparse
+import asyncio
+
+from bench_common import Timer, create_users, report, test_database, use_channel_layer
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from chat.consumers import GlobalChatConsumer
+from chat.models import Chat, ChatParticipant, Message
+from chat.services.unread import get_unread_count
+
+
+class SequentialFanOutConsumer(GlobalChatConsumer):
+    """Riproduce il fan-out precedente: una query e una group_send per destinatario."""
+
+    async def _handle_send_message(self, content):
+        chat_id = content["chat_id"]
+        msg = await database_sync_to_async(Message.objects.create)(
+            chat_id=chat_id, sender_id=self.user.id, body=content["body"]
+        )
+        await self.channel_layer.group_send(
+            f"chat_{chat_id}",
+            {
+                "type": "chat.message",
+                "message": {"id": msg.id, "body": msg.body},
+                "chat_id": str(chat_id),
+            },
+        )
+        participant_ids = await database_sync_to_async(
+            lambda: list(
+                ChatParticipant.objects.filter(chat_id=chat_id)
+                .exclude(user_id=self.user.id)
+                .values_list("user_id", flat=True)
+            )
+        )()
+        for uid in participant_ids:
+            unread = await database_sync_to_async(get_unread_count)(chat_id, uid)
+            chat_type = await database_sync_to_async(
+                lambda: Chat.objects.get(id=chat_id).chat_type
+            )()
+            await self.channel_layer.group_send(
+                f"user_{uid}",
+                {
+                    "type": "unread.update",
+                    "chat_id": str(chat_id),
+                    "chat_type": chat_type,
+                    "unread_count": unread,
+                },
+            )
+
+
+def build_gemellaggio(members):
+    users = create_users(members, prefix="member")
+    chat = Chat.objects.create(chat_type="gemellaggio", name="Gemellaggio benchmark")
+    ChatParticipant.objects.bulk_create(
+        [ChatParticipant(chat=chat, user=user, role="member") for user in users]
+    )
+    return chat, users[0]
+
+
+async def measure(consumer_class, chat, sender, messages):
+    communicator = WebsocketCommunicator(consumer_class.as_asgi(), "/ws/global/")
+    communicator.scope["user"] = sender
+    await communicator.connect()
+    await communicator.receive_json_from(timeout=30)  # init
+
+    samples = []
+    for i in range(messages):
+        with Timer() as timer:
+            await communicator.send_json_to(
+                {"type": "message.send", "chat_id": str(chat.id), "body": f"Messaggio {i}"}
+            )
+            await communicator.receive_json_from(timeout=60)
+        samples.append(timer.elapsed)
+
+    await communicator.disconnect()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fan-out unread.update.")
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Round-trip simulato del channel layer.")
+    args = parser.parse_args()
+
+    use_channel_layer(latency_ms=args.latency_ms)
+    with test_database():
+        chat, sender = build_gemellaggio(args.members)
+        before = asyncio.run(measure(SequentialFanOutConsumer, chat, sender, args.messages))
+        after = asyncio.run(measure(GlobalChatConsumer, chat, sender, args.messages))
+
+    print(f"gemellaggio con {args.members} membri, latenza layer {args.latency_ms}ms")
+    report("prima (sequenziale, query per membro)", before)
+    report("dopo (query unica, fan-out parallelo)", after)
+
+
+if __name__ == "__main__":
+    main()
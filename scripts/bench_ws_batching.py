@@ -0,0 +1,139 @@
+"""
+Benchmark: consegna di una raffica di messaggi in un general_group con N client
+connessi a ws/global/, frame singoli (prima) vs modalità batch ?batch=50ms (dopo).
+I messaggi sono pubblicati sul channel layer al ritmo indicato (0 = raffica),
+come farebbero altri worker; ogni messaggio genera un chat.message e un
+unread.update per client.
+Conta frame e byte inviati e il tempo necessario perché tutti i client
+ricevano tutti i messaggi.
+
+    python scripts/bench_ws_batching.py --clients 50 --messages 200 --rate 100 --batch-ms 50
+
+Client, channel layer e consumer girano nello stesso event loop: con molti client
+il loop è saturo e pochi eventi cadono nello stesso tick, quindi il confronto
+significativo è sul numero di frame inviati.
+"""
+
+import argparse
+import asyncio
+
+from bench_common import Timer, create_users, test_database, use_channel_layer
+
+from channels.testing import WebsocketCommunicator
+
+from chat.consumers import GlobalChatConsumer
+from chat.models import Chat, ChatParticipant
+from chat.services.realtime import send_unread_updates
+
+
+class CountingConsumer(GlobalChatConsumer):
+    """Conta frame e byte inviati, per tutte le istanze."""
+
+    frames = 0
+    sent_bytes = 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None:
+            CountingConsumer.frames += 1
+            CountingConsumer.sent_bytes += len(text_data)
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    @classmethod
+    def reset(cls):
+        cls.frames = 0
+        cls.sent_bytes = 0
+
+
+def build_group(clients):
+    users = create_users(clients, prefix="client")
+    chat = Chat.objects.create(chat_type="general_group", name="Gruppo benchmark")
+    ChatParticipant.objects.bulk_create(
+        [ChatParticipant(chat=chat, user=user, role="member") for user in users]
+    )
+    return chat, users
+
+
+async def connect(user, query=""):
+    communicator = WebsocketCommunicator(CountingConsumer.as_asgi(), f"/ws/global/{query}")
+    communicator.scope["user"] = user
+    connected, _ = await communicator.connect(timeout=30)
+    assert connected
+    await communicator.receive_json_from(timeout=30)  # init
+    return communicator
+
+
+async def drain(communicator, messages):
+    """Riceve frame finché non sono arrivati tutti i new_message attesi."""
+    received = 0
+    while received < messages:
+        frame = await communicator.receive_json_from(timeout=60)
+        events = frame["events"] if frame["type"] == "batch" else [frame]
+        received += sum(1 for event in events if event["type"] == "new_message")
+
+
+async def publish(chat, users, messages, rate):
+    """Pubblica i messaggi e i relativi unread.update, come il fan-out di message.send."""
+    from channels.layers import get_channel_layer
+
+    channel_layer = get_channel_layer()
+    for i in range(messages):
+        await channel_layer.group_send(
+            f"chat_{chat.id}",
+            {
+                "type": "chat.message",
+                "chat_id": str(chat.id),
+                "message": {"id": i, "sender_id": users[0].id, "body": f"Messaggio {i}"},
+            },
+        )
+        await send_unread_updates(
+            channel_layer, chat.id, chat.chat_type, {user.id: i + 1 for user in users}
+        )
+        if rate:
+            await asyncio.sleep(1 / rate)
+
+
+async def measure(chat, users, messages, rate, query):
+    sockets = await asyncio.gather(*(connect(user, query) for user in users))
+    CountingConsumer.reset()
+
+    with Timer() as timer:
+        receivers = asyncio.gather(*(drain(ws, messages) for ws in sockets))
+        await publish(chat, users, messages, rate)
+        await receivers
+
+    result = (timer.elapsed, CountingConsumer.frames, CountingConsumer.sent_bytes)
+    await asyncio.gather(*(ws.disconnect() for ws in sockets))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark modalità batch WebSocket.")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=100, help="Messaggi pubblicati al secondo (0 = raffica).")
+    parser.add_argument("--batch-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    use_channel_layer(latency_ms=0, capacity=100000)
+    with test_database():
+        chat, users = build_group(args.clients)
+        runs = [
+            ("frame singoli", ""),
+            (f"batch {args.batch_ms}ms", f"?batch={args.batch_ms}ms"),
+        ]
+        print(
+            f"general_group con {args.clients} client, "
+            f"{args.messages} messaggi a {args.rate:g} msg/s"
+        )
+        for label, query in runs:
+            elapsed, frames, sent_bytes = asyncio.run(
+                measure(chat, users, args.messages, args.rate, query)
+            )
+            print(
+                f"{label:<20} consegna={elapsed * 1000:9.1f}ms "
+                f"frame={frames:<7} byte={sent_bytes}"
+            )
+
+
+if __name__ == "__main__":
+    main()
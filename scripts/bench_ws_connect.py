@@ -0,0 +1,85 @@
+"""
+Benchmark: latenza di connessione a ws/global/ per un utente iscritto a N chat,
+group_add sequenziali (prima) vs group_add in parallelo (dopo), con round-trip
+simulato del channel layer.
+
+    python scripts/bench_ws_connect.py --chats 10 100 500 --latency-ms 0.5 --repeat 10
+"""
+
+import argparse
+import asyncio
+
+from bench_common import Timer, create_users, report, test_database, use_channel_layer
+
+from channels.testing import WebsocketCommunicator
+
+from chat.consumers import GlobalChatConsumer
+from chat.models import Chat, ChatParticipant
+
+
+class SequentialJoinConsumer(GlobalChatConsumer):
+    """Riproduce la connect precedente: una group_add attesa per ogni chat."""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.user_group = f"user_{self.user.id}"
+        self.chat_groups = set()
+        self.configure_batching()
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        self.memberships = await self._get_user_memberships()
+        for chat_id in self.memberships:
+            group_name = f"chat_{chat_id}"
+            self.chat_groups.add(group_name)
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.accept()
+        await self.register_presence(self.user.id)
+        unread_counts = await self._get_all_unread_counts()
+        await self.send_json({"type": "init", "data": {"unread_counts": unread_counts}})
+
+
+def build_memberships(user, chats):
+    """Iscrive l'utente a `chats` chat di gruppo (aggiungendo quelle mancanti)."""
+    missing = chats - ChatParticipant.objects.filter(user=user).count()
+    created = Chat.objects.bulk_create(
+        [Chat(chat_type="group", name=f"Gruppo {i}") for i in range(missing)]
+    )
+    ChatParticipant.objects.bulk_create(
+        [ChatParticipant(chat=chat, user=user, role="member") for chat in created]
+    )
+
+
+async def measure(consumer_class, user, repeat):
+    samples = []
+    for _ in range(repeat):
+        communicator = WebsocketCommunicator(consumer_class.as_asgi(), "/ws/global/")
+        communicator.scope["user"] = user
+        with Timer() as timer:
+            connected, _ = await communicator.connect(timeout=60)
+            await communicator.receive_json_from(timeout=60)  # init
+        assert connected
+        samples.append(timer.elapsed)
+        await communicator.disconnect()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latenza di connessione ws/global/.")
+    parser.add_argument("--chats", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Round-trip simulato del channel layer.")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    use_channel_layer(latency_ms=args.latency_ms)
+    with test_database():
+        user = create_users(1, prefix="club")[0]
+        print(f"latenza layer {args.latency_ms}ms")
+        for chats in sorted(args.chats):
+            build_memberships(user, chats)
+            before = asyncio.run(measure(SequentialJoinConsumer, user, args.repeat))
+            after = asyncio.run(measure(GlobalChatConsumer, user, args.repeat))
+            report(f"{chats:>4} chat  group_add sequenziali", before)
+            report(f"{chats:>4} chat  group_add in parallelo", after)
+
+
+if __name__ == "__main__":
+    main()
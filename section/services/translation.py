@@ -0,0 +1,52 @@
+from typing import Tuple
+
+from django.db import transaction
+
+from chat.services.translation import TranslationProviderError, normalize_language_code, translate_segments
+from forum.utils import sanitize_rich_text
+
+from ..models import Card, CardTranslation
+from ..serializers import CardTranslationSerializer
+
+
+def create_card_translation(card: Card, target_language: str) -> Tuple[CardTranslation, bool]:
+    """
+    Traduce titolo, sottotitolo e contenuto HTML della card e salva la traduzione.
+    Solleva TranslationServiceNotConfigured / TranslationProviderError come translate_text.
+    """
+    # Titolo e sottotitolo in un'unica richiesta, contenuto HTML in parallelo
+    title_result, subtitle_result, content_result = translate_segments(
+        [
+            (card.title or '', 'text'),
+            (card.subtitle or '', 'text'),
+            (card.content or '', 'html'),
+        ],
+        target_language,
+    )
+
+    safe_content = sanitize_rich_text(content_result.text) if content_result.text else ''
+
+    with transaction.atomic():
+        return CardTranslation.objects.update_or_create(
+            card=card,
+            target_language=target_language,
+            defaults={
+                'translated_title': title_result.text,
+                'translated_subtitle': subtitle_result.text,
+                'translated_content': safe_content,
+                'provider': title_result.provider,
+                'detected_source_language': title_result.detected_source_language,
+            }
+        )
+
+
+def run_card_translation_job(job) -> dict:
+    """Gestore dei TranslationJob di tipo "card" (vedi chat/services/translation_jobs.py)."""
+    card = Card.objects.get(slug=job.object_id)
+    language = normalize_language_code(job.target_language)
+    translation = CardTranslation.objects.filter(card=card, target_language=language).first()
+    if translation is None:
+        if not (card.title or card.subtitle or card.content):
+            raise TranslationProviderError('La card è vuota, impossibile tradurre.')
+        translation, _created = create_card_translation(card, language)
+    return CardTranslationSerializer(translation).data
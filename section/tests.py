@@ -1,9 +1,13 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from .models import Card, SavedCard
+from chat.services.translation import BaseTranslationProvider, TranslationResult, clear_translation_lru
+
+from .models import Card, CardTranslation, SavedCard
 
 
 class ToggleSaveCardTests(APITestCase):
@@ -61,3 +65,56 @@ class ToggleSaveCardTests(APITestCase):
 		self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 		self.assertEqual(response.data['error'], 'Salvataggio non consentito per questa card')
 		self.assertFalse(SavedCard.objects.filter(user=self.user, card=card).exists())
+
+
+class RecordingProvider(BaseTranslationProvider):
+	name = 'deepl'
+	max_batch_size = 50
+
+	def __init__(self):
+		super().__init__()
+		self.requests = []
+
+	def is_configured(self):
+		return True
+
+	def translate_many(self, texts, target_language, text_format='text'):
+		self.requests.append((text_format, list(texts)))
+		return [TranslationResult(text=text.upper(), provider=self.name) for text in texts]
+
+
+class TranslateCardTests(APITestCase):
+	def setUp(self):
+		clear_translation_lru()
+		self.user = get_user_model().objects.create_user(
+			username='translator',
+			email='translator@example.com',
+			password='strong-password-123',
+		)
+		self.card = Card.objects.create(
+			section='calendario-delle-radici',
+			tab='main',
+			title='Evento distrettuale',
+			subtitle='Sottotitolo',
+			content='<p>Contenuto</p>',
+			tags=[],
+			infoElementValues=[],
+			is_published=True,
+			author=self.user,
+		)
+
+	def test_fields_are_sent_as_one_request_per_format(self):
+		provider = RecordingProvider()
+		url = reverse('translate-card', kwargs={'slug': self.card.slug})
+		with patch('chat.services.translation._get_provider_chain', return_value=[provider]):
+			response = self.client.post(url, {'target_language': 'en'}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertCountEqual(
+			provider.requests,
+			[('text', ['Evento distrettuale', 'Sottotitolo']), ('html', ['<p>Contenuto</p>'])],
+		)
+		translation = CardTranslation.objects.get(card=self.card, target_language='en')
+		self.assertEqual(translation.translated_title, 'EVENTO DISTRETTUALE')
+		self.assertEqual(translation.translated_subtitle, 'SOTTOTITOLO')
+		self.assertEqual(translation.translated_content, '<p>CONTENUTO</p>')
@@ -16,15 +16,18 @@ import json
 from datetime import datetime
 import traceback
 from django.core.exceptions import ValidationError
-from django.db import transaction
-from forum.utils import sanitize_rich_text
 from chat.services.translation import (
     TranslationProviderError,
     TranslationServiceNotConfigured,
     normalize_language_code,
     supported_languages,
-    translate_text,
 )
+from chat.services.translation_jobs import (
+    async_mode_requested,
+    enqueue_translation_job,
+    translation_job_payload,
+)
+from .services.translation import create_card_translation
 
 
 def validate_card_fields(section, tab, title, subtitle, content, cover_image, tags, 
@@ -478,14 +481,18 @@ def translate_card(request, slug):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    if async_mode_requested(request):
+        # Il risultato arriva sul gruppo user_{id}: serve un utente autenticato
+        if not request.user.is_authenticated:
+            return Response(
+                {'detail': 'Autenticazione richiesta per la traduzione asincrona.'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        job = enqueue_translation_job(request.user.id, 'card', card.slug, normalized_language)
+        return Response(translation_job_payload(job), status=status.HTTP_202_ACCEPTED)
+
     try:
-        title_result = translate_text(card.title or '', normalized_language)
-        subtitle_result = translate_text(card.subtitle or '', normalized_language)
-        content_result = translate_text(
-            card.content or '',
-            normalized_language,
-            text_format='html'
-        )
+        translation, created = create_card_translation(card, normalized_language)
     except TranslationServiceNotConfigured:
         return Response(
             {'detail': 'Nessun provider di traduzione configurato.'},
@@ -494,21 +501,6 @@ def translate_card(request, slug):
     except TranslationProviderError as exc:
         return Response({'detail': str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
 
-    safe_content = sanitize_rich_text(content_result.text) if content_result.text else ''
-
-    with transaction.atomic():
-        translation, created = CardTranslation.objects.update_or_create(
-            card=card,
-            target_language=normalized_language,
-            defaults={
-                'translated_title': title_result.text,
-                'translated_subtitle': subtitle_result.text,
-                'translated_content': safe_content,
-                'provider': title_result.provider,
-                'detected_source_language': title_result.detected_source_language,
-            }
-        )
-
     serializer = CardTranslationSerializer(translation)
     http_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
     return Response(serializer.data, status=http_status)
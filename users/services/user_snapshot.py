@@ -0,0 +1,69 @@
+"""
+Snapshot leggero dell'utente per l'autenticazione dei WebSocket.
+
+Alla connessione il middleware JWT ha bisogno solo di pochi campi dell'utente:
+li conserviamo in cache per USER_SNAPSHOT_CACHE_TTL secondi, così una raffica
+di riconnessioni (es. dopo il riavvio di daphne) non colpisce il database.
+In produzione la cache è Redis (CACHE_BACKEND): condivisa tra i worker e
+mantenuta al riavvio. Viene invalidata al salvataggio o alla cancellazione
+dell'utente (users/signals.py); gli update() in blocco non emettono segnali e
+restano visibili al più dopo il TTL.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULT_USER_SNAPSHOT_CACHE_TTL = 30
+
+# Campi caricati nello snapshot; gli altri restano differiti e vengono letti solo se usati
+SNAPSHOT_FIELDS = (
+    "id",
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "user_type",
+    "club_id",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+
+def _snapshot_key(user_id) -> str:
+    return f"users:snapshot:{user_id}"
+
+
+def _snapshot_field_names(model):
+    """SNAPSHOT_FIELDS nell'ordine dei campi del modello, come richiesto da Model.from_db."""
+    return [field.attname for field in model._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS]
+
+
+def _snapshot_ttl() -> int:
+    return getattr(settings, "USER_SNAPSHOT_CACHE_TTL", DEFAULT_USER_SNAPSHOT_CACHE_TTL)
+
+
+def get_user_snapshot(user_id):
+    """
+    Restituisce l'utente con i soli SNAPSHOT_FIELDS caricati (letti dalla cache
+    se presenti), oppure None se l'utente non esiste.
+    """
+    User = get_user_model()
+    field_names = _snapshot_field_names(User)
+    key = _snapshot_key(user_id)
+
+    snapshot = cache.get(key)
+    if snapshot is None or not set(field_names) <= snapshot.keys():
+        snapshot = User.objects.filter(pk=user_id).values(*field_names).first()
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, timeout=_snapshot_ttl())
+
+    # from_db marca come differiti i campi non caricati: save() aggiorna solo quelli presenti
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [snapshot[name] for name in field_names])
+
+
+def invalidate_user_snapshot(user_id) -> None:
+    cache.delete(_snapshot_key(user_id))
@@ -0,0 +1,14 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .services.user_snapshot import invalidate_user_snapshot
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot_on_change(sender, instance, **kwargs):
+    """Any save (including deactivation) or delete drops the cached WebSocket auth snapshot."""
+    invalidate_user_snapshot(instance.pk)
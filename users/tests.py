@@ -152,3 +152,51 @@ class SkillsSearchFiltersTests(TestCase):
         response = self.client.get('/api/users/skills-filter-options/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('Architect', response.data['professions'])
+
+
+class UserSnapshotTests(TestCase):
+    """Snapshot utente in cache usato dall'autenticazione dei WebSocket."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='snapshot',
+            email='snapshot@example.com',
+            password='testpassword',
+            bio='Bio originale'
+        )
+
+    def test_snapshot_is_cached_and_invalidated_on_save(self):
+        from .services.user_snapshot import get_user_snapshot
+
+        with self.assertNumQueries(1):
+            get_user_snapshot(self.user.id)
+        with self.assertNumQueries(0):
+            snapshot = get_user_snapshot(self.user.id)
+        self.assertEqual(snapshot.username, 'snapshot')
+        self.assertTrue(snapshot.is_active)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            self.assertFalse(get_user_snapshot(self.user.id).is_active)
+
+    def test_saving_snapshot_does_not_overwrite_unloaded_fields(self):
+        from .services.user_snapshot import get_user_snapshot
+
+        snapshot = get_user_snapshot(self.user.id)
+        snapshot.first_name = 'Nuovo'
+        snapshot.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Nuovo')
+        self.assertEqual(self.user.bio, 'Bio originale')
+        self.assertTrue(self.user.check_password('testpassword'))
+
+    def test_missing_user(self):
+        from .services.user_snapshot import get_user_snapshot
+
+        self.assertIsNone(get_user_snapshot(999999))